@@ -9,17 +9,103 @@ This is a discord bot for the roasted server. It uses the discord library and in
 
 # ------------------------------------------------------------imports------------------------------------------------------------
 
-import boto3
+import argparse
+import asyncio
+import atexit
+import collections
+from contextlib import contextmanager
 import csv
-import discord
 import datetime
-from discord.ext.commands import Bot
-from dotenv import load_dotenv
+import gzip
+import hashlib
+import json
 import logging
-from multiprocessing import Process
+from logging.handlers import QueueHandler
+import mmap
 import os
+import queue
+import random
+import re
+import signal
 import sys
-from timeloop import Timeloop
+import threading
+import time
+import traceback
+import tracemalloc
+
+# ------------------------------------------------------------startup profiling------------------------------------------------------------
+
+# Run the bot with --profile-startup (or BOT_PROFILE_STARTUP=1) to print the time and memory spent by each import and initialization
+# phase instead of connecting to discord. With --startup-budget SECONDS (or BOT_STARTUP_BUDGET) it exits with status 1 when the total
+# time is over the budget, so deploys can check the restart time. Memory is measured with tracemalloc, which makes the phases slower
+# The options are only read when the bot is run as a script, a process that imports it keeps its own command line
+PROFILE_STARTUP = os.getenv('BOT_PROFILE_STARTUP') == '1'
+startup_arguments = None
+
+if __name__ == "__main__":
+    startup_argument_parser = argparse.ArgumentParser(add_help=False, allow_abbrev=False)
+    startup_argument_parser.add_argument('--profile-startup', action='store_true')
+    startup_argument_parser.add_argument('--startup-budget', type=float, metavar='SECONDS')
+    startup_arguments = startup_argument_parser.parse_known_args()[0]
+    PROFILE_STARTUP = PROFILE_STARTUP or startup_arguments.profile_startup
+
+class StartupProfiler():
+    def __init__(self, enabled):
+        self.enabled = enabled
+        # (phase name, seconds, bytes allocated, peak bytes)
+        self.phases = []
+        if enabled:
+            tracemalloc.start()
+
+    @contextmanager
+    def phase(self, name):
+        if not self.enabled:
+            yield
+            return
+
+        # tracemalloc.reset_peak() was added in Python 3.9
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        memory_before, peak_before = tracemalloc.get_traced_memory()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            memory_after, peak = tracemalloc.get_traced_memory()
+            # Without reset_peak the peak is the highest since tracemalloc started, a phase that did not raise it reports the memory it kept
+            phase_peak = peak - memory_before if peak > peak_before else max(memory_after - memory_before, 0)
+            self.phases.append((name, seconds, memory_after - memory_before, phase_peak))
+
+    # Prints the phases and returns True if the total time is within the budget (or there is no budget)
+    def report(self, budget=None):
+        total = sum(seconds for name, seconds, allocated, peak in self.phases)
+        print(f'{"phase":<32} {"seconds":>8} {"memory MB":>10} {"peak MB":>8}')
+        for name, seconds, allocated, peak in self.phases:
+            print(f'{name:<32} {seconds:>8.3f} {allocated / 2**20:>10.2f} {peak / 2**20:>8.2f}')
+        print(f'{"total":<32} {total:>8.3f} {tracemalloc.get_traced_memory()[0] / 2**20:>10.2f}')
+
+        if budget is not None and total > budget:
+            print(f'Startup took {total:.3f} seconds, over the budget of {budget:.3f} seconds')
+            return False
+        return True
+
+# Returns the startup budget in seconds from --startup-budget or BOT_STARTUP_BUDGET, or None if there is no budget
+def startup_budget():
+    if startup_arguments is not None and startup_arguments.startup_budget is not None:
+        return startup_arguments.startup_budget
+    budget = os.getenv('BOT_STARTUP_BUDGET')
+    return float(budget) if budget else None
+
+startup_profiler = StartupProfiler(PROFILE_STARTUP)
+
+with startup_profiler.phase('import discord'):
+    import discord
+    from discord.ext import commands
+    from discord.ext.commands import Bot
+
+with startup_profiler.phase('import dotenv'):
+    from dotenv import load_dotenv
 
 # Sets up where the files will be
 ABS_PATH = os.path.abspath(__file__)
@@ -32,42 +118,203 @@ sys.path.append(current_dir)
 # Then it opens the module from the snowApp directory
 # Pylint is throwing an Unable to import 'snowApp' error because it does not know where to look for modules. Pylint does not execute the code so it does not recognize sys.path.append
 # Running the code still works despite the error that pylint is throwing
-from snowapp import snow_report# pylint: disable=import-error
+with startup_profiler.phase('import snow_report'):
+    from snowapp import snow_report# pylint: disable=import-error
 
 os.chdir(D_NAME)
 
 DESCRIPTION = "This is a discord bot for the roasted server."
 
+# Maximum number of resorts sent by the !nearby command for a radius search
+NEARBY_MAX_RESULTS = 25
+
 # ------------------------------------------------------------logger------------------------------------------------------------
 
-# Sets up the logging that writes the logs to a file called discord.log instead of outputting it to the console
+# Log records are put on a queue by the bot and written to discord.log as JSON lines by a background thread
+# The event loop only puts the record on the queue, the message is formatted and written to disk by the writer thread
+LOG_BATCH_SIZE = 256
+LOG_FLUSH_INTERVAL = 1.0
+
+# Level and sampling rate of the records logged by each handler, read from BOT_LOG_EVENTS
+# e.g. BOT_LOG_EVENTS="on_message=INFO,check_temp_now=DEBUG:0.25" only keeps INFO records of on_message and a quarter of those of check_temp_now
+# Handlers that are not listed log everything, the parser counts are only complete if nothing is filtered
+def parse_log_event_controls(value):
+    controls = {}
+    for control in filter(None, (part.strip() for part in value.split(','))):
+        event_handler, setting = control.split('=', 1)
+        level, _, rate = setting.partition(':')
+        controls[event_handler.strip()] = (logging.getLevelName(level.strip().upper()), float(rate) if rate else 1.0)
+    return controls
+
+# Bot log messages start with the handler they belong to, "async def <handler>: ...", the name may be passed as the first argument
+HANDLER_TOKEN = re.compile(r'async (?:def )?(%s|\w+):')
+
+# Returns the handler of a record, it is worked out from the message format once and saved on the record
+# Records that do not start with a handler token belong to the function that logged them
+def record_handler(record):
+    handler_name = getattr(record, 'handler', None)
+    if handler_name is None:
+        match = HANDLER_TOKEN.match(str(record.msg))
+        if match is None:
+            handler_name = record.funcName
+        elif match.group(1) != '%s':
+            handler_name = match.group(1)
+        elif isinstance(record.args, tuple) and record.args:
+            handler_name = str(record.args[0])
+        else:
+            handler_name = record.funcName
+        record.handler = handler_name
+    return handler_name
+
+# Drops the records below the level of their handler and keeps a random sample of the rest
+class EventFilter(logging.Filter):
+    def __init__(self, controls):
+        super().__init__()
+        self.controls = controls
+
+    def filter(self, record):
+        control = self.controls.get(record_handler(record))
+        if control is None:
+            return True
+        level, rate = control
+        return record.levelno >= level and (rate >= 1.0 or random.random() < rate)
+
+# QueueHandler formats the message before putting the record on the queue, this one puts the record as it is
+# The queue never leaves the process so the arguments and exc_info can be formatted later by the writer thread
+class LazyQueueHandler(QueueHandler):
+    def prepare(self, record):
+        return record
+
+# Background thread that takes the records off the queue and appends them to the log file in batches, one JSON object per line:
+#   {"time": "2021-02-19 17:00:00,123", "level": "DEBUG", "logger": "__main__", "handler": "on_message", "message": "..."}
+class JsonLinesWriter():
+    def __init__(self, path, log_queue, mode='w'):
+        self.file = open(path, mode, encoding='utf-8')
+        self.queue = log_queue
+        self.formatter = logging.Formatter()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name='JsonLinesWriter', daemon=True)
+        self.thread.start()
+
+    # Waits for the records on the queue to be written, records logged in the meantime may be written too
+    def sync(self):
+        if self.thread is None or not self.thread.is_alive():
+            return
+        written = threading.Event()
+        self.queue.put(written)
+        written.wait()
+
+    # Puts a sentinel on the queue and waits for the records before it to be written
+    def stop(self):
+        if self.thread is not None and self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+        self.thread = None
+        self.flush()
+
+    def format(self, record):
+        entry = {
+            "time": self.formatter.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "handler": record_handler(record),
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatter.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+    def write(self, records):
+        lines = []
+        for record in records:
+            try:
+                lines.append(self.format(record) + '\n')
+            except Exception:
+                # A record that cannot be formatted is reported without stopping the writer
+                lines.append(json.dumps({"time": self.formatter.formatTime(record), "level": "ERROR", "logger": record.name, "handler": record_handler(record), "message": f'Could not format log record {record.msg!r}'}) + '\n')
+        with self.lock:
+            self.file.write(''.join(lines))
+
+    def flush(self):
+        with self.lock:
+            self.file.flush()
+
+    def run(self):
+        while True:
+            try:
+                record = self.queue.get(timeout=LOG_FLUSH_INTERVAL)
+            except queue.Empty:
+                continue
+
+            batch = []
+            synced = []
+            while record is not None:
+                if isinstance(record, threading.Event):
+                    synced.append(record)
+                else:
+                    batch.append(record)
+                if len(batch) >= LOG_BATCH_SIZE:
+                    break
+                try:
+                    record = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+
+            self.write(batch)
+            self.flush()
+            for written in synced:
+                written.set()
+            if record is None:
+                return
+
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
-handler = logging.FileHandler(filename='discord.log', encoding='utf-8', mode='w')
-handler.setFormatter(logging.Formatter('%(asctime)s:%(levelname)s:%(name)s: %(message)s'))
+# Records about the upkeep of the bot (log uploads, outbound scheduler metrics) are logged by this child logger. They are written to
+# discord.log like the others, but the log is not uploaded when they are the only lines added, so an idle bot does not upload every interval
+housekeeping_logger = logger.getChild('housekeeping')
+HOUSEKEEPING_MARKER = json.dumps({"logger": housekeeping_logger.name})[1:-1].encode('utf-8')
+
+log_queue = queue.SimpleQueue()
+log_writer = JsonLinesWriter('discord.log', log_queue)
+log_writer.start()
 
+handler = LazyQueueHandler(log_queue)
+handler.addFilter(EventFilter(parse_log_event_controls(os.getenv('BOT_LOG_EVENTS', ''))))
 logger.addHandler(handler)
 
-logger.debug(f'Adding to PATH... {current_dir}')
-logger.debug(f'ABS_PATH: {ABS_PATH}')
-logger.debug(f'D_NAME: {D_NAME}')
-logger.debug(f'Current Directory: {current_dir}')
+atexit.register(log_writer.stop)
+
+logger.debug('Adding to PATH... %s', current_dir)
+logger.debug('ABS_PATH: %s', ABS_PATH)
+logger.debug('D_NAME: %s', D_NAME)
+logger.debug('Current Directory: %s', current_dir)
 
 # ------------------------------------------------------------env variables------------------------------------------------------------
 
 
 # Grabs discord token from .env
-load_dotenv(".env")
-logger.debug(f'Successfully retrieved DISCORD_TOKEN, AWS_ACCESS_KEY, AWS_SECRET_KEY')
+with startup_profiler.phase('load .env'):
+    load_dotenv(".env")
+logger.debug('Successfully retrieved DISCORD_TOKEN, AWS_ACCESS_KEY, AWS_SECRET_KEY')
 TOKEN = os.getenv('DISCORD_TOKEN')
 ACCESS_KEY = os.getenv('AWS_ACCESS_KEY')
 SECRET_KEY = os.getenv('AWS_SECRET_KEY')
 
+# The roasted server and the "Member" role that the commands are reserved for
+GUILD_ID = int(os.getenv('ROASTED_GUILD_ID', '748917163313725704'))
+MEMBER_ROLE_ID = int(os.getenv('ROASTED_MEMBER_ROLE_ID', '800907308887572521'))
+
+# Message sent when a command is used by someone that is not a member
+NOT_MEMBER_MESSAGE = 'Invalid command, please !accept the rules.'
+
 # ------------------------------------------------------------discord------------------------------------------------------------
 
 # Define intents. Intents use flags to determine what part of discord.py must be run
-logger.debug(f'Setting up discord bot intents...')
+logger.debug('Setting up discord bot intents...')
 intents = discord.Intents.default()
 intents.typing = True
 intents.presences = False
@@ -80,8 +327,382 @@ help_command = discord.ext.commands.DefaultHelpCommand(
     no_category = 'Commands'
 )
 
+# Bot subclass that also closes the pooled Climacell session used by snow_report when the bot shuts down
+class RoastedBot(Bot):
+    async def close(self):
+        logger.debug('Closing snow_report aiohttp session')
+        await snow_report.close_session()
+        await super().close()
+
 # Create a bot instance - bot instances are technically Client instances, this serves as the connection from Discord to discord.py
-bot = Bot(command_prefix='!', description=DESCRIPTION, intents=intents, help_command=help_command)
+with startup_profiler.phase('create bot'):
+    bot = RoastedBot(command_prefix='!', description=DESCRIPTION, intents=intents, help_command=help_command)
+
+# ------------------------------------------------------------authorization------------------------------------------------------------
+
+# Set of the ids of the members of the guild that have the member role, so checking a command author is a set lookup
+# It is loaded when the bot is ready and kept up to date by the member and role events below
+class MemberAuthorizationCache():
+    def __init__(self, guild_id, role_id):
+        self.guild_id = guild_id
+        self.role_id = role_id
+        self.members = set()
+        self.loaded = False
+
+    def load(self, guild):
+        if guild is None:
+            logger.debug('MemberAuthorizationCache.load: guild %s is not available', self.guild_id)
+            return
+
+        role = guild.get_role(self.role_id)
+        self.members = {member.id for member in role.members} if role is not None else set()
+        self.loaded = True
+        logger.debug('MemberAuthorizationCache.load: %s members have role %s', len(self.members), role)
+
+    def has_role(self, member):
+        return any(role.id == self.role_id for role in member.roles)
+
+    def update(self, member):
+        if member.guild.id != self.guild_id:
+            return
+        if self.has_role(member):
+            self.members.add(member.id)
+        else:
+            self.members.discard(member.id)
+
+    def remove(self, member):
+        if member.guild.id == self.guild_id:
+            self.members.discard(member.id)
+
+    def is_authorized(self, user_id):
+        # The guild may not have been available when the bot was ready
+        if not self.loaded:
+            self.load(bot.get_guild(self.guild_id))
+        return user_id in self.members
+
+member_authorization = MemberAuthorizationCache(GUILD_ID, MEMBER_ROLE_ID)
+
+# Check for the commands that are reserved for members, the command is not run if its author does not have the member role
+# The command line is logged here for the authors that are refused, so the parser still counts the command
+def member_only():
+    async def predicate(ctx):
+        handler_name = ctx.command.callback.__name__ if ctx.command is not None else 'member_only'
+        if member_authorization.is_authorized(ctx.author.id):
+            logger.debug('async def %s: %s role authorization successful', handler_name, ctx.author)
+            return True
+
+        logger.debug('async def %s: Command ("%s"): Author (%s): Channel: (%s)', handler_name, ctx.message.content, ctx.author, ctx.channel)
+        logger.debug('async def %s: Author %s not part of Member role.', handler_name, ctx.author)
+        return False
+
+    return commands.check(predicate)
+
+# Members are added to or removed from the cache when their roles change
+@bot.event
+async def on_member_update(before, after):
+    if before.roles != after.roles:
+        member_authorization.update(after)
+
+@bot.event
+async def on_member_remove(member):
+    member_authorization.remove(member)
+
+@bot.event
+async def on_guild_role_delete(role):
+    if role.id == MEMBER_ROLE_ID:
+        member_authorization.members.clear()
+
+# Commands that fail the member check are answered with NOT_MEMBER_MESSAGE, other errors are printed like the default handler does
+@bot.event
+async def on_command_error(ctx, error):
+    if isinstance(error, commands.CheckFailure):
+        await outbound.send(ctx.channel, NOT_MEMBER_MESSAGE, coalesce=False)
+        return
+
+    logger.error('async def on_command_error: Command %s failed: %s', ctx.command, error)
+    print(f'Ignoring exception in command {ctx.command}:', file=sys.stderr)
+    traceback.print_exception(type(error), error, error.__traceback__, file=sys.stderr)
+
+# ------------------------------------------------------------message batching------------------------------------------------------------
+
+# Discord does not accept messages longer than this
+MESSAGE_MAX_LENGTH = 2000
+
+# Number of times a message is sent again when discord answers 429 Too Many Requests
+SEND_RETRIES = 3
+
+# Sends a message to a channel, waiting and trying again when the bot is rate limited
+async def send_message(channel, content):
+    for attempt in range(SEND_RETRIES + 1):
+        try:
+            return await channel.send(content)
+        except discord.HTTPException as error:
+            if error.status != 429 or attempt == SEND_RETRIES:
+                raise
+            retry_after = error.response.headers.get('Retry-After') if error.response is not None else None
+            delay = float(retry_after) if retry_after else 2 ** attempt
+            logger.debug('async def send_message: Rate limited on channel %s, retrying in %s seconds', channel, delay)
+            await asyncio.sleep(delay)
+
+# Collects the lines of a report and sends them to a channel in as few messages as fit in MESSAGE_MAX_LENGTH characters
+# Messages are sent one at a time in the order the lines were added. Use it with async with so the last message is sent at the end:
+#   async with MessageBatcher(dmchannel) as batcher:
+#       await batcher.add('line')
+class MessageBatcher():
+    def __init__(self, channel, max_length=MESSAGE_MAX_LENGTH):
+        self.channel = channel
+        self.max_length = max_length
+        self.lines = []
+        self.length = 0
+        # Number of messages sent
+        self.messages = 0
+
+    # Adds a line, the lines collected so far are sent first if the line does not fit in the same message
+    async def add(self, line):
+        # A line longer than a message is split over several messages
+        while len(line) > self.max_length:
+            await self.flush()
+            await self.send(line[:self.max_length])
+            line = line[self.max_length:]
+
+        if self.lines and self.length + 1 + len(line) > self.max_length:
+            await self.flush()
+
+        self.length += len(line) + (1 if self.lines else 0)
+        self.lines.append(line)
+
+    # Sends the lines collected so far as one message
+    async def flush(self):
+        if not self.lines:
+            return
+        content = '\n'.join(self.lines)
+        self.lines = []
+        self.length = 0
+        await self.send(content)
+
+    async def send(self, content):
+        await outbound.send(self.channel, content, PRIORITY_BULK, wait=True)
+        self.messages += 1
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.flush()
+
+# ------------------------------------------------------------outbound scheduler------------------------------------------------------------
+
+# Priorities of outbound messages, replies to commands are sent before the lines of bulk reports
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 1
+PRIORITIES = (PRIORITY_INTERACTIVE, PRIORITY_BULK)
+
+# Discord allows a bot 50 requests per second over all channels and 5 messages per 5 seconds in one channel
+GLOBAL_RATE = 50
+GLOBAL_BURST = 50
+CHANNEL_LIMIT = 5
+CHANNEL_PERIOD = 5.0
+
+# Seconds between the queue depth and wait time lines written to the log
+SCHEDULER_METRICS_INTERVAL = 60
+
+# Hands out tokens at rate per second, up to capacity tokens can be taken at once
+# A waiter only takes a token when nobody with a higher priority is waiting for one
+class TokenBucket():
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.waiting = [0 for priority in PRIORITIES]
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, priority=PRIORITY_INTERACTIVE):
+        self.waiting[priority] += 1
+        try:
+            while True:
+                self.refill()
+                if self.tokens >= 1 and not any(self.waiting[:priority]):
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep(max((1 - self.tokens) / self.rate, 0.01))
+        finally:
+            self.waiting[priority] -= 1
+
+# Lets limit calls through in any period seconds, the times of the calls are kept until they are period seconds old
+# A channel limiter outlives the worker of its channel so messages sent one at a time are paced too
+class WindowLimiter():
+    def __init__(self, limit, period):
+        self.limit = limit
+        self.period = period
+        self.calls = collections.deque()
+
+    def expire(self):
+        now = time.monotonic()
+        while self.calls and now - self.calls[0] >= self.period:
+            self.calls.popleft()
+        return now
+
+    # True when no call was let through in the last period seconds, the limiter can then be replaced by a new one
+    def idle(self):
+        self.expire()
+        return not self.calls
+
+    async def acquire(self):
+        while True:
+            now = self.expire()
+            if len(self.calls) < self.limit:
+                self.calls.append(now)
+                return
+            await asyncio.sleep(max(self.calls[0] + self.period - now, 0.01))
+
+class OutboundMessage():
+    def __init__(self, content, priority, future, coalesce=True):
+        self.content = content
+        self.priority = priority
+        self.future = future
+        # Messages the log parser matches on, like NOT_MEMBER_MESSAGE, are always sent on their own
+        self.coalesce = coalesce
+        self.enqueued = time.monotonic()
+
+# Queues outbound messages per channel and sends them within discord's rate limits
+# Every channel has one queue per priority and one worker task that sends them in order, interactive messages first.
+# Consecutive queued messages of the same priority are joined into one message while they fit in MESSAGE_MAX_LENGTH characters
+class OutboundScheduler():
+    def __init__(self, rate=GLOBAL_RATE, burst=GLOBAL_BURST, channel_limit=CHANNEL_LIMIT, channel_period=CHANNEL_PERIOD, max_length=MESSAGE_MAX_LENGTH):
+        self.bucket = TokenBucket(rate, burst)
+        self.channel_limit = channel_limit
+        self.channel_period = channel_period
+        self.max_length = max_length
+        # Channel id: (channel, [deque per priority]) of the channels with queued messages
+        self.channels = {}
+        # Channel id: WindowLimiter, idle limiters are removed by expire_limiters()
+        self.limiters = {}
+        # Channel id: worker task
+        self.workers = {}
+        self.reset_metrics()
+
+    def reset_metrics(self):
+        self.sent = 0
+        self.requests = 0
+        self.failed = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    # Queues content for a channel. With wait the call returns the discord message once it was sent, otherwise it returns right away
+    # and errors are only written to the log
+    # Messages sent with coalesce=False are never joined with other messages
+    async def send(self, channel, content, priority=PRIORITY_INTERACTIVE, wait=False, coalesce=True):
+        key = getattr(channel, 'id', None) or id(channel)
+        if key not in self.channels:
+            self.channels[key] = (channel, [collections.deque() for priority in PRIORITIES])
+        if key not in self.limiters:
+            self.limiters[key] = WindowLimiter(self.channel_limit, self.channel_period)
+        future = asyncio.get_event_loop().create_future() if wait else None
+        self.channels[key][1][priority].append(OutboundMessage(str(content), priority, future, coalesce))
+
+        if key not in self.workers:
+            self.workers[key] = asyncio.ensure_future(self.run(key))
+
+        if future is not None:
+            return await future
+
+    # Takes the next message of the channel, joining the messages queued after it with the same priority while they fit
+    def next_batch(self, queues):
+        for pending in queues:
+            if pending:
+                batch = [pending.popleft()]
+                length = len(batch[0].content)
+                while batch[0].coalesce and pending and pending[0].coalesce and length + 1 + len(pending[0].content) <= self.max_length:
+                    length += 1 + len(pending[0].content)
+                    batch.append(pending.popleft())
+                return batch
+        return None
+
+    async def run(self, key):
+        channel, queues = self.channels[key]
+        channel_limiter = self.limiters[key]
+        try:
+            while True:
+                batch = self.next_batch(queues)
+                if batch is None:
+                    break
+                priority = batch[0].priority
+                await channel_limiter.acquire()
+                await self.bucket.acquire(priority)
+
+                now = time.monotonic()
+                for message in batch:
+                    wait = now - message.enqueued
+                    self.wait_total += wait
+                    self.wait_max = max(self.wait_max, wait)
+
+                try:
+                    sent = await send_message(channel, '\n'.join(message.content for message in batch))
+                except Exception as error:
+                    self.failed += len(batch)
+                    logger.error('OutboundScheduler: Sending %s messages to %s failed: %s', len(batch), channel, error)
+                    for message in batch:
+                        if message.future is not None and not message.future.done():
+                            message.future.set_exception(error)
+                    continue
+
+                self.requests += 1
+                self.sent += len(batch)
+                for message in batch:
+                    if message.future is not None and not message.future.done():
+                        message.future.set_result(sent)
+        finally:
+            self.drop(key)
+
+    # Forgets a channel, messages still queued when its worker is cancelled are dropped
+    def drop(self, key):
+        self.workers.pop(key, None)
+        channel, queues = self.channels.pop(key)
+        for pending in queues:
+            for message in pending:
+                if message.future is not None and not message.future.done():
+                    message.future.cancel()
+
+    # Number of queued messages per priority
+    def depth(self):
+        return [sum(len(queues[priority]) for channel, queues in self.channels.values()) for priority in PRIORITIES]
+
+    # Forgets the limiters of the channels without queued messages that did not send anything in the last period
+    def expire_limiters(self):
+        for key in [key for key, limiter in self.limiters.items() if key not in self.channels and limiter.idle()]:
+            del self.limiters[key]
+
+    def log_metrics(self):
+        interactive, bulk = self.depth()
+        mean_wait = self.wait_total / self.sent if self.sent else 0.0
+        housekeeping_logger.info('OutboundScheduler: Queued %s interactive, %s bulk in %s channels: Sent %s messages in %s requests, %s failed: Wait mean %.3fs max %.3fs',
+                    interactive, bulk, len(self.channels), self.sent, self.requests, self.failed, mean_wait, self.wait_max)
+        self.reset_metrics()
+
+    async def log_metrics_periodically(self, interval=SCHEDULER_METRICS_INTERVAL):
+        while True:
+            await asyncio.sleep(interval)
+            self.expire_limiters()
+            self.log_metrics()
+
+    # Cancels the workers, messages that were not sent yet are dropped
+    async def close(self):
+        workers = list(self.workers.values())
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        # Workers cancelled before they started never ran their cleanup
+        for key in list(self.channels):
+            self.drop(key)
+
+outbound = OutboundScheduler()
+
+# ------------------------------------------------------------events------------------------------------------------------------
 
 # Bot event logs in the bot into discord. Logger information displays the name and user id of the bot to discord.log
 @bot.event
@@ -95,14 +716,16 @@ async def on_ready():
     print(bot.user.id)
     print('------')
 
-    logger.debug(f'async def on_ready: Bot username: {bot.user.name} logged in successfully')
-    logger.debug(f'async def on_ready: Bot user ID: {bot.user.id}')
+    logger.debug('async def on_ready: Bot username: %s logged in successfully', bot.user.name)
+    logger.debug('async def on_ready: Bot user ID: %s', bot.user.id)
+
+    member_authorization.load(bot.get_guild(GUILD_ID))
 
 # This bot event monitors all messages incoming from all channels
 @bot.event
 async def on_message(message):
     await bot.process_commands(message)
-    logger.debug(f'async def on_message: Detected message sent by {message.author}: Message Content: "{message.content}"')
+    logger.debug('async def on_message: Detected message sent by %s: Message Content: "%s"', message.author, message.content)
 
     # On message, if the message author is the same as the bot, do nothing, do not want the bot replying to it's own messages
     if message.author == bot.user:
@@ -110,16 +733,16 @@ async def on_message(message):
 
     # On message, if the message content contains Hello, reply with Hello World to the same channel. Logger sends the action to the log
     elif message.content == "Hello":
-        await message.channel.send("Hello World!")
-        logger.debug(f'async def on_message: Message Content "Hello"')
-        logger.debug(f'async def on_message: Replied to user {message.author} with message "Hello World"')
+        await outbound.send(message.channel, "Hello World!")
+        logger.debug('async def on_message: Message Content "Hello"')
+        logger.debug('async def on_message: Replied to user %s with message "Hello World"', message.author)
 
 
     # On message, if the message content contains Hello, reply with Hello World to the same channel. Logger sends the action to the log
     elif message.content == "Bye":
-        await message.channel.send("See you!")
-        logger.debug(f'async def on_message: Message Content "Bye"')
-        logger.debug(f'async def on_message: Replied to user {message.author} with message "Bye"')
+        await outbound.send(message.channel, "See you!")
+        logger.debug('async def on_message: Message Content "Bye"')
+        logger.debug('async def on_message: Replied to user %s with message "Bye"', message.author)
 
 
 
@@ -130,453 +753,377 @@ async def on_message(message):
 # The code block then enters the message async function to actually assign the role
 @bot.command(pass_context=True, name='accept', help='Accept command for new users after reading the rules')
 async def assign_role(ctx):
-    logger.debug(f'async def assign_role: Command ("!accept"): Author ({ctx.author}): Channel: ({ctx.channel})')
+    logger.debug('async def assign_role: Command ("!accept"): Author (%s): Channel: (%s)', ctx.author, ctx.channel)
 
     if ctx.guild is None:
-        guild_id = bot.get_guild(int(748917163313725704))
-        role = guild_id.get_role(int(800907308887572521))
-        member = guild_id.get_member(ctx.author.id)
+        guild = bot.get_guild(GUILD_ID)
+        role = guild.get_role(MEMBER_ROLE_ID) if guild is not None else None
+        member = guild.get_member(ctx.author.id) if guild is not None else None
+
+        # Members that are not cached are fetched from discord
+        if member is None and guild is not None:
+            try:
+                member = await guild.fetch_member(ctx.author.id)
+            except discord.HTTPException:
+                member = None
 
-        if role not in member.roles:
+        if role is None or member is None:
+            logger.debug('async def assign_role: %s is not a member of guild %s', ctx.author, GUILD_ID)
+            await outbound.send(ctx.channel, 'You need to join the \'roasted\' server before you can !accept the rules.')
 
-            await ctx.send('async def assign_role: Adding to "Member" role...')
+        elif not member_authorization.has_role(member):
+
+            await outbound.send(ctx.channel, 'async def assign_role: Adding to "Member" role...')
             await member.add_roles(role)
-            logger.debug(f'async def assign_role: Adding {ctx.author} to {role} role in {guild_id} guild')
-            logger.debug(f'async def assign_role: Sending message \'Welcome to "roasted\' server!"')
-            await ctx.channel.send('Welcome to the \'roasted\' server!')
+            member_authorization.members.add(member.id)
+            logger.debug('async def assign_role: Adding %s to %s role in %s guild', ctx.author, role, guild)
+            logger.debug('async def assign_role: Sending message \'Welcome to "roasted\' server!"')
+            await outbound.send(ctx.channel, 'Welcome to the \'roasted\' server!')
 
         else:
-            logger.debug(f'async def assign_role: Member {ctx.author} is already assigned role')
+            logger.debug('async def assign_role: Member %s is already assigned role', ctx.author)
             
     else:
-        logger.debug(f'async def assign_role: Message was sent from guild channel {ctx.channel}... sending message to let command author know that this command is "DM only"')
-        await ctx.send('Private command only - for DM use')
+        logger.debug('async def assign_role: Message was sent from guild channel %s... sending message to let command author know that this command is "DM only"', ctx.channel)
+        await outbound.send(ctx.channel, 'Private command only - for DM use')
             
 
 # !server command displays the below information
 @bot.command(name='server', help='Fetches server information')
+@member_only()
 async def fetch_server_info(ctx):
-    guild = ctx.guild
-    logger.debug(f'async def fetch_server_info: Command ("!server"): Author ({ctx.author}): Channel: ({ctx.channel})')
+    # The command can be used from a DM, the information is always about the roasted server
+    guild = ctx.guild if ctx.guild is not None else bot.get_guild(GUILD_ID)
+    logger.debug('async def fetch_server_info: Command ("!server"): Author (%s): Channel: (%s)', ctx.author, ctx.channel)
 
-    guild_id = bot.get_guild(int(748917163313725704))
-    role = guild_id.get_role(int(800907308887572521))
-    member = guild_id.get_member(ctx.author.id)
+    logger.debug('async def fetch_server_info: Sending server information...')
+    await outbound.send(ctx.channel, f'Server Name: {guild.name}')
+    await outbound.send(ctx.channel, f'Server Size: {len(guild.members)}')
+    await outbound.send(ctx.channel, f'Administrator Name: {guild.owner.display_name}')
 
-    if role in member.roles:   
+# Adds the 4 day snow report of every resort in resort_keys to batcher
+# The forecasts are fetched concurrently by snow_report.regional_snow_report() and the report is sent a message at a time as they arrive
+async def send_regional_report(batcher, command_name, resort_keys):
+    async for resort_object, success in snow_report.regional_snow_report(resort_keys):
+        logger.debug('async def %s: Sending data for resort %s', command_name, resort_object.key)
 
-        logger.debug(f'async def fetch_server_info: {ctx.author} role authorization successful') 
-        logger.debug(f'async def fetch_server_info: Sending server information...')
-        await ctx.send(f'Server Name: {guild.name}')
-        await ctx.send(f'Server Size: {len(guild.members)}')
-        await ctx.send(f'Administrator Name: {guild.owner.display_name}')
+        if not success:
+            await batcher.add(f'Could not retrieve the forecast for {resort_object.name}, please try again later')
+            continue
 
-    else:
-        logger.debug(f'async def fetch_server_info: Sending message: Command author is not in "Member" roles. Invalid command, please !accept the rules.')
-        await ctx.send('Invalid command, please !accept the rules.')
-    
+        has_snow, total_precipitation = resort_object.get_snow_summary_96hr()
+
+        if has_snow:
+            await batcher.add(f'{resort_object.name} is expecting snow in the next 4 days ({total_precipitation} mm)')
+        else:
+            await batcher.add(f'{resort_object.name} is not expecting snow in the next 4 days')
 
 # !canadasnow command checks the ski resorts in Canada for snow in the next 4 days
 @bot.command(name='canadasnow', help='Checks for snow in the forecast in Canadian ski resorts')
+@member_only()
 async def canada_snow_report(ctx):
-    logger.debug(f'async def canada_snow_report: Command ("!canadasnow"): Author ({ctx.author}): Channel: ({ctx.channel})')
-
-    guild_id = bot.get_guild(int(748917163313725704))
-    role = guild_id.get_role(int(800907308887572521))
-    member = guild_id.get_member(ctx.author.id)
-
-    if role in member.roles:    
-        
-        logger.debug(f'async def canada_snow_report: {ctx.author} role authorization successful')
-        logger.debug(f'async def canada_snow_report: Checking snow reports for Canadian resorts... sending to {ctx.author} DM')
-        await ctx.send(f'Checking snow reports for Canadian resorts.... please note that 0mm total precipitation does not mean there is no snow, it just means that the snowfall is not significant.')
-        await ctx.send(f'Please check your DM')
-
-        dmchannel = await ctx.author.create_dm()
+    logger.debug('async def canada_snow_report: Command ("!canadasnow"): Author (%s): Channel: (%s)', ctx.author, ctx.channel)
 
-        for resort_key in snow_report.CANADA_RESORTS:
-            logger.debug(f'async def canada_snow_report: Sending data for resort {resort_key}')
-            resort_object = snow_report.Resort(resort_key)
-            resort_object.request_96hr()
-            # resort_temp = resort_object.get_temperature_96hr()
-            resort_precipitation_type = resort_object.get_precipitation_type_96hr()
-            resort_precipitation = resort_object.get_precipitation_96hr()
+    logger.debug('async def canada_snow_report: Checking snow reports for Canadian resorts... sending to %s DM', ctx.author)
+    await outbound.send(ctx.channel, f'Checking snow reports for Canadian resorts.... please note that 0mm total precipitation does not mean there is no snow, it just means that the snowfall is not significant.')
+    await outbound.send(ctx.channel, f'Please check your DM')
 
-            total_precipitation = 0
-            for preciptation_value in resort_precipitation.values():
-                total_precipitation = int(preciptation_value) + int(total_precipitation)
+    dmchannel = await ctx.author.create_dm()
 
-            if 'snow' in resort_precipitation_type.values():
-                await dmchannel.send(f'{resort_object.name} is expecting snow in the next 4 days ({total_precipitation} mm)')
-            else:
-                await dmchannel.send(f'{resort_object.name} is not expecting snow in the next 4 days')
+    async with MessageBatcher(dmchannel) as batcher:
+        await send_regional_report(batcher, 'canada_snow_report', snow_report.registry.country_keys('Canada'))
 
-        logger.debug(f'async def canada_snow_report: Completed command loop')
-        await dmchannel.send(f'Complete')
-
-    else:
-        logger.debug(f'async def canada_snow_report: Author {ctx.author} not part of Member role.')
-        await ctx.send('Invalid command, please !accept the rules.')
+        logger.debug('async def canada_snow_report: Completed command loop')
+        await batcher.add('Complete')
 
 # !USAsnow command checks for the snow in the forecast in American resorts for the next 4 days
 @bot.command(name='USAsnow', help='Checks for snow in the forecast in American ski resorts')
+@member_only()
 async def USA_snow_report(ctx):
-    logger.debug(f'async def USA_snow_report: Command ("!USAsnow"): Author ({ctx.author}): Channel: ({ctx.channel})')
-
-
-    guild_id = bot.get_guild(int(748917163313725704))
-    role = guild_id.get_role(int(800907308887572521))
-    member = guild_id.get_member(ctx.author.id)
+    logger.debug('async def USA_snow_report: Command ("!USAsnow"): Author (%s): Channel: (%s)', ctx.author, ctx.channel)
 
-# Checks if the user is a member, if they are, it executes it.
-    if role in member.roles:
-
-        logger.debug(f'async def USA_snow_report: {ctx.author} role authorization successful')
-        logger.debug(f'async def USA_snow_report: Checking snow reports for USA resorts... sending to {ctx.author} DM')
-        await ctx.send(f'Checking snow reports for American resorts.... please note that 0mm total precipitation does not mean there is no snow, it just means that the snowfall is not significant.')
-        await ctx.send(f'Please check your DM')
-        
-        dmchannel = await ctx.author.create_dm()
-
-        for resort_key in snow_report.USA_RESORTS:
-            logger.debug(f'async def USA_snow_report: Sending data for resort {resort_key}')
-            resort_object = snow_report.Resort(resort_key)
-            resort_object.request_96hr()
-            # resort_temp = resort_object.get_temperature_96hr()
-            resort_precipitation_type = resort_object.get_precipitation_type_96hr()
-            resort_precipitation = resort_object.get_precipitation_96hr()
-
-            total_precipitation = 0
-            for preciptation_value in resort_precipitation.values():
-                total_precipitation = int(preciptation_value) + int(total_precipitation)
-
-            if 'snow' in resort_precipitation_type.values():
-                await dmchannel.send(f'{resort_object.name} is expecting snow in the next 4 days ({total_precipitation} mm)')
-            else:
-                await dmchannel.send(f'{resort_object.name} is not expecting snow in the next 4 days')
+    logger.debug('async def USA_snow_report: Checking snow reports for USA resorts... sending to %s DM', ctx.author)
+    await outbound.send(ctx.channel, f'Checking snow reports for American resorts.... please note that 0mm total precipitation does not mean there is no snow, it just means that the snowfall is not significant.')
+    await outbound.send(ctx.channel, f'Please check your DM')
+    
+    dmchannel = await ctx.author.create_dm()
 
-        logger.debug(f'async def USA_snow_report: Completed command loop')
-        await dmchannel.send(f'Complete')
+    async with MessageBatcher(dmchannel) as batcher:
+        await send_regional_report(batcher, 'USA_snow_report', snow_report.registry.country_keys('USA'))
 
-# Checks if the user is a member, if not, it asks the users to !accept the rules
-    else:
-        logger.debug(f'Author {ctx.author} not part of Member role.')
-        await ctx.send('Invalid command, please !accept the rules.')
+        logger.debug('async def USA_snow_report: Completed command loop')
+        await batcher.add('Complete')
 
 # !resorts command lists the resorts that the user can request with the snow report module within discord
 @bot.command(name='resorts', help='Lists the resorts that the user can request snow report forecasts')
+@member_only()
 async def list_resorts(ctx):
-    logger.debug(f'async def list_resorts: Command ("!resorts"): Author ({ctx.author}): Channel: ({ctx.channel})')
+    logger.debug('async def list_resorts: Command ("!resorts"): Author (%s): Channel: (%s)', ctx.author, ctx.channel)
 
-    guild_id = bot.get_guild(int(748917163313725704))
-    role = guild_id.get_role(int(800907308887572521))
-    member = guild_id.get_member(ctx.author.id)
+    logger.debug('async def list_resorts: Checking Resort: Resort Key pairs... sending to %s DM', ctx.author)
+    await outbound.send(ctx.channel, f'Sending list of searchable resorts to your DM...')
 
-# Checks if the user is a member, if they are, it executes it.
-    if role in member.roles:
+    dmchannel = await ctx.author.create_dm()
 
-        logger.debug(f'async def list_resorts: {ctx.author} role authorization successful')
-        logger.debug(f'async def list_resorts: Checking Resort: Resort Key pairs... sending to {ctx.author} DM')
-        await ctx.send(f'Sending list of searchable resorts to your DM...')
+    resort_name_key_dict = snow_report.registry.name_key_pairs()
 
-        dmchannel = await ctx.author.create_dm()
+    async with MessageBatcher(dmchannel) as batcher:
+        await batcher.add(f'To check for snow, put a ! at the beginning of the searchable keyword and snow at the end. For example, to search for 4 day forecast of whistler, type !checksnow <insert key here>')
+        logger.debug('async def list_resorts: Sending resorts key value pair to %s DM', ctx.author)
 
-        resort_name_key_dict = {snow_report.RESORT_NAMES[i]: snow_report.RESORT_KEYS[i] for i in range(len(snow_report.RESORT_NAMES))}
+        for resort in resort_name_key_dict:
+            logger.debug('async def list_resorts: Sending data for resort %s', resort)
+            await batcher.add(f'<Resort Name>: {resort} | <keyword>: {resort_name_key_dict[resort]}')
 
-        await dmchannel.send(f'To check for snow, put a ! at the beginning of the searchable keyword and snow at the end. For example, to search for 4 day forecast of whistler, type !checksnow <insert key here>')
-        await dmchannel.send(f'Please wait a few seconds for me to work....')
-        logger.debug(f'async def list_resorts: Sending resorts key value pair to {ctx.author} DM')
+        logger.debug('async def list_resorts: Completed command loop')
+        await batcher.add('Complete')
 
-        for resort in resort_name_key_dict:
-            logger.debug(f'async def canada_snow_report: Sending data for resort {resort}')
-            await dmchannel.send(f'<Resort Name>: {resort} | <keyword>: {resort_name_key_dict[resort]}')
-        
-        logger.debug(f'async def list_resorts: Completed command loop')
-        await dmchannel.send(f'Complete')
-        
+# !nearby command lists the resorts closest to a location, or every resort within km of the location if km is passed
+@bot.command(name='nearby', help='Lists the resorts near a location: !nearby <lat> <lon> [km]')
+@member_only()
+async def nearby_resorts(ctx, lat, lon, km=None):
+    logger.debug('async def nearby_resorts: Command ("!nearby %s %s %s"): Author (%s): Channel: (%s)', lat, lon, km, ctx.author, ctx.channel)
 
-# Checks if the user is a member, if not, it asks the users to !accept the rules
+    try:
+        lat = float(lat)
+        lon = float(lon)
+        km = float(km) if km is not None else None
+    except ValueError:
+        logger.debug('async def nearby_resorts: Error, invalid location %s %s %s', lat, lon, km)
+        await outbound.send(ctx.channel, f'Error, please pass the location as numbers, for example !nearby 51.4 -116.2 50')
+        return
+
+    if not -90 <= lat <= 90 or not -180 <= lon <= 180 or (km is not None and km < 0):
+        logger.debug('async def nearby_resorts: Error, location out of range %s %s %s', lat, lon, km)
+        await outbound.send(ctx.channel, f'Error, latitude must be between -90 and 90, longitude between -180 and 180 and km must be positive')
+        return
+
+    if km is None:
+        nearby = snow_report.nearby_resorts(lat, lon)
     else:
-        logger.debug(f'async def list_resorts: Author {ctx.author} not part of Member role.')
-        await ctx.send('Invalid command, please !accept the rules.')
+        nearby = snow_report.resorts_within(lat, lon, km)[:NEARBY_MAX_RESULTS]
+
+    await outbound.send(ctx.channel, f'Searching for resorts near {lat}, {lon}... please check your DM')
+    dmchannel = await ctx.author.create_dm()
+
+    if not nearby:
+        await outbound.send(dmchannel, f'There are no resorts within {km} km of {lat}, {lon}')
+
+    logger.debug('async def nearby_resorts: Sending %s resorts', len(nearby))
+    async with MessageBatcher(dmchannel) as batcher:
+        for resort_key, distance in nearby:
+            await batcher.add(f'<Resort Name>: {snow_report.registry.get(resort_key)["name"]} | <keyword>: {resort_key} | {distance:.1f} km')
+
+# Tells the user in their DM that the forecast of a resort could not be retrieved, the single resort commands send this
+# instead of their report when the Climacell request failed or timed out
+async def send_forecast_failed(dmchannel, command_name, resort_object):
+    logger.debug('async def %s: Could not retrieve the forecast for resort %s', command_name, resort_object.key)
+    await outbound.send(dmchannel, f'Could not retrieve the forecast for {resort_object.name}, please try again later')
 
 # !checksnow command checks for snow in the forecast for the resort that is passed as an argument
 @bot.command(name='checksnow', help='Checks for snow in the forecast for the resort passed as an argument')
+@member_only()
 async def check_4day_snow(ctx, resort_key):
-    logger.debug(f'async check_4day_snow: Command ("!checksnow {resort_key}"): Author ({ctx.author}): Channel: ({ctx.channel})')
-
-    guild_id = bot.get_guild(int(748917163313725704))
-    role = guild_id.get_role(int(800907308887572521))
-    member = guild_id.get_member(ctx.author.id)
+    logger.debug('async check_4day_snow: Command ("!checksnow %s"): Author (%s): Channel: (%s)', resort_key, ctx.author, ctx.channel)
 
     dmchannel = await ctx.author.create_dm()
 
-# Checks if the user is a member, if they are, it executes it.
-    if role in member.roles:
-        logger.debug(f'async def check_4day_snow: {ctx.author} role authorization successful')
-
-        if resort_key in snow_report.RESORT_KEYS:
-            logger.debug(f'async def check_4day_snow: Checking if snow is in the forecast for requested resort')
-            await ctx.send(f'Checking forecast... please check your DM')
-            await dmchannel.send(f'Checking for snow for resort key {resort_key}, please wait a few seconds for me to work....')
-
-            resort_object = snow_report.Resort(resort_key)
-            resort_object.request_96hr()
-            # resort_temp = resort_object.get_temperature_96hr()
-            resort_precipitation_type = resort_object.get_precipitation_type_96hr()
-            resort_precipitation = resort_object.get_precipitation_96hr()
-
-            total_precipitation = 0
-            for preciptation_value in resort_precipitation.values():
-                total_precipitation = int(preciptation_value) + int(total_precipitation)
-
-            logger.debug(f'async def check_4day_snow: Sending requested information')
-            if 'snow' in resort_precipitation_type.values():
-                await dmchannel.send(f'{resort_object.name} is expecting snow in the next 4 days ({total_precipitation} mm)')
-            else:
-                await dmchannel.send(f'{resort_object.name} is not expecting snow in the next 4 days')
-
-        else: 
-            await ctx.send(f'Checking forecast... please check your DM')
-            await dmchannel.send(f'Error, I cannot find the key "{resort_key}" in my database, please check the key and try again')
-            logger.debug(f'async def check_4day_snow: Error, cannot find {resort_key}')
-
-# Checks if the user is a member, if not, it asks the users to !accept the rules
-    else:
-        logger.debug(f'async def check_4day_snow: Author {ctx.author} not part of Member role.')
-        await ctx.send('Invalid command, please !accept the rules.')
+    if resort_key in snow_report.registry:
+        logger.debug('async def check_4day_snow: Checking if snow is in the forecast for requested resort')
+        await outbound.send(ctx.channel, f'Checking forecast... please check your DM')
+        await outbound.send(dmchannel, f'Checking for snow for resort key {resort_key}, please wait a few seconds for me to work....')
+
+        resort_object = snow_report.Resort(resort_key)
+        if not await resort_object.async_request_96hr():
+            await send_forecast_failed(dmchannel, 'check_4day_snow', resort_object)
+            return
+        has_snow, total_precipitation = resort_object.get_snow_summary_96hr()
+
+        logger.debug('async def check_4day_snow: Sending requested information')
+        if has_snow:
+            await outbound.send(dmchannel, f'{resort_object.name} is expecting snow in the next 4 days ({total_precipitation} mm)')
+        else:
+            await outbound.send(dmchannel, f'{resort_object.name} is not expecting snow in the next 4 days')
+
+    else: 
+        await outbound.send(ctx.channel, f'Checking forecast... please check your DM')
+        await outbound.send(dmchannel, f'Error, I cannot find the key "{resort_key}" in my database, please check the key and try again')
+        logger.debug('async def check_4day_snow: Error, cannot find %s', resort_key)
 
 # Checks the current temperature of the requested resort
 @bot.command(name='checktemp', help='Checks for temperature for the resort passed as an argument')
+@member_only()
 async def check_temp_now(ctx, resort_key):
-    logger.debug(f'async def check_temp_now: Command ("!checktemp {resort_key}"): Author ({ctx.author}): Channel: ({ctx.channel})')
-
-    guild_id = bot.get_guild(int(748917163313725704))
-    role = guild_id.get_role(int(800907308887572521))
-    member = guild_id.get_member(ctx.author.id)
+    logger.debug('async def check_temp_now: Command ("!checktemp %s"): Author (%s): Channel: (%s)', resort_key, ctx.author, ctx.channel)
 
     dmchannel = await ctx.author.create_dm()
 
-# Checks if the user is a member, if they are, it executes it.
-    if role in member.roles:
-        logger.debug(f'async def check_temp_now: {ctx.author} role authorization successful')  
-
-        if resort_key in snow_report.RESORT_KEYS:
-            logger.debug(f'async def check_temp_now: Sending requested information')
-            await ctx.send(f'Checking temperature... please check your DM')
-
-            resort_object = snow_report.Resort(resort_key)
-            resort_object.request_now()
-            resort_temp = resort_object.now_temperature
+    if resort_key in snow_report.registry:
+        logger.debug('async def check_temp_now: Sending requested information')
+        await outbound.send(ctx.channel, f'Checking temperature... please check your DM')
 
-            await dmchannel.send(f'The current temperature of {resort_object.name} is {resort_temp} degrees C')
+        resort_object = snow_report.Resort(resort_key)
+        if not await resort_object.async_request_now():
+            await send_forecast_failed(dmchannel, 'check_temp_now', resort_object)
+            return
+        resort_temp = resort_object.now_temperature
 
-        else: 
-            logger.debug(f'async def check_temp_now: Error, cannot find {resort_key}')
-            await ctx.send(f'Checking temperature... please check your DM')
-            await dmchannel.send(f'Error, I cannot find the key "{resort_key}" in my database, please check the key and try again.')
+        await outbound.send(dmchannel, f'The current temperature of {resort_object.name} is {resort_temp} degrees C')
 
-# Checks if the user is a member, if not, it asks the users to !accept the rules
-    else:
-        logger.debug(f'async def check_temp_now: Author {ctx.author} not part of Member role.')
-        await ctx.send('Invalid command, please !accept the rules.')
+    else: 
+        logger.debug('async def check_temp_now: Error, cannot find %s', resort_key)
+        await outbound.send(ctx.channel, f'Checking temperature... please check your DM')
+        await outbound.send(dmchannel, f'Error, I cannot find the key "{resort_key}" in my database, please check the key and try again.')
 
 # !checkfeelslike command checks feels like temperature for the resort that is passed as an argument
 @bot.command(name='checkfeelslike', help='Checks for feels like temperature for the resort passed as an argument')
+@member_only()
 async def check_feelslike_now(ctx, resort_key):
-    logger.debug(f'async def feelslike_now: Command ("!checkfeelslike {resort_key}"): Author ({ctx.author}): Channel: ({ctx.channel})')
-
-    guild_id = bot.get_guild(int(748917163313725704))
-    role = guild_id.get_role(int(800907308887572521))
-    member = guild_id.get_member(ctx.author.id)
+    logger.debug('async def feelslike_now: Command ("!checkfeelslike %s"): Author (%s): Channel: (%s)', resort_key, ctx.author, ctx.channel)
 
     dmchannel = await ctx.author.create_dm()
 
-# Checks if the user is a member, if they are, it executes it.
-    if role in member.roles:
-        logger.debug(f'async def feelslike_now: {ctx.author} role authorization successful') 
-
-        if resort_key in snow_report.RESORT_KEYS:
-            logger.debug(f'async def check_feelslike_now: Sending requested information')
-            await ctx.send(f'Checking "feels like" temperature... please check your DM')
-
-            resort_object = snow_report.Resort(resort_key)
-            resort_object.request_now()
-            resort_feelslike = resort_object.now_feelslike
+    if resort_key in snow_report.registry:
+        logger.debug('async def check_feelslike_now: Sending requested information')
+        await outbound.send(ctx.channel, f'Checking "feels like" temperature... please check your DM')
 
-            await dmchannel.send(f'It currently feels like {resort_feelslike} degrees C at {resort_object.name}')
+        resort_object = snow_report.Resort(resort_key)
+        if not await resort_object.async_request_now():
+            await send_forecast_failed(dmchannel, 'check_feelslike_now', resort_object)
+            return
+        resort_feelslike = resort_object.now_feelslike
 
-        else: 
-            logger.debug(f'async def feelslike_now: Error, cannot find {resort_key}')
-            await ctx.send(f'Checking "feels like" temperature... please check your DM')
-            await dmchannel.send(f'Error, I cannot find the key "{resort_key}" in my database, please check the key and try again.')
+        await outbound.send(dmchannel, f'It currently feels like {resort_feelslike} degrees C at {resort_object.name}')
 
-
-# Checks if the user is a member, if not, it asks the users to !accept the rules
-    else:
-        logger.debug(f'async def check_feelslike_now: Author {ctx.author} not part of Member role.')
-        await ctx.send('Invalid command, please !accept the rules.')
+    else: 
+        logger.debug('async def feelslike_now: Error, cannot find %s', resort_key)
+        await outbound.send(ctx.channel, f'Checking "feels like" temperature... please check your DM')
+        await outbound.send(dmchannel, f'Error, I cannot find the key "{resort_key}" in my database, please check the key and try again.')
 
 # !checktomorrowtemp checks the temperature for tomorrow for the requested resort
 @bot.command(name='checktomorrowtemp', help='Checks the temperature tomorrow for the requested resort')
+@member_only()
 async def check_temp_tomorrow(ctx, resort_key):
-    logger.debug(f'async def check_temp_tomorrow: Command ("!checktomorrowtemp {resort_key}"): Author ({ctx.author}): Channel: ({ctx.channel})')
-
-    guild_id = bot.get_guild(int(748917163313725704))
-    role = guild_id.get_role(int(800907308887572521))
-    member = guild_id.get_member(ctx.author.id)
+    logger.debug('async def check_temp_tomorrow: Command ("!checktomorrowtemp %s"): Author (%s): Channel: (%s)', resort_key, ctx.author, ctx.channel)
 
     dmchannel = await ctx.author.create_dm()
 
-# Checks if the user is a member, if they are, it executes it.
-    if role in member.roles:
-        logger.debug(f'async def check_temp_tomorrow: {ctx.author} role authorization successful') 
-
-        if resort_key in snow_report.RESORT_KEYS:
-            logger.debug(f'async def check_temp_tomorrow: Sending requested information')
-            
-
-            resort_object = snow_report.Resort(resort_key)
-            resort_object.request_96hr()
-            resort_temp_tomorrow = resort_object.get_tomorrow_temp()
-
-            await ctx.send(f'Checking the temperature for tomorrow at {resort_object.name}... please check your DM')
-            await dmchannel.send(f'<{resort_object.name}> Temperature: {resort_temp_tomorrow} degrees C')
+    if resort_key in snow_report.registry:
+        logger.debug('async def check_temp_tomorrow: Sending requested information')
+        
 
-        else: 
-            logger.debug(f'async def check_temp_tomorrow: Error, cannot find {resort_key}')
-            await ctx.send(f'Checking "feels like" temperature... please check your DM')
-            await dmchannel.send(f'Error, I cannot find the key "{resort_key}" in my database, please check the key and try again.')
+        resort_object = snow_report.Resort(resort_key)
+        if not await resort_object.async_request_96hr():
+            await outbound.send(ctx.channel, f'Checking the temperature for tomorrow at {resort_object.name}... please check your DM')
+            await send_forecast_failed(dmchannel, 'check_temp_tomorrow', resort_object)
+            return
+        resort_temp_tomorrow = resort_object.get_tomorrow_temp()
 
-# Checks if the user is a member, if not, it asks the users to !accept the rules
-    else:
-        logger.debug(f'async def check_temp_tomorrow: Author {ctx.author} not part of Member role.')
-        await ctx.send('Invalid command, please !accept the rules.')
+        await outbound.send(ctx.channel, f'Checking the temperature for tomorrow at {resort_object.name}... please check your DM')
+        await outbound.send(dmchannel, f'<{resort_object.name}> Temperature: {resort_temp_tomorrow} degrees C')
 
+    else: 
+        logger.debug('async def check_temp_tomorrow: Error, cannot find %s', resort_key)
+        await outbound.send(ctx.channel, f'Checking "feels like" temperature... please check your DM')
+        await outbound.send(dmchannel, f'Error, I cannot find the key "{resort_key}" in my database, please check the key and try again.')
 
 # !checktomorrowfeelslike checks the temperature for tomorrow for the requested resort
 @bot.command(name='checktomorrowfeelslike', help='Checks the feels like temperature tomorrow for the requested resort')
+@member_only()
 async def check_feelslike_tomorrow(ctx, resort_key):
-    logger.debug(f'async def check_feelslike_tomorrow: Command ("!checktomorrowfeelslike {resort_key}"): Author ({ctx.author}): Channel: ({ctx.channel})')
-
-    guild_id = bot.get_guild(int(748917163313725704))
-    role = guild_id.get_role(int(800907308887572521))
-    member = guild_id.get_member(ctx.author.id)
+    logger.debug('async def check_feelslike_tomorrow: Command ("!checktomorrowfeelslike %s"): Author (%s): Channel: (%s)', resort_key, ctx.author, ctx.channel)
 
     dmchannel = await ctx.author.create_dm()
 
-# Checks if the user is a member, if they are, it executes it.
-    if role in member.roles:
-        logger.debug(f'async def check_feelslike_tomorrow: {ctx.author} role authorization successful') 
+    if resort_key in snow_report.registry:
+        logger.debug('async def check_feelslike_tomorrow: Sending requested information')
 
-        if resort_key in snow_report.RESORT_KEYS:
-            logger.debug(f'async def check_feelslike_tomorrow: Sending requested information')
+        resort_object = snow_report.Resort(resort_key)
+        if not await resort_object.async_request_96hr():
+            await outbound.send(ctx.channel, f'Checking the feels like temperature for tomorrow at {resort_object.name}... please check your DM')
+            await send_forecast_failed(dmchannel, 'check_feelslike_tomorrow', resort_object)
+            return
+        resort_feelslike_tomorrow = resort_object.get_tomorrow_feelslike()
 
-            resort_object = snow_report.Resort(resort_key)
-            resort_object.request_96hr()
-            resort_feelslike_tomorrow = resort_object.get_tomorrow_feelslike()
+        await outbound.send(ctx.channel, f'Checking the feels like temperature for tomorrow at {resort_object.name}... please check your DM')
+        await outbound.send(dmchannel, f'<{resort_object.name}> Feels like: {resort_feelslike_tomorrow} degrees C')
 
-            await ctx.send(f'Checking the feels like temperature for tomorrow at {resort_object.name}... please check your DM')
-            await dmchannel.send(f'<{resort_object.name}> Feels like: {resort_feelslike_tomorrow} degrees C')
-
-        else: 
-            logger.debug(f'async def check_feelslike_tomorrow: Error, cannot find {resort_key}')
-            await ctx.send(f'Checking "feels like" temperature... please check your DM')
-            await dmchannel.send(f'Error, I cannot find the key "{resort_key}" in my database, please check the key and try again.')
-
-# Checks if the user is a member, if not, it asks the users to !accept the rules
-    else:
-        logger.debug(f'async def check_feelslike_tomorrow: Author {ctx.author} not part of Member role.')
-        await ctx.send('Invalid command, please !accept the rules.')
+    else: 
+        logger.debug('async def check_feelslike_tomorrow: Error, cannot find %s', resort_key)
+        await outbound.send(ctx.channel, f'Checking "feels like" temperature... please check your DM')
+        await outbound.send(dmchannel, f'Error, I cannot find the key "{resort_key}" in my database, please check the key and try again.')
 
 # !checktomorrowfeelslike checks the temperature for tomorrow for the requested resort
 @bot.command(name='checktomorrowprecipitation', help='Checks the total amount of precipitation tomorrow for the requested resort')
+@member_only()
 async def check_precipitation_tomorrow(ctx, resort_key):
-    logger.debug(f'async def check_precipitation_tomorrow: Command ("!checktomorrowprecipitation {resort_key}"): Author ({ctx.author}): Channel: ({ctx.channel})')
-
-    guild_id = bot.get_guild(int(748917163313725704))
-    role = guild_id.get_role(int(800907308887572521))
-    member = guild_id.get_member(ctx.author.id)
+    logger.debug('async def check_precipitation_tomorrow: Command ("!checktomorrowprecipitation %s"): Author (%s): Channel: (%s)', resort_key, ctx.author, ctx.channel)
 
     dmchannel = await ctx.author.create_dm()
 
-# Checks if the user is a member, if they are, it executes it.
-    if role in member.roles:
-        logger.debug(f'async def check_precipitation_tomorrow: {ctx.author} role authorization successful') 
+    if resort_key in snow_report.registry:
+        logger.debug('async def check_precipitation_tomorrow: Sending requested information')
 
-        if resort_key in snow_report.RESORT_KEYS:
-            logger.debug(f'async def check_precipitation_tomorrow: Sending requested information')
+        resort_object = snow_report.Resort(resort_key)
+        if not await resort_object.async_request_96hr():
+            await outbound.send(ctx.channel, f'Checking the precipitation for tomorrow at {resort_object.name}... please check your DM')
+            await send_forecast_failed(dmchannel, 'check_precipitation_tomorrow', resort_object)
+            return
+        resort_precipitation_tomorrow = resort_object.get_tomorrow_precipitation()
+        resort_precipitation_type_tomorrow = resort_object.get_tomorrow_precipitation_type()
 
-            resort_object = snow_report.Resort(resort_key)
-            resort_object.request_96hr()
-            resort_precipitation_tomorrow = resort_object.get_tomorrow_precipitation()
-            resort_precipitation_type_tomorrow = resort_object.get_tomorrow_precipitation_type()
+        await outbound.send(ctx.channel, f'Checking the precipitation for tomorrow at {resort_object.name}... please check your DM')
+        await outbound.send(dmchannel, f'<{resort_object.name}> Total precipitation tomorrow: {resort_precipitation_tomorrow} mm')
+        await outbound.send(dmchannel, f'<{resort_object.name}> Precipitation types: {resort_precipitation_type_tomorrow}')
 
-            await ctx.send(f'Checking the precipitation for tomorrow at {resort_object.name}... please check your DM')
-            await dmchannel.send(f'<{resort_object.name}> Total precipitation tomorrow: {resort_precipitation_tomorrow} mm')
-            await dmchannel.send(f'<{resort_object.name}> Precipitation types: {resort_precipitation_type_tomorrow}')
-
-        else: 
-            logger.debug(f'async def check_precipitation_tomorrow: Error, cannot find {resort_key}')
-            await ctx.send(f'Checking precipitation.. please check your DM')
-            await dmchannel.send(f'Error, I cannot find the key "{resort_key}" in my database, please check the key and try again.')
-
-# Checks if the user is a member, if not, it asks the users to !accept the rules
-    else:
-        logger.debug(f'async def check_precipitation_tomorrow: Author {ctx.author} not part of Member role.')
-        await ctx.send('Invalid command, please !accept the rules.')
+    else: 
+        logger.debug('async def check_precipitation_tomorrow: Error, cannot find %s', resort_key)
+        await outbound.send(ctx.channel, f'Checking precipitation.. please check your DM')
+        await outbound.send(dmchannel, f'Error, I cannot find the key "{resort_key}" in my database, please check the key and try again.')
 
 # !checktomorrow checks the weather for the requested resort
 @bot.command(name='checktomorrow', help='Checks the weather tomorrow for the requested resort')
+@member_only()
 async def check_tomorrow(ctx, resort_key):
-    logger.debug(f'async def check_tomorrow: Command ("!checktomorrow {resort_key}"): Author ({ctx.author}): Channel: ({ctx.channel})')
-
-    guild_id = bot.get_guild(int(748917163313725704))
-    role = guild_id.get_role(int(800907308887572521))
-    member = guild_id.get_member(ctx.author.id)
+    logger.debug('async def check_tomorrow: Command ("!checktomorrow %s"): Author (%s): Channel: (%s)', resort_key, ctx.author, ctx.channel)
 
     dmchannel = await ctx.author.create_dm()
 
-# Checks if the user is a member, if they are, it executes it.
-    if role in member.roles:
-        logger.debug(f'async def check_tomorrow: {ctx.author} role authorization successful') 
-
-        if resort_key in snow_report.RESORT_KEYS:
-            logger.debug(f'async def check_tomorrow: Sending requested information')
-
-            resort_object = snow_report.Resort(resort_key)
-            resort_object.request_96hr()
-            resort_temp_tomorrow = resort_object.get_tomorrow_temp()
-            resort_feelslike_tomorrow = resort_object.get_tomorrow_feelslike()
-            resort_precipitation_tomorrow = resort_object.get_tomorrow_precipitation()
-            resort_precipitation_type_tomorrow = resort_object.get_tomorrow_precipitation_type()
-
-            await ctx.send(f'Checking the weather for tomorrow at {resort_object.name}... please check your DM')
-            await dmchannel.send(f'<{resort_object.name}> Temperature: {resort_temp_tomorrow} degrees C')           
-            await dmchannel.send(f'<{resort_object.name}> Feels like: {resort_feelslike_tomorrow} degrees C')         
-            await dmchannel.send(f'<{resort_object.name}> Total precipitation tomorrow: {resort_precipitation_tomorrow} mm')
-            await dmchannel.send(f'<{resort_object.name}> Precipitation types: {resort_precipitation_type_tomorrow}')
-
-        else: 
-            logger.debug(f'async def check_tomorrow: Error, cannot find {resort_key}')
-            await ctx.send(f'Checking weather.. please check your DM')
-            await dmchannel.send(f'Error, I cannot find the key "{resort_key}" in my database, please check the key and try again.')
-
-# Checks if the user is a member, if not, it asks the users to !accept the rules
-    else:
-        logger.debug(f'async def check_tomorrow: Author {ctx.author} not part of Member role.')
-        await ctx.send('Invalid command, please !accept the rules.')
+    if resort_key in snow_report.registry:
+        logger.debug('async def check_tomorrow: Sending requested information')
+
+        resort_object = snow_report.Resort(resort_key)
+        if not await resort_object.async_request_96hr():
+            await outbound.send(ctx.channel, f'Checking the weather for tomorrow at {resort_object.name}... please check your DM')
+            await send_forecast_failed(dmchannel, 'check_tomorrow', resort_object)
+            return
+        tomorrow = resort_object.get_tomorrow_rollup()
+        resort_temp_tomorrow = tomorrow["temp_mean"]
+        resort_feelslike_tomorrow = tomorrow["feels_like_mean"]
+        resort_precipitation_tomorrow = tomorrow["precipitation"]
+        resort_precipitation_type_tomorrow = tomorrow["precipitation_types"]
+
+        await outbound.send(ctx.channel, f'Checking the weather for tomorrow at {resort_object.name}... please check your DM')
+        await outbound.send(dmchannel, f'<{resort_object.name}> Temperature: {resort_temp_tomorrow} degrees C')           
+        await outbound.send(dmchannel, f'<{resort_object.name}> Feels like: {resort_feelslike_tomorrow} degrees C')         
+        await outbound.send(dmchannel, f'<{resort_object.name}> Total precipitation tomorrow: {resort_precipitation_tomorrow} mm')
+        await outbound.send(dmchannel, f'<{resort_object.name}> Precipitation types: {resort_precipitation_type_tomorrow}')
+
+    else: 
+        logger.debug('async def check_tomorrow: Error, cannot find %s', resort_key)
+        await outbound.send(ctx.channel, f'Checking weather.. please check your DM')
+        await outbound.send(dmchannel, f'Error, I cannot find the key "{resort_key}" in my database, please check the key and try again.')
 
 # Bot even tthat sends a DM to the new member when they join the server
 @bot.event
 async def on_member_join(member): 
-    logger.debug(f'async def on_member_join')
-    logger.debug(f'{member.name} has joined the server...')
-    logger.debug(f'{member.name} ID: {member.id}')    
-    logger.debug(f'Sending DM to {member.name}')
+    logger.debug('async def on_member_join')
+    logger.debug('%s has joined the server...', member.name)
+    logger.debug('%s ID: %s', member.name, member.id)    
+    logger.debug('Sending DM to %s', member.name)
     
     welcomeMessage = "Welcome to this server. Please reply with read the rules below and reply with '!accept' to join the server."
-    await member.send(content=welcomeMessage)
+    await outbound.send(member, welcomeMessage)
 
 #TODO: Create functions to check tomorrow's weather, precipitation, feels like... etc. 
 
@@ -584,70 +1131,220 @@ async def on_member_join(member):
 
 # Set up AWS S3 Client with central Canada region
 # S3 allows us to store files in the cloud
-# This function runs the AWS S3 client
-s3 = boto3.client('s3', region_name='ca-central-1', aws_access_key_id=ACCESS_KEY, aws_secret_access_key=SECRET_KEY)
+# boto3 is slow to import, so it is imported and the client is created the first time the client is used
 bucket_name = 'roasteddiscordbot-log-bucket'
 location = {'LocationConstraint': 'ca-central-1'}
 
+_s3 = None
+_s3_lock = threading.Lock()
+
+# This function returns the AWS S3 client
+def get_s3():
+    global _s3
+    if _s3 is None:
+        with _s3_lock:
+            if _s3 is None:
+                import boto3
+                _s3 = boto3.client('s3', region_name='ca-central-1', aws_access_key_id=ACCESS_KEY, aws_secret_access_key=SECRET_KEY)
+    return _s3
+
 def run_s3():
-    logger.debug(f'Accessing AWS S3 service')
+    logger.debug('Accessing AWS S3 service')
     print('------')
     print('Accessing AWS S3')
 
     try:
-        s3.create_bucket(Bucket=bucket_name, CreateBucketConfiguration=location)
-        logger.debug(f'Created s3 bucket')
+        get_s3().create_bucket(Bucket=bucket_name, CreateBucketConfiguration=location)
+        logger.debug('Created s3 bucket')
     except:
-        logger.debug(f's3 bucket exists')
+        logger.debug('s3 bucket exists')
         print('Successfully logged into AWS S3 bucket')
-            
-# ------------------------------------------------------------Timeloop------------------------------------------------------------
 
-# This function periodically sends logs to AWS (every 300 seconds)
-tl = Timeloop()
-@tl.job(interval=datetime.timedelta(seconds=300))
+# Number of bytes at the start of the log that identify it, if they change the log was truncated
+LOG_HEAD_BYTES = 1024
+
+# Returns True if every line of data was logged by housekeeping_logger, data ends with a newline
+def housekeeping_only(data):
+    start = 0
+    while start < len(data):
+        end = data.find(b'\n', start)
+        if data.find(HOUSEKEEPING_MARKER, start, end) == -1:
+            return False
+        start = end + 1
+    return True
+
+# Uploads the log to S3 in gzip compressed segments that only hold the lines added since the last upload, client defaults to get_s3()
+# Every segment is added to the s3_logs.csv manifest as [upload time, object name, session, start offset, end offset]
+# A session is one run of the log file, a new session starts from offset 0 when the log is truncated (the bot opens it with mode='w')
+# or replaced by a new file
+class LogShipper():
+    def __init__(self, path, bucket, manifest_path, client=None):
+        self.path = path
+        self.bucket = bucket
+        self.client = client
+        self.manifest_path = manifest_path
+        self.session = None
+        self.session_time = None
+        self.session_repeat = 0
+        self.identity = None
+        self.head = None
+        self.offset = 0
+        self.segment = 0
+
+    def new_session(self, identity, now):
+        session_time = now.strftime("%d/%m/%Y %H:%M:%S").replace('/','-').replace(' ', '-').replace(':','.')
+        # A session started in the same second as the previous one gets a number, otherwise its segments would replace the previous ones
+        if self.session is not None and self.session_time == session_time:
+            self.session_repeat += 1
+            self.session = f'{session_time}-{self.session_repeat}_discord.log'
+        else:
+            self.session_repeat = 0
+            self.session = session_time + '_' + 'discord.log'
+        self.session_time = session_time
+        self.identity = identity
+        self.head = None
+        self.offset = 0
+        self.segment = 0
+        housekeeping_logger.debug('LogShipper.new_session: %s', self.session)
+
+    # Uploads the complete lines added to the log since the last upload, returns the name of the segment or None if nothing was added
+    def ship(self):
+        now = datetime.datetime.now()
+
+        with open(self.path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            identity = (stat.st_dev, stat.st_ino)
+
+            if stat.st_size == 0:
+                return None
+
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as log_map:
+                if identity != self.identity or stat.st_size < self.offset:
+                    self.new_session(identity, now)
+                elif self.head is not None and hashlib.sha1(log_map[:min(LOG_HEAD_BYTES, self.offset)]).hexdigest() != self.head:
+                    self.new_session(identity, now)
+
+                # Only whole lines are uploaded, the rest of a line that is being written goes in the next segment
+                end = log_map.rfind(b'\n', self.offset, stat.st_size) + 1
+                if end <= self.offset:
+                    housekeeping_logger.debug('LogShipper.ship: no new lines in %s, skipping upload', self.path)
+                    return None
+
+                data = log_map[self.offset:end]
+                # The housekeeping lines stay in the log and are uploaded with the next lines of the bot
+                if housekeeping_only(data):
+                    return None
+                if self.head is None or self.offset < LOG_HEAD_BYTES:
+                    self.head = hashlib.sha1(log_map[:min(LOG_HEAD_BYTES, end)]).hexdigest()
+
+        start = self.offset
+        segment_name = f'{self.session}/{self.segment:06d}.gz'
+        client = get_s3() if self.client is None else self.client
+        client.put_object(Bucket=self.bucket, Key=segment_name, Body=gzip.compress(data), ContentType='text/plain', ContentEncoding='gzip')
+        housekeeping_logger.debug('LogShipper.ship: sent %s bytes %s-%s', segment_name, start, end)
+
+        # Adds the segment to a local csv file with the date and time it was uploaded and the part of the log it holds
+        with open(self.manifest_path, "a+", newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow([now.strftime("%d/%m/%Y %H:%M:%S"), segment_name, self.session, start, end])
+
+        self.offset = end
+        self.segment += 1
+        return segment_name
+
+log_shipper = LogShipper(os.path.join(D_NAME, 'discord.log'), bucket_name, os.path.join(D_NAME, 's3_logs.csv'))
+
+# ------------------------------------------------------------runtime------------------------------------------------------------
+
+# Seconds between uploads of the log to AWS S3
+LOG_SHIP_INTERVAL = 300
+
+# Uploads of the log are run one at a time, the final upload at shutdown waits for a periodic one that is running
+ship_lock = asyncio.Lock()
+
+# This function sends the lines added to the log since the last upload to AWS S3
 def send_log_60s():
+    # Only the lines added since the last upload are sent, nothing is sent if the log did not change
+    segment_name = log_shipper.ship()
+    if segment_name is not None:
+        print(f'-----------Sent log segment {segment_name} to AWS S3-----------')
+
+# boto3 calls block, so they are run in the default executor instead of on the event loop
+async def ship_logs():
+    async with ship_lock:
+        # Makes sure the records logged so far are in discord.log before it is read
+        await bot.loop.run_in_executor(None, log_writer.sync)
+        await bot.loop.run_in_executor(None, send_log_60s)
+
+# This background task periodically sends logs to AWS (every LOG_SHIP_INTERVAL seconds)
+async def ship_logs_periodically():
+    while True:
+        await asyncio.sleep(LOG_SHIP_INTERVAL)
+        try:
+            await ship_logs()
+        except Exception:
+            logger.exception('Sending log to AWS S3 failed')
+
+# This function runs the bot, the AWS S3 bucket set up and the periodic log uploads in one event loop
+# SIGINT and SIGTERM close the bot, then the background tasks are stopped and the rest of the log is uploaded
+async def main():
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        try:
+            bot.loop.add_signal_handler(signal_number, lambda: asyncio.ensure_future(bot.close()))
+        except NotImplementedError:
+            # Signal handlers are not supported by the event loop on Windows, Ctrl+C raises KeyboardInterrupt instead
+            pass
+
+    background_tasks = [
+        bot.loop.run_in_executor(None, run_s3),
+        asyncio.ensure_future(ship_logs_periodically()),
+        asyncio.ensure_future(outbound.log_metrics_periodically()),
+    ]
 
-    # Creating the string for the log file name, this is unique to the time
-    now = datetime.datetime.now()
-    dt_string = now.strftime("%d/%m/%Y %H:%M:%S")
-    dt_string_f = now.strftime("%d/%m/%Y %H:%M:%S").replace('/','-').replace(' ', '-').replace(':','.')
-    log_name = dt_string_f + '_' + 'discord.log'
-    
-    logger.debug(f'-----------Sending log {log_name} to AWS S3-----------')
-    print(f'-----------Sending log {log_name} to AWS S3-----------')
-    s3.upload_file('discord.log', bucket_name, log_name)
-
-    os.chdir(D_NAME)
-
-    # Adds the name of the uploaded discord log to a local csv file and the corresponding date and time
-    with open("s3_logs.csv", "a+", newline='') as f:
-        writer = csv.writer(f)
-        writer.writerow([dt_string, log_name])
-    
-
-# This function runs the timeloop necessary to periodically load logs onto AWS S3
-def timeloop():
-    logger.debug(f'Starting up timeloop to send logs to AWS S3')
-    tl.start(block=True)
-    print(f'Starting up timeloop to periodically send logs to AWS S3 \n')
+    try:
+        logger.debug('Starting discord bot client')
+        await bot.start(TOKEN)
+    finally:
+        logger.debug('Shutting down, sending the rest of the log to AWS S3')
+        for task in background_tasks:
+            task.cancel()
+        await asyncio.gather(*background_tasks, return_exceptions=True)
+        await outbound.close()
+        outbound.log_metrics()
+
+        if not bot.is_closed():
+            await bot.close()
+
+        try:
+            await ship_logs()
+        except Exception:
+            logger.exception('Sending log to AWS S3 failed')
+
+        log_writer.stop()
 
  #  This function starts the discord client
 def run_bot():
-    logger.debug(f'Starting discord bot client')
-    bot.run(TOKEN)
+    try:
+        bot.loop.run_until_complete(main())
+    finally:
+        bot.loop.close()
+
+# This function runs the initialization that is otherwise done on first use, then prints the startup profile and exits
+def profile_startup():
+    with startup_profiler.phase('load skiResorts.json'):
+        snow_report.registry.refresh(force=True)
+    with startup_profiler.phase('build resort index'):
+        snow_report.resort_index.rebuild_if_needed()
+    with startup_profiler.phase('load snow_report settings'):
+        snow_report.settings()
+    with startup_profiler.phase('create S3 client'):
+        get_s3()
+
+    log_writer.stop()
+    sys.exit(0 if startup_profiler.report(startup_budget()) else 1)
 
 # Main function
 if __name__ == "__main__":
-    p1 = Process(target=run_bot)
-    p2 = Process(target=run_s3)
-    p3 = Process(target=timeloop)
-
-    p1.start()
-    p2.start()
-    p3.start()
-
-    p1.join()
-    p2.join()
-    p3.join()
-
+    if PROFILE_STARTUP:
+        profile_startup()
+    run_bot()
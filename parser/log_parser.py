@@ -1,11 +1,27 @@
 #!/usr/bin/env python3
 
-import boto3
+import argparse
+from array import array
+import calendar
+from collections import Counter, deque
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import csv
+import datetime
+import enum
+import gzip
+import hashlib
+import heapq
+import io
+import json
 import logging
+import mmap
+import numpy as np
 import os
 import re
 import sys
+import tempfile
+import time
 
 # Sets up where the files will be
 ABS_PATH = os.path.abspath(__file__)
@@ -33,14 +49,1078 @@ logger.debug(f'ABS_PATH: {ABS_PATH}')
 logger.debug(f'D_NAME: {D_NAME}')
 logger.debug(f'Current Directory: {current_dir}')
 
-# ------------------------------------------------------------regex functions------------------------------------------------------------
-# argument for variable log_file is a string of the log file
+# ------------------------------------------------------------log ingestion------------------------------------------------------------
+
+# Size of the chunks read by iter_buffer_lines(), memory use is bounded by this plus the length of the longest line
+READ_CHUNK_SIZE = 1024 * 1024
+
+# This method yields the lines of an iterable of byte chunks, decoded and without line endings. Lines can span several chunks
+def iter_chunk_lines(chunks):
+    remainder = b''
+
+    for chunk in chunks:
+        lines = (remainder + chunk).split(b'\n')
+        remainder = lines.pop()
+        for line in lines:
+            yield line.rstrip(b'\r').decode('utf-8', errors='replace')
+
+    if remainder:
+        yield remainder.rstrip(b'\r').decode('utf-8', errors='replace')
+
+# This method yields the bytes of a buffer (bytes or mmap) between the byte offsets start and end in chunks of chunk_size
+def iter_buffer_chunks(buffer, start=0, end=None, chunk_size=READ_CHUNK_SIZE):
+    end = len(buffer) if end is None else min(end, len(buffer))
+    position = start
+
+    while position < end:
+        chunk = buffer[position:min(position + chunk_size, end)]
+        position += len(chunk)
+        yield chunk
+
+# This method yields the lines of a buffer (bytes or mmap) between the byte offsets start and end, decoded and without line endings
+# Only one chunk of the buffer is copied at a time, so an mmap'd file is read in constant memory
+def iter_buffer_lines(buffer, start=0, end=None, chunk_size=READ_CHUNK_SIZE):
+    return iter_chunk_lines(iter_buffer_chunks(buffer, start, end, chunk_size))
+
+# This method is a generator of the lines of a log file, the file is memory mapped and read in chunks
+# start and end are byte offsets, by default the whole file is read
+def read_log_lines(path, start=0, end=None, chunk_size=READ_CHUNK_SIZE):
+    with open(path, 'rb') as f:
+        # mmap cannot map an empty file
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as log_map:
+            yield from iter_buffer_lines(log_map, start, end, chunk_size)
+
+# This method turns any of the accepted log sources into an iterable of lines:
+#   - str: the contents of the log file
+#   - os.PathLike (e.g. pathlib.Path): the path of a log file, it is streamed with read_log_lines()
+#   - bytes, bytearray or mmap: the contents of the log file as a buffer
+#   - any other iterable of lines, e.g. an open file or a generator
+def iter_log_lines(log_file):
+    if isinstance(log_file, str):
+        return (line.rstrip('\n') for line in io.StringIO(log_file))
+    if isinstance(log_file, os.PathLike):
+        return read_log_lines(log_file)
+    if isinstance(log_file, (bytes, bytearray, mmap.mmap)):
+        return iter_buffer_lines(log_file)
+    return (line.rstrip('\r\n') for line in log_file)
+
+# ------------------------------------------------------------log analysis------------------------------------------------------------
+
+# Every line written by older versions of the bot logger starts with this header: "<asctime>:<levelname>:<logger name>: <message>"
+# Lines that do not match are continuation lines of a message that contained new lines
+LINE_HEADER = re.compile(r'(\d\d\d\d-\d\d-\d\d \d\d:\d\d:\d\d,\d\d\d):([A-Z]+):([^:\s]+): (.*)')
+
+# The bot now writes one JSON object per line with the fields time, level, logger, handler and message, the time is in the asctime format
+# This method returns (time, level, logger name, message) of a line in either format, or None for a continuation line
+def parse_line_header(line):
+    if line.startswith('{'):
+        try:
+            entry = json.loads(line)
+            header = (entry["time"], entry["level"], entry["logger"], entry["message"])
+        except (ValueError, KeyError, TypeError):
+            return None
+        return header if all(isinstance(field, str) for field in header) else None
+
+    header = LINE_HEADER.match(line)
+    return None if header is None else header.groups()
+
+# The message of the bot log lines starts with the name of the handler that wrote it, "async def <handler>: <details>"
+HANDLER_TOKEN = re.compile(r'async (?:def )?(\w+)(?:: ?(.*))?')
+
+# Details of a command line, 'Command ("!<command> <arguments>"): Author (<author>): Channel: (<channel>)'
+COMMAND_DETAILS = re.compile(r'Command \("!(\S+)(?: (.*?))?"\): Author \((.*?)\): Channel: \((.*)\)')
+
+# Details of a message line, 'Detected message sent by <author>: Message Content: "<content>"'
+MESSAGE_DETAILS = re.compile(r'Detected message sent by (.*?): Message Content: "(.*)')
+
+USER_NAME = re.compile(r'[a-zA-Z0-9]{2,32}#\d\d\d\d')
+
+BOT_USER = 'RoastedBot#1314'
+ACCEPT_FAIL_CONTENT = 'Invalid command, please !accept the rules."'
+HELP_TEXT = 'Type !help command for more info on a command.'
+SENDING_RESORT_DATA = 'Sending data for resort '
+
+# Commands that take a resort key as their argument
+RESORT_COMMANDS = {'checksnow', 'checktemp', 'checkfeelslike', 'checktomorrowtemp', 'checktomorrowfeelslike', 'checktomorrowprecipitation', 'checktomorrow'}
+
+# The regional reports log one "Sending data for resort" line per resort, these are indexed under the command that was used
+SNOW_REPORT_HANDLERS = {'canada_snow_report': 'canadasnow', 'USA_snow_report': 'USAsnow'}
+
+# Commands that check a resort for snow, used by resort_has_snow_count()
+SNOW_COMMANDS = ('checksnow', 'canadasnow', 'USAsnow')
+
+# The seconds of the last timestamp converted by log_timestamp(), most lines are in the same second as the line before
+_last_second_text = None
+_last_second = None
+
+# This method converts a log timestamp "YYYY-MM-DD HH:MM:SS,mmm" to seconds since the epoch
+# The log is written in the local time of the bot without a timezone, the timestamps are treated as UTC so they are not shifted
+def log_timestamp(text):
+    global _last_second_text, _last_second
+
+    second_text = text[:19]
+    if second_text != _last_second_text:
+        _last_second = calendar.timegm((int(text[0:4]), int(text[5:7]), int(text[8:10]), int(text[11:13]), int(text[14:16]), int(text[17:19])))
+        _last_second_text = second_text
+
+    return _last_second + int(text[20:23]) / 1000
+
+# Counters of every statistic the functions below return, filled in by reading the log one line at a time
+# Each line is parsed with parse_line_header() once and dispatched on its handler, so a whole report is a single pass over the log
+# The per resort and per author statistics are kept as inverted indexes of timestamps, built in the same pass
+class LogAnalysis():
+    def __init__(self):
+        self.lines = 0
+        self.messages = 0
+        self.bot_messages = 0
+        self.accept_fail = 0
+        self.accept_dm = 0
+        self.hello = 0
+        self.bye = 0
+        self.member_joins = 0
+        self.help = 0
+        # command name: number of times it was used
+        self.commands = Counter()
+        # resort key: {command name: array of the timestamps the command was used for that resort}
+        self.resort_index = {}
+        # message author: array of the timestamps of their messages
+        self.author_index = {}
+        # timestamps of every message, every use of each command and every member join, used by the usage histograms
+        self.message_times = array('d')
+        self.command_times = {}
+        self.join_times = array('d')
+        self.users = set()
+
+        self.dispatch = {
+            'on_message': self.on_message,
+            'on_member_join': self.on_member_join,
+            'canada_snow_report': self.snow_report,
+            'USA_snow_report': self.snow_report,
+        }
+
+    # Reads an iterable of log lines
+    def feed(self, lines):
+        for line in lines:
+            self.feed_line(line)
+        return self
+
+    def feed_line(self, line):
+        self.lines += 1
+
+        if HELP_TEXT in line:
+            self.help += 1
+        if '#' in line:
+            self.users.update(USER_NAME.findall(line))
+
+        header = parse_line_header(line)
+        if header is None:
+            return
+
+        token = HANDLER_TOKEN.match(header[3])
+        if token is None:
+            return
+
+        timestamp = header[0]
+        handler, details = token.groups()
+        details = details or ''
+
+        if details.startswith('Command ('):
+            self.on_command(timestamp, details)
+
+        handler_function = self.dispatch.get(handler)
+        if handler_function is not None:
+            handler_function(timestamp, handler, details)
+
+    def index_resort(self, resort_key, command, timestamp):
+        commands = self.resort_index.setdefault(resort_key, {})
+        commands.setdefault(command, array('d')).append(log_timestamp(timestamp))
+
+    def on_command(self, timestamp, details):
+        command = COMMAND_DETAILS.match(details)
+        if command is None:
+            return
+
+        name, argument, author, channel = command.groups()
+        self.commands[name] += 1
+        self.command_times.setdefault(name, array('d')).append(log_timestamp(timestamp))
+
+        if name in RESORT_COMMANDS and argument:
+            self.index_resort(argument, name, timestamp)
+        if name == 'accept' and channel.startswith('Direct Message with'):
+            self.accept_dm += 1
+
+    def on_message(self, timestamp, handler, details):
+        if details.startswith('Detected message sent by '):
+            message = MESSAGE_DETAILS.match(details)
+            if message is None:
+                return
+
+            author, content = message.groups()
+            message_time = log_timestamp(timestamp)
+            self.messages += 1
+            self.message_times.append(message_time)
+            self.author_index.setdefault(author, array('d')).append(message_time)
+
+            if author == BOT_USER:
+                self.bot_messages += 1
+                if content.startswith(ACCEPT_FAIL_CONTENT):
+                    self.accept_fail += 1
+
+        elif details == 'Message Content "Hello"':
+            self.hello += 1
+        elif details == 'Message Content "Bye"':
+            self.bye += 1
+
+    def on_member_join(self, timestamp, handler, details):
+        if details == '':
+            self.member_joins += 1
+            self.join_times.append(log_timestamp(timestamp))
+
+    def snow_report(self, timestamp, handler, details):
+        if details.startswith(SENDING_RESORT_DATA):
+            self.index_resort(details[len(SENDING_RESORT_DATA):], SNOW_REPORT_HANDLERS[handler], timestamp)
+
+    # Returns the number of times a resort was used by the given commands, or by any command if commands is None
+    def resort_count(self, resort_key, commands=None):
+        resort_commands = self.resort_index.get(resort_key, {})
+        if commands is None:
+            return sum(len(timestamps) for timestamps in resort_commands.values())
+        return sum(len(resort_commands.get(command, ())) for command in commands)
+
+    # Returns the number of messages sent by an author
+    def author_count(self, author):
+        return len(self.author_index.get(author, ()))
+
+    # Returns the counters as a dictionary that can be saved as json. The timestamp indexes are not part of it, see time_series()
+    def to_dict(self):
+        return {
+            "lines": self.lines,
+            "messages": self.messages,
+            "bot_messages": self.bot_messages,
+            "accept_fail": self.accept_fail,
+            "accept_dm": self.accept_dm,
+            "hello": self.hello,
+            "bye": self.bye,
+            "member_joins": self.member_joins,
+            "help": self.help,
+            "commands": dict(self.commands),
+            "users": sorted(self.users),
+        }
+
+    # Returns {series key: array of timestamps} of every timestamp index, the keys are tuples of strings:
+    #   ('message',), ('join',), ('resort', resort key, command), ('author', author), ('command', command)
+    def time_series(self):
+        series = {('message',): self.message_times, ('join',): self.join_times}
+        for resort_key, commands in self.resort_index.items():
+            for command, timestamps in commands.items():
+                series[('resort', resort_key, command)] = timestamps
+        for author, timestamps in self.author_index.items():
+            series[('author', author)] = timestamps
+        for command, timestamps in self.command_times.items():
+            series[('command', command)] = timestamps
+        return series
+
+    # Returns the array of timestamps of a key returned by time_series(), it is created if the index does not have it yet
+    def series(self, key):
+        kind = key[0]
+        if kind == 'message':
+            return self.message_times
+        if kind == 'join':
+            return self.join_times
+        if kind == 'resort':
+            return self.resort_index.setdefault(key[1], {}).setdefault(key[2], array('d'))
+        if kind == 'author':
+            return self.author_index.setdefault(key[1], array('d'))
+        return self.command_times.setdefault(key[1], array('d'))
+
+    # The dispatch table holds bound methods, it is rebuilt when an analysis is unpickled (it is returned by the worker processes)
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        del state["dispatch"]
+        return state
+
+    def __setstate__(self, state):
+        self.__init__()
+        self.__dict__.update(state)
+
+    # Adds the counters of another LogAnalysis to this one, used to combine the analyses of parts of a log
+    # other must come after this analysis in the log so the timestamps in the indexes stay in order
+    def merge(self, other):
+        for name in ("lines", "messages", "bot_messages", "accept_fail", "accept_dm", "hello", "bye", "member_joins", "help"):
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+        self.commands.update(other.commands)
+        for resort_key, commands in other.resort_index.items():
+            for command, timestamps in commands.items():
+                self.resort_index.setdefault(resort_key, {}).setdefault(command, array('d')).extend(timestamps)
+        for author, timestamps in other.author_index.items():
+            self.author_index.setdefault(author, array('d')).extend(timestamps)
+        self.message_times.extend(other.message_times)
+        for command, timestamps in other.command_times.items():
+            self.command_times.setdefault(command, array('d')).extend(timestamps)
+        self.join_times.extend(other.join_times)
+        self.users.update(other.users)
+        return self
+
+    # Creates a LogAnalysis from a dictionary returned by to_dict(), the timestamp indexes are empty
+    @classmethod
+    def from_dict(cls, state):
+        analysis = cls()
+        for name in ("lines", "messages", "bot_messages", "accept_fail", "accept_dm", "hello", "bye", "member_joins", "help"):
+            setattr(analysis, name, state[name])
+        analysis.commands = Counter(state["commands"])
+        analysis.users = set(state["users"])
+        return analysis
+
+# The analysis of the last stream read is kept, a stream can only be read once so passing it to several of the functions below
+# reuses the analysis of the first call. Paths, strings and buffers can change between calls and are read again every time,
+# pass the LogAnalysis returned by analyze_log() to read them only once
+_last_log_file = None
+_last_analysis = None
+
+# This method returns the LogAnalysis of a log, log_file can be a LogAnalysis or any of the sources accepted by iter_log_lines()
+def analyze_log(log_file):
+    global _last_log_file, _last_analysis
+
+    if isinstance(log_file, LogAnalysis):
+        return log_file
+    if isinstance(log_file, EventStore):
+        return log_file.to_analysis()
+    if log_file is _last_log_file:
+        return _last_analysis
+
+    analysis = LogAnalysis().feed(iter_log_lines(log_file))
+    logger.debug(f'def analyze_log: read {analysis.lines} lines')
+
+    # Generators and file objects are iterators, they are the only sources that cannot be read again
+    if isinstance(log_file, Iterator):
+        _last_log_file = log_file
+        _last_analysis = analysis
+    return analysis
+
+# ------------------------------------------------------------incremental analysis------------------------------------------------------------
+
+# Number of bytes at the start of the log that are hashed to recognise the file, see LogTail
+CHECKPOINT_HEAD_BYTES = 1024
+
+# Rows of the timestamp file of a checkpoint, the id of the series (its position in the "series" list of the checkpoint) and the timestamp
+CHECKPOINT_TIMES_DTYPE = np.dtype([('series', '<u4'), ('time', '<f8')])
+
+# Incremental analysis of a log file that keeps growing. The checkpoint stores the identity of the file, the byte offset that has been
+# read up to and the counters, so each update only reads the lines added since the last one. Lines are only read once they are complete.
+# The timestamp indexes are appended to <checkpoint>.times, each update only writes the timestamps of the lines it read.
+# The checkpoint records the number of rows of that file, rows written after it by an update that did not finish are ignored
+# The file is read from the start again when it was:
+#   - rotated: the device or inode of the path changed
+#   - truncated: it is smaller than the offset, or its first bytes changed. The bot opens discord.log with mode='w' so this happens on every restart
+# The counters are kept when that happens, so they add up every run of the bot
+class LogTail():
+    def __init__(self, path, checkpoint_path=None):
+        self.path = path
+        self.checkpoint_path = checkpoint_path
+        self.device = None
+        self.inode = None
+        self.offset = 0
+        self.head = None
+        self.analysis = LogAnalysis()
+        self.times_path = checkpoint_path + '.times' if checkpoint_path is not None else None
+        # series key: id, in the order they were first saved
+        self.series_ids = {}
+        # series key: number of its timestamps in the times file
+        self.saved_lengths = {}
+        self.times_rows = 0
+
+        if checkpoint_path is not None and os.path.exists(checkpoint_path):
+            self.load()
+
+    def load(self):
+        with open(self.checkpoint_path, 'r', encoding='utf-8') as f:
+            checkpoint = json.load(f)
+
+        self.device = checkpoint["device"]
+        self.inode = checkpoint["inode"]
+        self.offset = checkpoint["offset"]
+        self.head = checkpoint["head"]
+        self.analysis = LogAnalysis.from_dict(checkpoint["analysis"])
+
+        keys = [tuple(key) for key in checkpoint.get("series", [])]
+        self.series_ids = {key: series_id for series_id, key in enumerate(keys)}
+        self.times_rows = checkpoint.get("times_rows", 0)
+        rows = np.fromfile(self.times_path, dtype=CHECKPOINT_TIMES_DTYPE, count=self.times_rows) if self.times_rows else np.empty(0, dtype=CHECKPOINT_TIMES_DTYPE)
+
+        # A stable sort keeps the timestamps of each series in the order they were appended
+        order = np.argsort(rows['series'], kind='stable')
+        series_ids = rows['series'][order]
+        times = rows['time'][order]
+        boundaries = np.flatnonzero(np.diff(series_ids)) + 1
+        for group in np.split(np.arange(series_ids.size), boundaries):
+            if group.size:
+                self.analysis.series(keys[series_ids[group[0]]]).frombytes(times[group].tobytes())
+        self.saved_lengths = {key: len(timestamps) for key, timestamps in self.analysis.time_series().items()}
+        logger.debug(f'LogTail.load: {self.checkpoint_path} offset: {self.offset} timestamps: {self.times_rows}')
+
+    # Appends the timestamps added since the last save to the times file, returns the number of rows in the file
+    def append_times(self):
+        new_rows = []
+        for key, timestamps in self.analysis.time_series().items():
+            saved = self.saved_lengths.get(key, 0)
+            if len(timestamps) > saved:
+                rows = np.empty(len(timestamps) - saved, dtype=CHECKPOINT_TIMES_DTYPE)
+                rows['series'] = self.series_ids.setdefault(key, len(self.series_ids))
+                rows['time'] = np.frombuffer(timestamps, dtype=np.float64)[saved:]
+                new_rows.append(rows)
+                self.saved_lengths[key] = len(timestamps)
+
+        if not new_rows and os.path.exists(self.times_path):
+            return self.times_rows
+
+        with open(self.times_path, 'ab') as f:
+            # Rows after the ones recorded in the checkpoint were written by an update that did not finish
+            f.truncate(self.times_rows * CHECKPOINT_TIMES_DTYPE.itemsize)
+            for rows in new_rows:
+                f.write(rows.tobytes())
+        return self.times_rows + sum(len(rows) for rows in new_rows)
+
+    # Writes the checkpoint to a temporary file and renames it, so a crash never leaves a half written checkpoint
+    def save(self):
+        if self.checkpoint_path is None:
+            return
+
+        times_rows = self.append_times()
+        checkpoint = {
+            "path": os.path.abspath(self.path),
+            "device": self.device,
+            "inode": self.inode,
+            "offset": self.offset,
+            "head": self.head,
+            "analysis": self.analysis.to_dict(),
+            "series": [list(key) for key in self.series_ids],
+            "times_rows": times_rows,
+        }
+
+        directory = os.path.dirname(os.path.abspath(self.checkpoint_path))
+        with tempfile.NamedTemporaryFile('w', dir=directory, suffix='.tmp', delete=False, encoding='utf-8') as f:
+            json.dump(checkpoint, f)
+            temp_path = f.name
+        os.replace(temp_path, self.checkpoint_path)
+        self.times_rows = times_rows
+
+    # Reads the lines added since the last update, returns the number of lines read
+    def update(self):
+        with open(self.path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            size = stat.st_size
+
+            if size == 0:
+                return 0
+
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as log_map:
+                head = hashlib.sha1(log_map[:min(CHECKPOINT_HEAD_BYTES, self.offset)]).hexdigest()
+
+                if (stat.st_dev, stat.st_ino) != (self.device, self.inode):
+                    logger.debug(f'LogTail.update: {self.path} is a new file, reading from the start')
+                    self.offset = 0
+                elif size < self.offset or head != self.head:
+                    logger.debug(f'LogTail.update: {self.path} was truncated, reading from the start')
+                    self.offset = 0
+
+                self.device, self.inode = stat.st_dev, stat.st_ino
+
+                # Only complete lines are read, the rest is read by the next update
+                end = log_map.rfind(b'\n', self.offset, size) + 1
+                if end <= self.offset:
+                    self.head = hashlib.sha1(log_map[:min(CHECKPOINT_HEAD_BYTES, self.offset)]).hexdigest()
+                    return 0
+
+                lines_before = self.analysis.lines
+                self.analysis.feed(iter_buffer_lines(log_map, self.offset, end))
+                self.offset = end
+                self.head = hashlib.sha1(log_map[:min(CHECKPOINT_HEAD_BYTES, self.offset)]).hexdigest()
+
+        self.save()
+        new_lines = self.analysis.lines - lines_before
+        logger.debug(f'LogTail.update: read {new_lines} new lines, offset: {self.offset}')
+        return new_lines
+
+    # Keeps the counters live as lines are added to the log, yields the LogAnalysis every time new lines were read
+    def follow(self, interval=1.0):
+        while True:
+            try:
+                new_lines = self.update()
+            except FileNotFoundError:
+                new_lines = 0
+
+            if new_lines:
+                yield self.analysis
+            time.sleep(interval)
+
+# This method updates the checkpoint of a log file with the lines added since the last run and returns the LogAnalysis of the whole log
+def incremental_analysis(path, checkpoint_path):
+    tail = LogTail(path, checkpoint_path)
+    tail.update()
+    return tail.analysis
+
+# ------------------------------------------------------------time range queries------------------------------------------------------------
+
+# Matches the timestamp at the start of a log entry, in a text line or a JSON line (the bot writes the time field first)
+# Lines that do not start with one are the continuation of a multi-line entry
+ENTRY_TIMESTAMP = re.compile(rb'(?:\{"time": ")?(\d\d\d\d-\d\d-\d\d \d\d:\d\d:\d\d,\d\d\d)')
+
+# This method converts the bounds of a time range to the timestamp format of the log, as bytes so they compare with the mmap directly
+#   - str: a timestamp in the log format, or a prefix of one such as "2021-02-19 17:00"
+#   - datetime: formatted as it is, without timezone conversion
+#   - int or float: seconds since the epoch, formatted in UTC like log_timestamp()
+def timestamp_bytes(value):
+    if isinstance(value, datetime.datetime):
+        value = value.strftime('%Y-%m-%d %H:%M:%S,') + f'{value.microsecond // 1000:03d}'
+    elif isinstance(value, (int, float)):
+        value = time.strftime('%Y-%m-%d %H:%M:%S,', time.gmtime(int(value))) + f'{int(round(value % 1 * 1000)) % 1000:03d}'
+    return value.encode('ascii')
+
+# Returns the offset of the first log entry that starts at or after position, or end if there is none
+def next_entry(buffer, position, end):
+    while position < end:
+        if position > 0 and buffer[position - 1] != ord('\n'):
+            position = buffer.find(b'\n', position, end)
+            if position == -1:
+                return end
+            position += 1
+            continue
+
+        if ENTRY_TIMESTAMP.match(buffer, position):
+            return position
+        position = buffer.find(b'\n', position, end)
+        if position == -1:
+            return end
+        position += 1
+
+    return end
+
+# This method binary searches a buffer for the offset of the first log entry with a timestamp at or after target
+# The log is written in timestamp order, so only about log2(size) entries are read
+def find_time_offset(buffer, target, end=None):
+    end = len(buffer) if end is None else end
+    low, high = 0, end
+
+    while low < high:
+        middle = (low + high) // 2
+        entry = next_entry(buffer, middle, end)
+        if entry == end or ENTRY_TIMESTAMP.match(buffer, entry).group(1) >= target:
+            high = middle
+        else:
+            # Every position up to this entry finds the same entry
+            low = entry + 1
+
+    return next_entry(buffer, low, end)
+
+# Returns the byte offsets (start, end) of the log entries of a file from start up to but not including end, None bounds are open
+def time_range_offsets(path, start=None, end=None):
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return 0, 0
+
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as log_map:
+            start_offset = 0 if start is None else find_time_offset(log_map, timestamp_bytes(start))
+            end_offset = size if end is None else find_time_offset(log_map, timestamp_bytes(end))
+
+    logger.debug(f'def time_range_offsets: start: {start} end: {end} offsets: {start_offset}-{end_offset}')
+    return start_offset, max(start_offset, end_offset)
+
+# This method returns the LogAnalysis of the entries of a log file from start up to but not including end, e.g.
+#   query_time_range('discord.log', '2021-02-19 17:00', '2021-02-19 19:00')
+# Only the lines in the range are read, the rest of the file is skipped by binary searching the timestamps
+def query_time_range(path, start=None, end=None):
+    start_offset, end_offset = time_range_offsets(path, start, end)
+    analysis = LogAnalysis().feed(read_log_lines(path, start_offset, end_offset))
+    logger.debug(f'def query_time_range: read {analysis.lines} lines')
+    return analysis
+
+# ------------------------------------------------------------S3 archive------------------------------------------------------------
+
+# The bot uploads discord.log to this bucket every 300 seconds and adds a row for each upload to s3_logs.csv:
+#   - [upload time, object name]: a full copy of the log, written by older versions of the bot
+#   - [upload time, object name, session, start, end]: a gzip compressed segment holding bytes start to end of the log of a session
+S3_BUCKET_NAME = 'roasteddiscordbot-log-bucket'
+S3_REGION = 'ca-central-1'
+S3_MANIFEST = os.path.join(os.path.dirname(D_NAME), 'bot', 's3_logs.csv')
+MANIFEST_TIME_FORMAT = '%d/%m/%Y %H:%M:%S'
+
+# Number of snapshots downloaded at the same time, at most this many snapshots are held in memory
+ARCHIVE_DOWNLOAD_WORKERS = 8
+
+# Returns an S3 client for the archive, S3_ENDPOINT_URL can point it at a local S3 compatible server instead of AWS
+# boto3 is slow to import and only the archive needs it, so it is imported here
+def s3_client():
+    import boto3
+    return boto3.client(
+        's3',
+        region_name=S3_REGION,
+        endpoint_url=os.getenv('S3_ENDPOINT_URL'),
+        aws_access_key_id=os.getenv('AWS_ACCESS_KEY'),
+        aws_secret_access_key=os.getenv('AWS_SECRET_KEY'),
+    )
+
+# This method converts a bound of a date range to a datetime, strings are in ISO format e.g. "2021-02-19 17:00"
+def archive_time(value):
+    if value is None or isinstance(value, datetime.datetime):
+        return value
+    return datetime.datetime.fromisoformat(value)
+
+# Returns the rows of the s3_logs.csv manifest as a list of (upload time, object name, session) in upload order, session is None for full copies
+# Only the objects uploaded from start up to but not including end are returned, None bounds are open
+def read_manifest(manifest_path=S3_MANIFEST, start=None, end=None):
+    start, end = archive_time(start), archive_time(end)
+    snapshots = []
+
+    with open(manifest_path, 'r', newline='', encoding='utf-8') as f:
+        for row in csv.reader(f):
+            if len(row) < 2:
+                continue
+            uploaded = datetime.datetime.strptime(row[0], MANIFEST_TIME_FORMAT)
+            if (start is None or uploaded >= start) and (end is None or uploaded < end):
+                snapshots.append((uploaded, row[1], row[2] if len(row) >= 5 else None))
+
+    snapshots.sort(key=lambda snapshot: snapshot[0])
+    logger.debug(f'def read_manifest: {manifest_path} start: {start} end: {end} snapshots: {len(snapshots)}')
+    return snapshots
+
+def download_snapshot(client, bucket, object_name):
+    data = client.get_object(Bucket=bucket, Key=object_name)['Body'].read()
+    return gzip.decompress(data) if object_name.endswith('.gz') else data
+
+# This method is a generator of the contents of the objects, in the order of object_names
+# The objects are downloaded by a pool of threads, only `workers` downloads are ahead of the object being yielded
+def iter_snapshots(object_names, bucket=S3_BUCKET_NAME, client=None, workers=ARCHIVE_DOWNLOAD_WORKERS):
+    client = s3_client() if client is None else client
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for object_name in object_names:
+            pending.append(executor.submit(download_snapshot, client, bucket, object_name))
+            if len(pending) > workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+# This method is a generator of the bytes of the log in a sequence of (session, data) without the content the snapshots have in common
+# Each full copy is the log as it grew, so only what was added since the previous copy is yielded. A copy that does not start with
+# the previous one is a new log, the bot truncates discord.log when it restarts, and it is yielded whole
+# Segments (session is not None) only hold new bytes and are yielded as they are
+def dedupe_snapshots(snapshots):
+    previous = b''
+    ends_line = True
+
+    for session, snapshot in snapshots:
+        if session is None and previous and snapshot.startswith(previous):
+            chunk = snapshot[len(previous):]
+        else:
+            # Starts the new log on its own line if the previous one ended in the middle of a line
+            if not ends_line:
+                yield b'\n'
+            chunk = snapshot
+        previous = snapshot if session is None else b''
+
+        if chunk:
+            ends_line = chunk.endswith(b'\n')
+            yield chunk
+
+# This method returns the LogAnalysis of the snapshots in the manifest uploaded from start up to but not including end
+# client is an S3 client, by default one is created with s3_client()
+def analyze_archive(manifest_path=S3_MANIFEST, start=None, end=None, bucket=S3_BUCKET_NAME, client=None, workers=ARCHIVE_DOWNLOAD_WORKERS):
+    manifest = read_manifest(manifest_path, start, end)
+    object_names = [object_name for uploaded, object_name, session in manifest]
+    sessions = [session for uploaded, object_name, session in manifest]
+    chunks = dedupe_snapshots(zip(sessions, iter_snapshots(object_names, bucket, client, workers)))
+    analysis = LogAnalysis().feed(iter_chunk_lines(chunks))
+    logger.debug(f'def analyze_archive: snapshots: {len(object_names)} lines: {analysis.lines}')
+    return analysis
+
+# ------------------------------------------------------------parallel analysis------------------------------------------------------------
+
+# Number of byte ranges given to each worker process, more ranges than workers keeps the workers busy if some ranges are slower
+RANGES_PER_WORKER = 4
+
+# This method splits a file into `parts` byte ranges of about the same size, every range starts at the beginning of a line
+def split_log(path, parts):
+    size = os.path.getsize(path)
+    boundaries = [0]
+
+    with open(path, 'rb') as f:
+        for part in range(1, parts):
+            f.seek(max(part * size // parts, boundaries[-1]))
+            # Moves to the start of the next line, a range never splits a line
+            if f.tell() > 0:
+                f.readline()
+            boundaries.append(min(f.tell(), size))
+
+    boundaries.append(size)
+    return [(start, end) for start, end in zip(boundaries, boundaries[1:]) if end > start]
+
+# Analyses one byte range of a log file, this runs in a worker process and the LogAnalysis is pickled back
+def analyze_log_range(path, start, end):
+    return LogAnalysis().feed(read_log_lines(path, start, end))
+
+# This method analyses a log file with a pool of worker processes. The file is split into line aligned byte ranges,
+# each range is analysed in a worker and the partial counters (including the sets of users) are merged
+# workers defaults to the number of CPUs
+def analyze_log_parallel(path, workers=None):
+    workers = workers or os.cpu_count() or 1
+    ranges = split_log(path, workers * RANGES_PER_WORKER)
+    logger.debug(f'def analyze_log_parallel: {path} {len(ranges)} ranges, {workers} workers')
+
+    analysis = LogAnalysis()
+    if workers == 1:
+        return analysis.feed(read_log_lines(path))
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(analyze_log_range, path, start, end) for start, end in ranges]
+        for future in futures:
+            analysis.merge(future.result())
+
+    return analysis
+
+# This method writes a synthetic bot log of about size_bytes to path, used by benchmark()
+def write_synthetic_log(path, size_bytes):
+    block = []
+    for second in range(60):
+        timestamp = f'2021-02-19 10:00:{second:02d},000'
+        author = f'user{second % 7}#{1000 + second % 7}'
+        block.append(f'{timestamp}:DEBUG:__main__: async def on_message: Detected message sent by {author}: Message Content: "!checksnow whistler"')
+        block.append(f'{timestamp}:DEBUG:__main__: async check_4day_snow: Command ("!checksnow whistler"): Author ({author}): Channel: (general)')
+        block.append(f'{timestamp}:DEBUG:__main__: async def check_4day_snow: {author} role authorization successful')
+        block.append(f'{timestamp}:DEBUG:__main__: async def canada_snow_report: Sending data for resort sunshine')
+        block.append(f'{timestamp}:DEBUG:__main__: async def on_message: Detected message sent by {BOT_USER}: Message Content: "Invalid command, please !accept the rules."')
+    block = ('\n'.join(block) + '\n').encode('utf-8')
+
+    with open(path, 'wb') as f:
+        for _ in range(max(1, size_bytes // len(block))):
+            f.write(block)
+
+# This method times analyze_log() against analyze_log_parallel() on a synthetic log of size_mb megabytes
+def benchmark(size_mb, workers=None):
+    workers = workers or os.cpu_count() or 1
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'benchmark.log')
+        write_synthetic_log(path, size_mb * 1024 * 1024)
+        size_mb = os.path.getsize(path) / (1024 * 1024)
+
+        start = time.perf_counter()
+        serial = LogAnalysis().feed(read_log_lines(path))
+        serial_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        parallel = analyze_log_parallel(path, workers)
+        parallel_seconds = time.perf_counter() - start
+
+    if serial.to_dict() != parallel.to_dict() or serial.time_series() != parallel.time_series():
+        raise RuntimeError('benchmark: serial and parallel analyses do not match')
+
+    print(f'log size: {size_mb:.0f} MB, lines: {serial.lines}')
+    print(f'serial:   {serial_seconds:.2f} s ({size_mb / serial_seconds:.1f} MB/s)')
+    print(f'parallel: {parallel_seconds:.2f} s ({size_mb / parallel_seconds:.1f} MB/s) with {workers} workers')
+    print(f'speedup:  {serial_seconds / parallel_seconds:.2f}x')
+
+# ------------------------------------------------------------event store------------------------------------------------------------
+
+# Every event of the log is one row of the store, each column is a numpy array saved as <column>.npy in the store directory
+# Strings (handlers, commands, authors and resort keys) are interned, the columns hold their index in the lists saved in strings.json
+EVENT_STORE_STRINGS = 'strings.json'
+EVENT_STORE_VERSION = 1
+EVENT_STORE_COLUMNS = {
+    'timestamp': np.float64,
+    'event': np.uint8,
+    'handler': np.int32,
+    'command': np.int32,
+    'author': np.int32,
+    'resort': np.int32,
+    'channel': np.uint8,
+}
+
+# Index of the interned columns when the event has no value for them
+NO_VALUE = -1
+
+class EventType(enum.IntEnum):
+    MESSAGE = 1
+    # A message of the bot telling a user to !accept the rules, it is also counted as a message
+    ACCEPT_FAIL = 2
+    COMMAND = 3
+    # A resort sent by !canadasnow or !USAsnow, its command is the one that was used
+    RESORT_REPORT = 4
+    MEMBER_JOIN = 5
+    HELLO = 6
+    BYE = 7
+    # A line with the help text, it has the timestamp of the entry it is part of
+    HELP = 8
+
+class ChannelKind(enum.IntEnum):
+    NONE = 0
+    DM = 1
+    GUILD = 2
+
+# Reads the lines of a log like LogAnalysis but records every event as a row instead of counting them
+class EventStoreBuilder():
+    def __init__(self):
+        self.lines = 0
+        self.users = set()
+        self.last_timestamp = float('nan')
+        self.columns = {
+            'timestamp': array('d'),
+            'event': array('B'),
+            'handler': array('i'),
+            'command': array('i'),
+            'author': array('i'),
+            'resort': array('i'),
+            'channel': array('B'),
+        }
+        # column name: {string: index}
+        self.strings = {'handler': {}, 'command': {}, 'author': {}, 'resort': {}}
+
+        self.dispatch = {
+            'on_message': self.on_message,
+            'on_member_join': self.on_member_join,
+            'canada_snow_report': self.snow_report,
+            'USA_snow_report': self.snow_report,
+        }
+
+    def intern(self, column, value):
+        if value is None:
+            return NO_VALUE
+        strings = self.strings[column]
+        index = strings.get(value)
+        if index is None:
+            index = strings[value] = len(strings)
+        return index
+
+    def add(self, event, timestamp, handler=None, command=None, author=None, resort=None, channel=ChannelKind.NONE):
+        columns = self.columns
+        columns['timestamp'].append(timestamp)
+        columns['event'].append(event)
+        columns['handler'].append(self.intern('handler', handler))
+        columns['command'].append(self.intern('command', command))
+        columns['author'].append(self.intern('author', author))
+        columns['resort'].append(self.intern('resort', resort))
+        columns['channel'].append(channel)
+
+    def feed(self, lines):
+        for line in lines:
+            self.feed_line(line)
+        return self
+
+    def feed_line(self, line):
+        self.lines += 1
+
+        header = parse_line_header(line)
+        if header is not None:
+            self.last_timestamp = log_timestamp(header[0])
+
+        if HELP_TEXT in line:
+            self.add(EventType.HELP, self.last_timestamp)
+        if '#' in line:
+            self.users.update(USER_NAME.findall(line))
+
+        if header is None:
+            return
+
+        token = HANDLER_TOKEN.match(header[3])
+        if token is None:
+            return
+
+        handler, details = token.groups()
+        details = details or ''
+
+        if details.startswith('Command ('):
+            self.on_command(handler, details)
+
+        handler_function = self.dispatch.get(handler)
+        if handler_function is not None:
+            handler_function(handler, details)
+
+    def on_command(self, handler, details):
+        command = COMMAND_DETAILS.match(details)
+        if command is None:
+            return
+
+        name, argument, author, channel = command.groups()
+        resort = argument if name in RESORT_COMMANDS and argument else None
+        channel_kind = ChannelKind.DM if channel.startswith('Direct Message with') else ChannelKind.GUILD
+        self.add(EventType.COMMAND, self.last_timestamp, handler, name, author, resort, channel_kind)
+
+    def on_message(self, handler, details):
+        if details.startswith('Detected message sent by '):
+            message = MESSAGE_DETAILS.match(details)
+            if message is None:
+                return
+
+            author, content = message.groups()
+            event = EventType.ACCEPT_FAIL if author == BOT_USER and content.startswith(ACCEPT_FAIL_CONTENT) else EventType.MESSAGE
+            self.add(event, self.last_timestamp, handler, author=author)
+
+        elif details == 'Message Content "Hello"':
+            self.add(EventType.HELLO, self.last_timestamp, handler)
+        elif details == 'Message Content "Bye"':
+            self.add(EventType.BYE, self.last_timestamp, handler)
+
+    def on_member_join(self, handler, details):
+        if details == '':
+            self.add(EventType.MEMBER_JOIN, self.last_timestamp, handler)
+
+    def snow_report(self, handler, details):
+        if details.startswith(SENDING_RESORT_DATA):
+            self.add(EventType.RESORT_REPORT, self.last_timestamp, handler, SNOW_REPORT_HANDLERS[handler], resort=details[len(SENDING_RESORT_DATA):])
+
+    # Writes the columns and the interned strings to store_dir, strings.json is written last so a store without it is incomplete
+    def save(self, store_dir, source=None):
+        os.makedirs(store_dir, exist_ok=True)
+
+        for name, dtype in EVENT_STORE_COLUMNS.items():
+            np.save(os.path.join(store_dir, f'{name}.npy'), np.frombuffer(self.columns[name], dtype=dtype))
+
+        strings = {
+            "version": EVENT_STORE_VERSION,
+            "source": source,
+            "lines": self.lines,
+            "users": sorted(self.users),
+        }
+        for column, interned in self.strings.items():
+            strings[f'{column}s'] = list(interned)
+
+        directory = os.path.abspath(store_dir)
+        with tempfile.NamedTemporaryFile('w', dir=directory, suffix='.tmp', delete=False, encoding='utf-8') as f:
+            json.dump(strings, f)
+            temp_path = f.name
+        os.replace(temp_path, os.path.join(store_dir, EVENT_STORE_STRINGS))
+
+# This method compiles the log file at path into an event store in store_dir
+# The log is read with the regexes once, every later analysis of the store only filters its columns
+def compile_event_store(path, store_dir):
+    stat = os.stat(path)
+    builder = EventStoreBuilder().feed(read_log_lines(path))
+    builder.save(store_dir, {"path": os.path.abspath(path), "size": stat.st_size, "mtime": stat.st_mtime})
+    logger.debug(f'def compile_event_store: {store_dir} events: {len(builder.columns["event"])} lines: {builder.lines}')
+    return EventStore(store_dir)
+
+# A compiled event store, the columns are memory mapped read only so opening a store does not read it
+# Pass it to the counter functions in place of the log, they count with vectorized filters over the columns
+class EventStore():
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+
+        with open(os.path.join(store_dir, EVENT_STORE_STRINGS), 'r', encoding='utf-8') as f:
+            strings = json.load(f)
+        if strings["version"] != EVENT_STORE_VERSION:
+            raise ValueError(f'{store_dir} is an event store of version {strings["version"]}, expected {EVENT_STORE_VERSION}')
+
+        self.source = strings["source"]
+        self.lines = strings["lines"]
+        self.users = set(strings["users"])
+        self.strings = {column: strings[f'{column}s'] for column in ('handler', 'command', 'author', 'resort')}
+        self.indexes = {column: {value: index for index, value in enumerate(values)} for column, values in self.strings.items()}
+
+        for name in EVENT_STORE_COLUMNS:
+            setattr(self, name, np.load(os.path.join(store_dir, f'{name}.npy'), mmap_mode='r'))
+
+        self._analysis = None
+
+    def __len__(self):
+        return len(self.event)
+
+    # Returns a boolean mask of the events that match every filter that is passed
+    # events is an EventType or a list of them, the string filters take the value (e.g. command='checktemp'), start and end are epoch seconds
+    def mask(self, events=None, handler=None, command=None, author=None, resort=None, channel=None, start=None, end=None):
+        mask = np.ones(len(self), dtype=bool)
+
+        if events is not None:
+            mask &= np.isin(self.event, np.array([events] if isinstance(events, EventType) else events, dtype=np.uint8))
+        for column, value in (('handler', handler), ('command', command), ('author', author), ('resort', resort)):
+            if value is not None:
+                mask &= getattr(self, column) == self.indexes[column].get(value, len(self.strings[column]))
+        if channel is not None:
+            mask &= self.channel == channel
+        if start is not None:
+            mask &= self.timestamp >= start
+        if end is not None:
+            mask &= self.timestamp < end
+
+        return mask
+
+    # Returns the number of events that match the filters of mask()
+    def count(self, *args, **kwargs):
+        return int(np.count_nonzero(self.mask(*args, **kwargs)))
+
+    # Returns {string: array of timestamps} of the events selected by mask grouped by an interned column, in time order
+    def group_times(self, mask, column):
+        values = getattr(self, column)[mask]
+        timestamps = self.timestamp[mask]
+        order = np.argsort(values, kind='stable')
+        values = values[order]
+        boundaries = np.flatnonzero(np.diff(values)) + 1
+
+        groups = {}
+        for group in np.split(np.arange(values.size), boundaries):
+            if group.size:
+                groups[self.strings[column][values[group[0]]]] = array('d', timestamps[order[group]].tobytes())
+        return groups
+
+    # Returns the LogAnalysis of the store, every counter is computed from the columns without reading the log
+    def to_analysis(self):
+        if self._analysis is not None:
+            return self._analysis
+
+        analysis = LogAnalysis()
+        analysis.lines = self.lines
+        analysis.users = set(self.users)
+
+        messages = self.mask([EventType.MESSAGE, EventType.ACCEPT_FAIL])
+        commands = self.mask(EventType.COMMAND)
+        joins = self.mask(EventType.MEMBER_JOIN)
+
+        analysis.messages = int(np.count_nonzero(messages))
+        analysis.bot_messages = self.count([EventType.MESSAGE, EventType.ACCEPT_FAIL], author=BOT_USER)
+        analysis.accept_fail = self.count(EventType.ACCEPT_FAIL)
+        analysis.accept_dm = self.count(EventType.COMMAND, command='accept', channel=ChannelKind.DM)
+        analysis.hello = self.count(EventType.HELLO)
+        analysis.bye = self.count(EventType.BYE)
+        analysis.member_joins = int(np.count_nonzero(joins))
+        analysis.help = self.count(EventType.HELP)
+
+        command_counts = np.bincount(self.command[commands], minlength=len(self.strings['command']))
+        analysis.commands = Counter({command: int(count) for command, count in zip(self.strings['command'], command_counts) if count})
+        analysis.command_times = self.group_times(commands, 'command')
+        analysis.author_index = self.group_times(messages, 'author')
+        analysis.message_times = array('d', self.timestamp[messages].tobytes())
+        analysis.join_times = array('d', self.timestamp[joins].tobytes())
+
+        resort_events = self.mask([EventType.COMMAND, EventType.RESORT_REPORT]) & (self.resort != NO_VALUE)
+        # Grouped in one pass, lexsort is stable so the timestamps of each (resort, command) group stay in time order
+        resorts = self.resort[resort_events]
+        resort_commands = self.command[resort_events]
+        order = np.lexsort((resort_commands, resorts))
+        resorts = resorts[order]
+        resort_commands = resort_commands[order]
+        timestamps = self.timestamp[resort_events][order]
+        boundaries = np.flatnonzero((np.diff(resorts) != 0) | (np.diff(resort_commands) != 0)) + 1
+
+        for group in np.split(np.arange(resorts.size), boundaries):
+            if group.size:
+                resort_key = self.strings['resort'][resorts[group[0]]]
+                command = self.strings['command'][resort_commands[group[0]]]
+                analysis.resort_index.setdefault(resort_key, {})[command] = array('d', timestamps[group].tobytes())
+
+        self._analysis = analysis
+        return analysis
+
+# ------------------------------------------------------------counter functions------------------------------------------------------------
+# argument for variable log_file is a string of the log file, a stream of its lines (see iter_log_lines()), a LogAnalysis returned by analyze_log()
+# or an EventStore returned by compile_event_store()
+# Functions that take a resort_key return the count for that resort, or for every resort if resort_key is None
 
 # Returns the total number of messages sent
 def message_count(log_file):
-    regex = re.compile(r'\d\d\d\d-\d\d-\d\d \d\d:\d\d:\d\d,\d\d\d:DEBUG:__mp_main__: async def on_message')
-    matches = regex.findall(log_file)
-    number_matches = len(matches)
+    number_matches = analyze_log(log_file).messages
     logger.debug(f'def message_count: return value: {number_matches}')
     return number_matches
 
@@ -49,10 +1129,8 @@ def user_message_count(log_file, message_author):
     regex_author = re.compile(r'[a-zA-Z0-9]{2,32}#\d\d\d\d')
     author_match = regex_author.fullmatch(str(message_author))
 
-    if author_match is True:
-        regex = re.compile(r'\d\d\d\d-\d\d-\d\d \d\d:\d\d:\d\d,\d\d\d:DEBUG:__mp_main__: async def on_message: Detected message sent by ' + re.escape(message_author))
-        matches = regex.findall(log_file)
-        number_matches = len(matches)
+    if author_match is not None:
+        number_matches = analyze_log(log_file).author_count(message_author)
         logger.debug(f'def user_message_count: message_author: {message_author} return value: {number_matches}')
         return number_matches
 
@@ -60,209 +1138,345 @@ def user_message_count(log_file, message_author):
         logger.debug(f'Invalid message_author name')
         logger.debug(f'def user_message_count: message_author: {message_author} return value: 0')
         return 0
-    
+
+# Returns the number of times a command was used, for a specific resort if resort_key is passed
+def command_count(log_file, command, resort_key=None):
+    if isinstance(log_file, EventStore):
+        # Like the resort index, a resort's count includes the resorts sent by !canadasnow and !USAsnow
+        if resort_key is None:
+            return log_file.count(EventType.COMMAND, command=command)
+        return log_file.count([EventType.COMMAND, EventType.RESORT_REPORT], command=command, resort=resort_key)
+
+    analysis = analyze_log(log_file)
+    if resort_key is None:
+        return analysis.commands[command]
+    return analysis.resort_count(resort_key, [command])
 
 # Returns the total number of times !USAsnow command is passed
 def USA_snow_report_count(log_file):
-    regex = re.compile(r'\d\d\d\d-\d\d-\d\d \d\d:\d\d:\d\d,\d\d\d:DEBUG:__mp_main__: async def USA_snow_report: Command \(\"!USAsnow\"\):')
-    matches = regex.findall(log_file)
-    number_matches = len(matches)
+    number_matches = command_count(log_file, 'USAsnow')
     logger.debug(f'def USA_snow_report_count: return value: {number_matches}')
     return number_matches
 
 # Returns the total number of times !canadasnow command is passed
 def canada_snow_report_count(log_file):
-    regex = re.compile(r'\d\d\d\d-\d\d-\d\d \d\d:\d\d:\d\d,\d\d\d:DEBUG:__mp_main__: async def USA_snow_report: Command \(\"!canadasnow\"\):')
-    matches = regex.findall(log_file)
-    number_matches = len(matches)
+    number_matches = command_count(log_file, 'canadasnow')
     logger.debug(f'def canada_snow_report_count: return value: {number_matches}')
     return number_matches
 
 # Returns the total number of times !checkfeelslike command is passed
 # Resort that is queuried is determined by passing resort_key arg
-def feelslike_now_count(log_file, resort_key):
-    regex = re.compile(r'\d\d\d\d-\d\d-\d\d \d\d:\d\d:\d\d,\d\d\d:DEBUG:__mp_main__: async def feelslike_now: Command \(\"!checkfeelslike [a-zA-Z0-9\D]{2,32}\"\):')
-    matches = regex.findall(log_file)
-    number_matches = len(matches)
+def feelslike_now_count(log_file, resort_key=None):
+    number_matches = command_count(log_file, 'checkfeelslike', resort_key)
     logger.debug(f'def feelslike_now_count: resort_key: {str(resort_key)}: return value: {number_matches}')
     return number_matches
 
 # Returns the total number of times !checksnow command is passed
 # Resort that is queuried is determined by passing resort_key arg
-def checksnow_count(log_file, resort_key):
-    regex = re.compile(r'\d\d\d\d-\d\d-\d\d \d\d:\d\d:\d\d,\d\d\d:DEBUG:__mp_main__: async def check_4day_snow: Command \(\"!checksnow [a-zA-Z0-9\D]{2,32}\"\):')
-    matches = regex.findall(log_file)
-    number_matches = len(matches)
+def checksnow_count(log_file, resort_key=None):
+    number_matches = command_count(log_file, 'checksnow', resort_key)
     logger.debug(f'def checksnow_count: resort_key: {str(resort_key)}: return value: {number_matches}')    
     return number_matches
 
 # Returns the total number of times !checktemp command is passed
 # Resort that is queuried is determined by passing resort_key arg
-def checktemp_count(log_file, resort_key):
-    regex = re.compile(r'\d\d\d\d-\d\d-\d\d \d\d:\d\d:\d\d,\d\d\d:DEBUG:__mp_main__: async def check_temp_now: Command \(\"!checktemp [a-zA-Z0-9\D]{2,32}\"\):')
-    matches = regex.findall(log_file)
-    number_matches = len(matches)
+def checktemp_count(log_file, resort_key=None):
+    number_matches = command_count(log_file, 'checktemp', resort_key)
     logger.debug(f'def checktemp_count: resort_key: {str(resort_key)}: return value: {number_matches}')        
     return number_matches
 
-def checktomorrowtemp_count(log_file, resort_key):
-    regex = re.compile(r'\d\d\d\d-\d\d-\d\d \d\d:\d\d:\d\d,\d\d\d:DEBUG:__mp_main__: async def check_temp_tomorrow: Command \(\"!checktomorrowtemp [a-zA-Z0-9\D]{2,32}\"\):')
-    matches = regex.findall(log_file)
-    number_matches = len(matches)
+def checktomorrowtemp_count(log_file, resort_key=None):
+    number_matches = command_count(log_file, 'checktomorrowtemp', resort_key)
     logger.debug(f'def checktomorrowtemp_count: resort_key: {str(resort_key)}: return value: {number_matches}')        
     return number_matches
 
-def checktomorrowfeelslike_count(log_file, resort_key):
-    regex = re.compile(r'\d\d\d\d-\d\d-\d\d \d\d:\d\d:\d\d,\d\d\d:DEBUG:__mp_main__: async def check_feelslike_tomorrow: Command \(\"!checktomorrowfeelslike [a-zA-Z0-9\D]{2,32}\"\):')
-    matches = regex.findall(log_file)
-    number_matches = len(matches)
+def checktomorrowfeelslike_count(log_file, resort_key=None):
+    number_matches = command_count(log_file, 'checktomorrowfeelslike', resort_key)
     logger.debug(f'def checktomorrowfeelslike_count: resort_key: {str(resort_key)}: return value: {number_matches}')        
     return number_matches
 
-def checktomorrowprecipitation_count(log_file, resort_key):
-    regex = re.compile(r'\d\d\d\d-\d\d-\d\d \d\d:\d\d:\d\d,\d\d\d:DEBUG:__mp_main__: async def check_precipitation_tomorrow: Command \(\"!checktomorrowprecipitation [a-zA-Z0-9\D]{2,32}\"\):')
-    matches = regex.findall(log_file)
-    number_matches = len(matches)
+def checktomorrowprecipitation_count(log_file, resort_key=None):
+    number_matches = command_count(log_file, 'checktomorrowprecipitation', resort_key)
     logger.debug(f'def checktomorrowprecipitation_count: resort_key: {str(resort_key)}: return value: {number_matches}')        
     return number_matches
 
-def checktomorrow_count(log_file, resort_key):
-    regex = re.compile(r'\d\d\d\d-\d\d-\d\d \d\d:\d\d:\d\d,\d\d\d:DEBUG:__mp_main__: async def check_tomorrow: Command \(\"!checktomorrow [a-zA-Z0-9\D]{2,32}\"\):')
-    matches = regex.findall(log_file)
-    number_matches = len(matches)
+def checktomorrow_count(log_file, resort_key=None):
+    number_matches = command_count(log_file, 'checktomorrow', resort_key)
     logger.debug(f'def checktomorrow_count: resort_key: {str(resort_key)}: return value: {number_matches}')        
     return number_matches
 
 # Returns the total number of times !resort command is passed
 def list_resorts_count(log_file):
-    regex = re.compile(r'\d\d\d\d-\d\d-\d\d \d\d:\d\d:\d\d,\d\d\d:DEBUG:__mp_main__: async def list_resorts: Command \(\"!resorts\"\):')
-    matches = regex.findall(log_file)
-    number_matches = len(matches)
+    number_matches = command_count(log_file, 'resorts')
     logger.debug(f'def listresorts_count: return value: {number_matches}')   
     return number_matches
 
 # Returns the total number of time !accept command is passed
 def assign_role_count(log_file):
-    regex = re.compile(r'\d\d\d\d-\d\d-\d\d \d\d:\d\d:\d\d,\d\d\d:DEBUG:__mp_main__: async def assign_role: Command \(\"!accept\"\):')
-    matches = regex.findall(log_file)
-    number_matches = len(matches)
+    number_matches = command_count(log_file, 'accept')
     logger.debug(f'def assign_role_count: return value: {number_matches}')       
     return number_matches
 
 # Returns the total number of times !server command is passed
 def fetch_server_info_count(log_file):
-    regex = re.compile(r'\d\d\d\d-\d\d-\d\d \d\d:\d\d:\d\d,\d\d\d:DEBUG:__mp_main__: async def fetch_server_info: Command \(\"!server\"\):')
-    matches = regex.findall(log_file)
-    number_matches = len(matches)
+    number_matches = command_count(log_file, 'server')
     logger.debug(f'def fetch_server_info_count: return value: {number_matches}')         
     return number_matches
 
 # Returns the total number of times "Hello" message is sent
 def on_message_Hello_count(log_file):
-    regex = re.compile(r'\d\d\d\d-\d\d-\d\d \d\d:\d\d:\d\d,\d\d\d:DEBUG:__mp_main__: async def on_message: Message Content \"Hello\"')
-    matches = regex.findall(log_file)
-    number_matches = len(matches)
+    number_matches = analyze_log(log_file).hello
     logger.debug(f'def on_message_Hello_count: return value: {number_matches}')       
     return number_matches
 
 # Returns the total number of times "Bye" message is sent
 def on_message_Bye_count(log_file):
-    regex = re.compile(r'\d\d\d\d-\d\d-\d\d \d\d:\d\d:\d\d,\d\d\d:DEBUG:__mp_main__: async def on_message: Message Content \"Bye\"')
-    matches = regex.findall(log_file)
-    number_matches = len(matches)
+    number_matches = analyze_log(log_file).bye
     logger.debug(f'def on_message_Bye_count: return value: {number_matches}')       
     return number_matches
 
 # Returns the total amount of times a query to determine if there is snow for a specific resort over the next 4 days
 # Resort that is queuried is determined by passing resort_key arg
 def resort_has_snow_count(log_file, resort_key):
-
-    regex_canadasnow = re.compile(r'\d\d\d\d-\d\d-\d\d \d\d:\d\d:\d\d,\d\d\d:DEBUG:__mp_main__: async def canada_snow_report: Sending data for resort ' + re.escape(resort_key))
-    regex_checksnow = re.compile(r'\d\d\d\d-\d\d-\d\d \d\d:\d\d:\d\d,\d\d\d:DEBUG:__mp_main__: async def check_4day_snow: Command \(\"!checksnow ' + re.escape(resort_key))
-    regex_USAsnow = re.compile(r'\d\d\d\d-\d\d-\d\d \d\d:\d\d:\d\d,\d\d\d:DEBUG:__mp_main__: async def USA_snow_report: Sending data for resort ' + re.escape(resort_key))
-
-    matches_canadasnow = regex_canadasnow.findall(log_file)
-    matches_checksnow = regex_checksnow.findall(log_file)
-    matches_USAsnow = regex_USAsnow.findall(log_file)
-
-    number_matches_canadasnow = len(matches_canadasnow)
-    number_matches_checksnow = len(matches_checksnow)
-    number_matches_USAsnow = len(matches_USAsnow)
-
-    number_matches = number_matches_canadasnow + number_matches_checksnow + number_matches_USAsnow
-    
+    number_matches = analyze_log(log_file).resort_count(resort_key, SNOW_COMMANDS)
     logger.debug(f'def resort_has_snow_count: resort_key: {str(resort_key)}: return value: {number_matches}')   
     return number_matches
-   
 
 # Returns the total amount of new members that have joined the server
 def on_member_join_count(log_file):
-    regex = re.compile(r'\d\d\d\d-\d\d-\d\d \d\d:\d\d:\d\d,\d\d\d:DEBUG:__mp_main__: async on_member_join')
-    matches = regex.findall(log_file)
-    number_matches = len(matches)
+    number_matches = analyze_log(log_file).member_joins
     logger.debug(f'def on_member_join_count: return value: {number_matches}')     
     return number_matches
 
 # Returns the total amount of times a message is sent by the bot
 def bot_messages_sent_count(log_file):
-    regex = re.compile(r'\d\d\d\d-\d\d-\d\d \d\d:\d\d:\d\d,\d\d\d:DEBUG:__mp_main__: async def on_message: Detected message sent by RoastedBot#1314:')
-    matches = regex.findall(log_file)
-    number_matches = len(matches)
+    number_matches = analyze_log(log_file).bot_messages
     logger.debug(f'def bot_messages_sent_count: return value: {number_matches}')     
     return number_matches
 
 # Returns the total amount of times !accept is used without the message.author belonging to the "Member" role:
 def accept_fail_count(log_file):
-    regex = re.compile(r'\d\d\d\d-\d\d-\d\d \d\d:\d\d:\d\d,\d\d\d:DEBUG:__mp_main__: async def on_message: Detected message sent by RoastedBot#1314: Message Content: \"Invalid command, please !accept the rules\.\"')
-    matches = regex.findall(log_file)
-    number_matches = len(matches)
+    number_matches = analyze_log(log_file).accept_fail
     logger.debug(f'def accept_fail_count: return value: {number_matches}')     
     return number_matches
 
 # Returns the total amount of times !accept is used and works successfully from a DM channel
 def accept_success_count(log_file):
-    regex = re.compile(r'\d\d\d\d-\d\d-\d\d \d\d:\d\d:\d\d,\d\d\d:DEBUG:__mp_main__: async def assign_role: Command \(\"!accept\"\): Author \([a-zA-Z0-9\D]{2,32}\d\d\d\d\): Channel: \(Direct Message with [a-zA-Z0-9\D]{2,32}\d\d\d\d\)')
-    matches = regex.findall(log_file)
-    number_matches = len(matches)
+    if isinstance(log_file, EventStore):
+        number_matches = log_file.count(EventType.COMMAND, command='accept', channel=ChannelKind.DM)
+    else:
+        number_matches = analyze_log(log_file).accept_dm
     logger.debug(f'def accept_success_count: return value: {number_matches}')     
     return number_matches
 
 # Returns the total amount of times !accept is used not from a DM channel
 def accept_public_channel_count(log_file):
-    regex_accept_total = re.compile(r'\d\d\d\d-\d\d-\d\d \d\d:\d\d:\d\d,\d\d\d:DEBUG:__mp_main__: async def assign_role: Command \(\"!accept\"\): Author \([a-zA-Z0-9\D]{2,32}\d\d\d\d\)')
-    regex_success = re.compile(r'\d\d\d\d-\d\d-\d\d \d\d:\d\d:\d\d,\d\d\d:DEBUG:__mp_main__: async def assign_role: Command \(\"!accept\"\): Author \([a-zA-Z0-9\D]{2,32}\d\d\d\d\): Channel: \(Direct Message with [a-zA-Z0-9\D]{2,32}\d\d\d\d\)')
-
-    matches_accept_total = regex_accept_total.findall(log_file)
-    matches_success = regex_success.findall(log_file)
-
-    number_accept_total = len(matches_accept_total)
-    number_matches_success = len(matches_success)
-    
-    # times !accept is used from a non-DM channel - regex_accept_total - regex_success
-    number_matches = number_accept_total - number_matches_success
+    if isinstance(log_file, EventStore):
+        number_matches = log_file.count(EventType.COMMAND, command='accept', channel=ChannelKind.GUILD)
+    else:
+        analysis = analyze_log(log_file)
+        number_matches = analysis.commands['accept'] - analysis.accept_dm
     logger.debug(f'def accept_public_channel_count: return value: {number_matches}')      
     return number_matches
 
 # Returns the total amount of times that !help is used successfully
 def help_command_count(log_file):
-    regex = re.compile(r'Type !help command for more info on a command\.')
-    matches = regex.findall(log_file)
-    number_matches = len(matches)
+    number_matches = analyze_log(log_file).help
     logger.debug(f'def help_command_count: return value: {number_matches}')     
     return number_matches
 
 # Returns the number of users that were active (had some activity)
 def active_users(log_file):
-    regex_user = re.compile(r'[a-zA-Z0-9]{2,32}#\d\d\d\d')
-    matches = regex_user.findall(log_file)
-    unique_matches = list(set(matches))
+    unique_matches = list(analyze_log(log_file).users)
     logger.debug(f'def active_users: unique users: {len(unique_matches)}')  
     return unique_matches
 
+# ------------------------------------------------------------index queries------------------------------------------------------------
+
+# Returns a list of (resort_key, count) of the n most used resorts, counting only the given commands if commands is passed
+def top_resorts(log_file, n=10, commands=None):
+    analysis = analyze_log(log_file)
+    counts = ((resort_key, analysis.resort_count(resort_key, commands)) for resort_key in analysis.resort_index)
+    top = heapq.nlargest(n, counts, key=lambda item: item[1])
+    logger.debug(f'def top_resorts: return value: {top}')
+    return top
+
+# Returns a list of (author, number of messages) of the n users that sent the most messages, the bot is left out unless include_bot is True
+def top_users(log_file, n=10, include_bot=False):
+    analysis = analyze_log(log_file)
+    counts = ((author, len(timestamps)) for author, timestamps in analysis.author_index.items() if include_bot or author != BOT_USER)
+    top = heapq.nlargest(n, counts, key=lambda item: item[1])
+    logger.debug(f'def top_users: return value: {top}')
+    return top
+
+# Returns a list of (timestamp, command) of every time a resort was used, in time order
+def resort_occurrences(log_file, resort_key):
+    commands = analyze_log(log_file).resort_index.get(resort_key, {})
+    return sorted((timestamp, command) for command, timestamps in commands.items() for timestamp in timestamps)
+
+# Returns the list of timestamps of the messages sent by an author, in time order
+def user_message_times(log_file, message_author):
+    return list(analyze_log(log_file).author_index.get(message_author, ()))
+
+# ------------------------------------------------------------usage histograms------------------------------------------------------------
+
+# Width in seconds of the buckets usage_histogram() can count events in
+BUCKET_SECONDS = {'minute': 60, 'hour': 3600, 'day': 86400}
+
+# Returns the timestamps of each series of events in the log as numpy arrays: messages, member_joins and one command:<name> series per command
+# The arrays share the memory of the arrays in the LogAnalysis, they are not copied
+def event_series(log_file):
+    analysis = analyze_log(log_file)
+
+    series = {
+        'messages': np.frombuffer(analysis.message_times, dtype=np.float64),
+        'member_joins': np.frombuffer(analysis.join_times, dtype=np.float64),
+    }
+    for command in sorted(analysis.command_times):
+        series[f'command:{command}'] = np.frombuffer(analysis.command_times[command], dtype=np.float64)
+
+    return series
+
+# This method counts the events of each series in buckets of bucket seconds ('minute', 'hour', 'day' or a number of seconds)
+# Returns (bucket_starts, counts) where bucket_starts is an array of the start time of every bucket from the first event to the last,
+# including empty buckets, and counts is a dictionary of series name: array of the number of events in each bucket
+def usage_histogram(log_file, bucket='hour'):
+    width = BUCKET_SECONDS.get(bucket, bucket)
+    series = event_series(log_file)
+
+    non_empty = [timestamps for timestamps in series.values() if timestamps.size]
+    if not non_empty:
+        return np.empty(0, dtype=np.int64), {name: np.empty(0, dtype=np.int64) for name in series}
+
+    first = int(min(timestamps.min() for timestamps in non_empty) // width)
+    last = int(max(timestamps.max() for timestamps in non_empty) // width)
+    bucket_starts = np.arange(first, last + 1, dtype=np.int64) * width
+
+    counts = {}
+    for name, timestamps in series.items():
+        indexes = (timestamps // width).astype(np.int64) - first
+        counts[name] = np.bincount(indexes, minlength=bucket_starts.size)
+
+    logger.debug(f'def usage_histogram: bucket: {bucket} buckets: {bucket_starts.size} series: {len(counts)}')
+    return bucket_starts, counts
+
+# Returns the rolling rate of an array of bucket counts: the mean number of events per bucket over the last window buckets
+# The first window - 1 buckets are averaged over the buckets available so far
+def rolling_rate(counts, window):
+    totals = np.cumsum(counts, dtype=np.float64)
+    totals[window:] = totals[window:] - totals[:-window]
+    return totals / np.minimum(np.arange(1, totals.size + 1), window)
+
+# Returns (bucket_start, count) of the bucket with the most events of a series, or None if the series is empty
+def peak_bucket(log_file, name='messages', bucket='hour'):
+    bucket_starts, counts = usage_histogram(log_file, bucket)
+    if name not in counts or not counts[name].size:
+        return None
+
+    peak = int(np.argmax(counts[name]))
+    return int(bucket_starts[peak]), int(counts[name][peak])
+
+# This method writes the usage histogram of a log to a csv file, one row per bucket and one column per series
+# If window is passed, a <series>_rate column with the rolling rate over window buckets is written after each series
+def export_usage_csv(log_file, csv_path, bucket='hour', window=None):
+    bucket_starts, counts = usage_histogram(log_file, bucket)
+    names = list(counts)
+
+    columns = [bucket_starts.astype(np.float64)]
+    header = ['bucket_start']
+    for name in names:
+        columns.append(counts[name])
+        header.append(name)
+        if window:
+            columns.append(rolling_rate(counts[name], window))
+            header.append(f'{name}_rate')
+
+    with open(csv_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        # The log clock is treated as UTC by log_timestamp(), so the bucket starts are formatted back in UTC
+        for row_index, bucket_start in enumerate(bucket_starts):
+            row = [time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(int(bucket_start)))]
+            row.extend(round(float(column[row_index]), 3) if column.dtype.kind == 'f' else int(column[row_index]) for column in columns[1:])
+            writer.writerow(row)
+
+    logger.debug(f'def export_usage_csv: {csv_path} rows: {bucket_starts.size}')
+    return csv_path
+
 # ------------------------------------------------------------logic------------------------------------------------------------
 
-with open('discord.log', 'r', encoding='utf-8') as f:
-     log_string = f.read()
+def print_report(log_analysis):
+    print(active_users(log_analysis))
+    print(resort_has_snow_count(log_analysis, 'sunshine'))
+    print(top_resorts(log_analysis))
+    print(top_users(log_analysis))
+
+if __name__ == "__main__":
+    argument_parser = argparse.ArgumentParser(description='Prints usage statistics of the discord bot log')
+    argument_parser.add_argument('log_file', nargs='?', default='discord.log', help='defaults to discord.log in the parser directory')
+    argument_parser.add_argument('--checkpoint', help='checkpoint file, only the lines added since the last run are read')
+    argument_parser.add_argument('--follow', action='store_true', help='keep reading lines as they are added to the log')
+    argument_parser.add_argument('--interval', type=float, default=1.0, help='seconds between reads in --follow mode')
+    argument_parser.add_argument('--workers', type=int, help='analyse the log with this many worker processes')
+    argument_parser.add_argument('--benchmark', type=int, metavar='SIZE_MB', help='compare serial and parallel analysis on a synthetic log of SIZE_MB megabytes')
+    argument_parser.add_argument('--compile', metavar='STORE_DIR', help='compile the log into an event store in STORE_DIR')
+    argument_parser.add_argument('--store', metavar='STORE_DIR', help='print the report of an event store compiled with --compile instead of a log')
+    argument_parser.add_argument('--start', help='only read the log from this time, e.g. "2021-02-19 17:00"')
+    argument_parser.add_argument('--end', help='only read the log up to this time')
+    argument_parser.add_argument('--archive', nargs='?', const=S3_MANIFEST, metavar='MANIFEST', help='analyse the snapshots uploaded to S3 that are listed in MANIFEST (defaults to bot/s3_logs.csv), --start and --end select them by upload time')
+    argument_parser.add_argument('--s3-bucket', dest='s3_bucket', default=S3_BUCKET_NAME, help='S3 bucket of --archive')
+    argument_parser.add_argument('--histogram', metavar='CSV_FILE', help='write the usage histogram of the log to CSV_FILE instead of printing the report')
+    argument_parser.add_argument('--bucket', choices=sorted(BUCKET_SECONDS), default='hour', help='bucket size of --histogram')
+    argument_parser.add_argument('--window', type=int, help='add rolling rates over this many buckets to --histogram')
+    arguments = argument_parser.parse_args()
+
+    # The module changes directory to D_NAME when it is imported, so paths passed on the command line are relative to where it was run from
+    arguments.log_file = os.path.join(current_dir, arguments.log_file) if arguments.log_file != 'discord.log' else arguments.log_file
+    arguments.checkpoint = os.path.join(current_dir, arguments.checkpoint) if arguments.checkpoint else None
+    arguments.histogram = os.path.join(current_dir, arguments.histogram) if arguments.histogram else None
+    arguments.archive = os.path.join(current_dir, arguments.archive) if arguments.archive else None
+    arguments.compile = os.path.join(current_dir, arguments.compile) if arguments.compile else None
+    arguments.store = os.path.join(current_dir, arguments.store) if arguments.store else None
+
+    if arguments.benchmark:
+        benchmark(arguments.benchmark, arguments.workers)
+
+    elif arguments.archive:
+        print_report(analyze_archive(arguments.archive, arguments.start, arguments.end, arguments.s3_bucket, workers=arguments.workers or ARCHIVE_DOWNLOAD_WORKERS))
+
+    elif arguments.compile:
+        event_store = compile_event_store(arguments.log_file, arguments.compile)
+        print(f'{arguments.compile}: {len(event_store)} events from {event_store.lines} lines')
 
-print(active_users(log_string))
-print(resort_has_snow_count(log_string, 'sunshine'))
\ No newline at end of file
+    elif arguments.store:
+        event_store = EventStore(arguments.store)
+        if arguments.histogram:
+            print(export_usage_csv(event_store, arguments.histogram, arguments.bucket, arguments.window))
+        else:
+            print_report(event_store)
+
+    elif arguments.start or arguments.end:
+        log_analysis = query_time_range(arguments.log_file, arguments.start, arguments.end)
+        if arguments.histogram:
+            print(export_usage_csv(log_analysis, arguments.histogram, arguments.bucket, arguments.window))
+        else:
+            print_report(log_analysis)
+
+    elif arguments.histogram:
+        log_analysis = analyze_log_parallel(arguments.log_file, arguments.workers) if arguments.workers else analyze_log(read_log_lines(arguments.log_file))
+        print(export_usage_csv(log_analysis, arguments.histogram, arguments.bucket, arguments.window))
+
+    elif arguments.follow:
+        tail = LogTail(arguments.log_file, arguments.checkpoint)
+        for log_analysis in tail.follow(arguments.interval):
+            print(f'{time.strftime("%Y-%m-%d %H:%M:%S")} messages: {log_analysis.messages} commands: {sum(log_analysis.commands.values())} users: {len(log_analysis.users)}')
+
+    elif arguments.checkpoint:
+        print_report(incremental_analysis(arguments.log_file, arguments.checkpoint))
+
+    elif arguments.workers:
+        print_report(analyze_log_parallel(arguments.log_file, arguments.workers))
+
+    else:
+        # The log is streamed from disk instead of being read into a string
+        print_report(analyze_log(read_log_lines(arguments.log_file)))
@@ -6,14 +6,26 @@
 # dateutil.parser as dp is used to convert UTC format into datetime format
 # datetime and tzlocal is used to convert UTC timezone into Canada/Mountain Time
 
+import asyncio
+import atexit
+from collections import OrderedDict
 import json
 import os
-from datetime import datetime, timedelta, timezone
+from datetime import datetime
 import dateutil.parser as dp
+import heapq
 import logging
+from logging.handlers import QueueHandler, QueueListener
+import math
 from dotenv import load_dotenv
-import statistics
+import aiohttp
+import numpy as np
+import queue
+import stat
 import sys
+import tempfile
+import threading
+import time
 import requests
 from tzlocal import get_localzone
 
@@ -44,8 +56,52 @@ skiResort data is stored in skiResorts.json
 URL_HOURLY = "https://api.climacell.co/v3/weather/forecast/hourly"
 URL_NOWCAST = "https://api.climacell.co/v3/weather/nowcast"
 URL_REALTIME = "https://api.climacell.co/v3/weather/realtime"
+
+# Names of the Climacell endpoints, these are used as part of the forecast cache keys
+ENDPOINT_REALTIME = "realtime"
+ENDPOINT_NOWCAST = "nowcast"
+ENDPOINT_HOURLY = "hourly"
+
+ENDPOINT_URLS = {
+    ENDPOINT_REALTIME: URL_REALTIME,
+    ENDPOINT_NOWCAST: URL_NOWCAST,
+    ENDPOINT_HOURLY: URL_HOURLY,
+}
+
+# Number of seconds a response is reused for each endpoint before Climacell is called again
+CACHE_TTL = {
+    ENDPOINT_REALTIME: 60,
+    ENDPOINT_NOWCAST: 300,
+    ENDPOINT_HOURLY: 1800,
+}
+
+# Precipitation types returned by Climacell, ForecastSeries stores the index of the type instead of the string
+PRECIPITATION_TYPES = ["none", "rain", "snow", "ice pellets", "freezing rain"]
+
+# Numeric fields of the nowcast and hourly responses that are decoded into arrays by ForecastSeries
+SERIES_FIELDS = ["temp", "feels_like", "precipitation", "wind_speed"]
+
+# Minimum number of seconds between two checks of the modification time of skiResorts.json by the resort registry
+REGISTRY_CHECK_INTERVAL = 5
+
+# Length of the windows used by ForecastSeries.rollup(), in seconds
+ROLLUP_WINDOW = 24 * 60 * 60
+
+# Approximate memory cap of the forecast cache, measured as the size of the cached response bodies
+CACHE_MAX_BYTES = 16 * 1024 * 1024
 SKI_RESORT_JSON = "skiResorts.json"
 
+# Settings for the shared aiohttp session used by the async requests
+# Timeouts are in seconds, connection limits bound the number of sockets open to Climacell at once
+HTTP_TIMEOUT = 10
+HTTP_CONNECT_TIMEOUT = 5
+HTTP_CONNECTION_LIMIT = 20
+HTTP_CONNECTION_LIMIT_PER_HOST = 10
+HTTP_KEEPALIVE_TIMEOUT = 30
+
+# Maximum number of resorts fetched at the same time by regional_snow_report()
+REPORT_CONCURRENCY = 8
+
 # Sets up where the files will be
 ABS_PATH = os.path.abspath(__file__)
 D_NAME = os.path.dirname(ABS_PATH)
@@ -57,10 +113,16 @@ else:
     pass
 
 # Set up logging at the debug level
+# Records are put on a queue and written to snowReport.log by a listener thread, so the commands of the bot never wait for the disk
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
-handler = logging.FileHandler(filename='snowReport.log', encoding='utf-8', mode='w')
-handler.setFormatter(logging.Formatter('%(asctime)s:%(levelname)s:%(name)s: %(message)s'))
+file_handler = logging.FileHandler(filename='snowReport.log', encoding='utf-8', mode='w')
+file_handler.setFormatter(logging.Formatter('%(asctime)s:%(levelname)s:%(name)s: %(message)s'))
+log_queue = queue.SimpleQueue()
+log_listener = QueueListener(log_queue, file_handler)
+log_listener.start()
+atexit.register(log_listener.stop)
+handler = QueueHandler(log_queue)
 logger.addHandler(handler)
 
 logger.debug(f'Running snowReport.py... \n')
@@ -69,34 +131,698 @@ logger.debug(f'ABS_PATH: {ABS_PATH}')
 logger.debug(f'D_NAME: {D_NAME}')
 logger.debug(f'Current Directory: {current_dir} \n')
 
-# Grabs Climacell token from .env
-load_dotenv(".env")
-CLIMACELL_TOKEN = os.getenv('CLIMACELL_TOKEN')
-logger.debug(f'Climacell Token: {CLIMACELL_TOKEN}')
+# Settings read from .env, the file is only read the first time a setting is used so importing the module does not touch it
+#   - climacell_token: CLIMACELL_TOKEN
+#   - tile_precision: geohash precision used to share Climacell calls between nearby resorts, see set_tile_precision()
+#     Tiling is off unless CLIMACELL_TILE_PRECISION is set in .env
+_settings = None
+_settings_lock = threading.Lock()
+
+def settings():
+    global _settings
+    if _settings is None:
+        with _settings_lock:
+            if _settings is None:
+                # Grabs Climacell token from .env
+                load_dotenv(os.path.join(D_NAME, ".env"))
+                tile_precision = os.getenv('CLIMACELL_TILE_PRECISION')
+                _settings = {
+                    "climacell_token": os.getenv('CLIMACELL_TOKEN'),
+                    "tile_precision": int(tile_precision) if tile_precision else None,
+                }
+                logger.debug(f'Climacell Token: {_settings["climacell_token"]}')
+                logger.debug(f'Climacell tile precision: {_settings["tile_precision"]}')
+    return _settings
+
+# ------------------------------------------------------------resort registry------------------------------------------------------------
+
+# In memory copy of skiResorts.json with dictionary indexes by key, name and country
+# The file is loaded once and only reloaded when its modification time changes. The modification time is checked at most once every
+# check_interval seconds, so lookups between checks do not touch the disk
+class ResortRegistry():
+    def __init__(self, path, check_interval=REGISTRY_CHECK_INTERVAL):
+        self.path = path
+        self.check_interval = check_interval
+        self.mtime = None
+        self.checked = None
+        # Incremented every time the file is reloaded, other indexes built from the registry use it to know when to rebuild
+        self.version = 0
+        self.resorts = {}
+        self.by_name = {}
+        self.by_country = {}
+        self.lock = threading.Lock()
+
+    # Reloads the file if its modification time changed since it was last loaded
+    def refresh(self, force=False):
+        now = time.monotonic()
+        if not force and self.checked is not None and now - self.checked < self.check_interval:
+            return
+
+        self.checked = now
+        mtime = os.stat(self.path).st_mtime_ns
+        if mtime != self.mtime:
+            self.load(mtime)
+
+    def load(self, mtime):
+        with self.lock:
+            logger.debug(f'ResortRegistry.load() loading {self.path}')
+            with open(self.path, "r") as f:
+                resorts = json.load(f)
+
+            by_name = {}
+            by_country = {}
+            for resort_key, resort_dict in resorts.items():
+                by_name[resort_dict['name']] = resort_key
+                by_country.setdefault(resort_dict['country'], []).append(resort_key)
+
+            # The indexes are replaced all at once so readers never see a partially loaded registry
+            self.resorts, self.by_name, self.by_country = resorts, by_name, by_country
+            self.mtime = mtime
+            self.version += 1
+
+    def __contains__(self, resort_key):
+        self.refresh()
+        return resort_key in self.resorts
+
+    def __len__(self):
+        self.refresh()
+        return len(self.resorts)
+
+    # Returns the dictionary of a resort, raises KeyError if the resort key does not exist
+    def get(self, resort_key):
+        self.refresh()
+        return self.resorts[resort_key]
+
+    # Returns the list of resort keys in the order they are in the file
+    def keys(self):
+        self.refresh()
+        return list(self.resorts)
+
+    # Returns the list of resort names in the order they are in the file
+    def names(self):
+        self.refresh()
+        return list(self.by_name)
+
+    # Returns the resort key of a resort name, or None if there is no resort with that name
+    def key_for_name(self, resort_name):
+        self.refresh()
+        return self.by_name.get(resort_name)
+
+    # Returns the list of resort keys of a country
+    def country_keys(self, country):
+        self.refresh()
+        return list(self.by_country.get(country, []))
+
+    # Returns a dictionary of resort name:resort key pairs
+    def name_key_pairs(self):
+        self.refresh()
+        return dict(self.by_name)
+
+    # Adds a resort to the file and reloads the registry, returns False if the resort key already exists
+    # The file is written to a temporary file first and then renamed over skiResorts.json so it is never left half written
+    def add(self, resort_key, resort_name, country, lat, lon):
+        self.refresh(force=True)
+
+        if resort_key in self.resorts:
+            return False
+
+        resorts = dict(self.resorts)
+        resorts[resort_key] = {"name": resort_name, "country": country, "lat": lat, "lon": lon}
+
+        # NamedTemporaryFile creates the file readable by the owner only, the new file keeps the mode of skiResorts.json
+        try:
+            mode = stat.S_IMODE(os.stat(self.path).st_mode)
+        except FileNotFoundError:
+            mode = None
+
+        directory = os.path.dirname(self.path)
+        with tempfile.NamedTemporaryFile("w", dir=directory, suffix=".tmp", delete=False) as f:
+            json.dump(resorts, f, indent=4)
+            f.flush()
+            os.fsync(f.fileno())
+            temp_path = f.name
+        if mode is not None:
+            os.chmod(temp_path, mode)
+        os.replace(temp_path, self.path)
+
+        self.refresh(force=True)
+        return True
+
+registry = ResortRegistry(os.path.join(D_NAME, SKI_RESORT_JSON))
 
 # Creating lists of resorts for access
 
 STARRED_RESORTS = ["lakeLouise", "sunshine", "fernie", "revelstoke", "whistler"]
 ALBERTA_RESORTS = ["lakeLouise", "sunshine", "nakiska", "castleMountain", "norquay"]
 
-with open(SKI_RESORT_JSON, "r") as f:
-    resort_json = json.load(f)
-    CANADA_RESORTS = [resort_key for resort_key in resort_json if resort_json[resort_key]['country'] == 'Canada']
-    logger.debug(f'Creating list of keys of CANADA_RESORTS')
-    logger.debug(f'{CANADA_RESORTS} \n')
+# These lists are a snapshot of skiResorts.json the first time they are used, use registry to see resorts added afterwards
+RESORT_LISTS = {
+    'CANADA_RESORTS': lambda: registry.country_keys('Canada'),
+    'USA_RESORTS': lambda: registry.country_keys('USA'),
+    'RESORT_NAMES': lambda: registry.names(),
+    'RESORT_KEYS': lambda: registry.keys(),
+}
+
+# Module attributes that are created the first time they are used instead of when the module is imported
+# The resort lists are kept as module globals after they are created, the settings always read the current value
+def __getattr__(name):
+    if name == 'CLIMACELL_TOKEN':
+        return settings()["climacell_token"]
+    if name == 'TILE_PRECISION':
+        return settings()["tile_precision"]
+    if name in RESORT_LISTS:
+        logger.debug(f'Creating list of keys of {name}')
+        value = RESORT_LISTS[name]()
+        logger.debug(f'{value} \n')
+        globals()[name] = value
+        return value
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+# The aiohttp session is shared by every Resort so that connections to Climacell are pooled and kept alive between commands
+_session = None
+
+# This method returns the shared aiohttp session, it is created on first use because aiohttp sessions must be created inside the running event loop
+def get_session():
+    global _session
+
+    if _session is None or _session.closed:
+        logger.debug(f'Function call: get_session() creating new aiohttp session')
+        connector = aiohttp.TCPConnector(
+            limit=HTTP_CONNECTION_LIMIT,
+            limit_per_host=HTTP_CONNECTION_LIMIT_PER_HOST,
+            keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+        )
+        timeout = aiohttp.ClientTimeout(total=HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT)
+        _session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+    return _session
+
+# This method closes the shared aiohttp session, it should be awaited when the bot shuts down
+async def close_session():
+    global _session
+
+    if _session is not None and not _session.closed:
+        logger.debug(f'Function call: close_session()')
+        await _session.close()
+    _session = None
+
+# This method makes an async GET request with the shared session, returns the response body or None if the call wasn't successful
+# Timeouts and connection errors are treated the same way as a failed response so a slow Climacell call only affects the caller
+async def async_get_text(url, querystring):
+    # aiohttp does not accept None as a query parameter, requests silently drops them so the same is done here
+    params = {key: value for key, value in querystring.items() if value is not None}
+
+    try:
+        async with get_session().get(url, params=params) as response:
+            if response.status < 400:
+                return await response.text()
+            logger.debug(f'async_get_text() {url} returned status {response.status}')
+            return None
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logger.debug(f'async_get_text() {url} failed: {e!r}')
+        return None
+
+# ------------------------------------------------------------geographic tiles------------------------------------------------------------
+
+GEOHASH_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+# This method returns the geohash of a location. Each extra character makes the tile about 4 to 8 times smaller:
+# precision 3 is roughly 156 x 156 km, 4 is 39 x 20 km, 5 is 4.9 x 4.9 km and 6 is 1.2 x 0.6 km
+def geohash(lat, lon, precision):
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    characters = []
+    bits = 0
+    bit_count = 0
+    use_lon = True
+
+    while len(characters) < precision:
+        value_range, value = (lon_range, lon) if use_lon else (lat_range, lat)
+        middle = (value_range[0] + value_range[1]) / 2
+
+        if value >= middle:
+            bits = (bits << 1) | 1
+            value_range[0] = middle
+        else:
+            bits = bits << 1
+            value_range[1] = middle
+
+        use_lon = not use_lon
+        bit_count += 1
+        if bit_count == 5:
+            characters.append(GEOHASH_BASE32[bits])
+            bits = 0
+            bit_count = 0
+
+    return "".join(characters)
+
+# This method returns the (lat, lon) of the center of a geohash tile
+def geohash_center(tile):
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    use_lon = True
+
+    for character in tile:
+        bits = GEOHASH_BASE32.index(character)
+        for shift in range(4, -1, -1):
+            value_range = lon_range if use_lon else lat_range
+            middle = (value_range[0] + value_range[1]) / 2
+            if (bits >> shift) & 1:
+                value_range[0] = middle
+            else:
+                value_range[1] = middle
+            use_lon = not use_lon
+
+    return (lat_range[0] + lat_range[1]) / 2, (lon_range[0] + lon_range[1]) / 2
+
+# This method turns geographic tiling on or off. With a precision, resorts in the same geohash tile are fetched once
+# from the center of the tile and share the response. Lower precisions mean bigger tiles, fewer calls and less accurate forecasts
+# None turns tiling off so that every resort is fetched at its own coordinates
+def set_tile_precision(precision):
+    logger.debug(f'Function call: set_tile_precision({precision})')
+    settings()["tile_precision"] = precision
+
+# This method groups resort keys by the tile they are fetched from, it can be used to see how many calls a precision saves
+def tile_groups(resort_keys, precision=None):
+    precision = settings()["tile_precision"] if precision is None else precision
+    groups = {}
+    for resort_key in resort_keys:
+        resort_dict = registry.get(resort_key)
+        groups.setdefault(geohash(resort_dict["lat"], resort_dict["lon"], precision), []).append(resort_key)
+    return groups
+
+# ------------------------------------------------------------spatial index------------------------------------------------------------
+
+EARTH_RADIUS_KM = 6371.0088
+
+# Number of resorts returned by nearby_resorts() when no count is given
+NEARBY_COUNT = 5
+
+# This method converts a location to a point on the unit sphere, the straight line (chord) distance between two points
+# grows with the great circle distance so the k-d tree can search with plain euclidean distances
+def unit_vector(lat, lon):
+    lat = math.radians(lat)
+    lon = math.radians(lon)
+    return (math.cos(lat) * math.cos(lon), math.cos(lat) * math.sin(lon), math.sin(lat))
+
+def chord_to_km(chord):
+    return 2 * EARTH_RADIUS_KM * math.asin(min(chord / 2, 1.0))
+
+def km_to_chord(distance_km):
+    return 2 * math.sin(min(distance_km / (2 * EARTH_RADIUS_KM), math.pi / 2))
+
+# k-d tree over the locations of the resorts in the registry, used for the nearest resort and radius queries
+# The tree is rebuilt the first time it is queried after the registry reloads skiResorts.json
+class ResortIndex():
+    def __init__(self, registry):
+        self.registry = registry
+        self.version = None
+        self.root = None
+        self.lock = threading.Lock()
+
+    def rebuild_if_needed(self):
+        self.registry.refresh()
+        if self.version == self.registry.version:
+            return
+
+        with self.lock:
+            resorts = self.registry.resorts
+            points = [(unit_vector(resort_dict["lat"], resort_dict["lon"]), resort_key) for resort_key, resort_dict in resorts.items()]
+            self.root = self.build(points, 0)
+            self.version = self.registry.version
+            logger.debug(f'ResortIndex.rebuild_if_needed() indexed {len(points)} resorts')
+
+    # Nodes are tuples of (point, resort_key, axis, left, right)
+    def build(self, points, depth):
+        if not points:
+            return None
+
+        axis = depth % 3
+        points.sort(key=lambda point: point[0][axis])
+        middle = len(points) // 2
+        point, resort_key = points[middle]
+
+        return (point, resort_key, axis, self.build(points[:middle], depth + 1), self.build(points[middle + 1:], depth + 1))
+
+    # Returns a list of (resort_key, distance in km) of the k closest resorts, closest first
+    def nearest(self, lat, lon, k=NEARBY_COUNT):
+        self.rebuild_if_needed()
+        target = unit_vector(lat, lon)
+        # Max heap of (-squared distance, resort_key) holding the best k found so far
+        best = []
+
+        def search(node):
+            if node is None:
+                return
+
+            point, resort_key, axis, left, right = node
+            squared_distance = sum((point[i] - target[i]) ** 2 for i in range(3))
+
+            if len(best) < k:
+                heapq.heappush(best, (-squared_distance, resort_key))
+            elif squared_distance < -best[0][0]:
+                heapq.heapreplace(best, (-squared_distance, resort_key))
+
+            difference = target[axis] - point[axis]
+            near, far = (left, right) if difference < 0 else (right, left)
+            search(near)
+            if len(best) < k or difference ** 2 < -best[0][0]:
+                search(far)
+
+        if k > 0:
+            search(self.root)
+
+        return [(resort_key, chord_to_km(math.sqrt(-negative_distance))) for negative_distance, resort_key in sorted(best, reverse=True)]
+
+    # Returns a list of (resort_key, distance in km) of every resort within radius_km, closest first
+    def within(self, lat, lon, radius_km):
+        self.rebuild_if_needed()
+        target = unit_vector(lat, lon)
+        squared_radius = km_to_chord(radius_km) ** 2
+        found = []
+
+        def search(node):
+            if node is None:
+                return
+
+            point, resort_key, axis, left, right = node
+            squared_distance = sum((point[i] - target[i]) ** 2 for i in range(3))
+            if squared_distance <= squared_radius:
+                found.append((squared_distance, resort_key))
+
+            difference = target[axis] - point[axis]
+            near, far = (left, right) if difference < 0 else (right, left)
+            search(near)
+            if difference ** 2 <= squared_radius:
+                search(far)
+
+        search(self.root)
+
+        return [(resort_key, chord_to_km(math.sqrt(squared_distance))) for squared_distance, resort_key in sorted(found)]
+
+resort_index = ResortIndex(registry)
+
+# This method returns a list of (resort_key, distance in km) of the `count` resorts closest to a location
+def nearby_resorts(lat, lon, count=NEARBY_COUNT):
+    logger.debug(f'Function call: nearby_resorts({lat}, {lon}, {count})')
+    return resort_index.nearest(lat, lon, count)
+
+# This method returns a list of (resort_key, distance in km) of the resorts within radius_km of a location
+def resorts_within(lat, lon, radius_km):
+    logger.debug(f'Function call: resorts_within({lat}, {lon}, {radius_km})')
+    return resort_index.within(lat, lon, radius_km)
+
+# ------------------------------------------------------------forecast series------------------------------------------------------------
+
+# This method converts a list of ISO 8601 UTC times into an array of epoch seconds
+# numpy parses the whole list at once, dateutil is only used if Climacell sends a format numpy does not understand
+def epoch_times(UTC_times):
+    try:
+        times = np.array([UTC_time.rstrip('Z') for UTC_time in UTC_times], dtype='datetime64[ms]')
+        return times.astype('datetime64[s]').astype(np.int64)
+    except ValueError:
+        return np.array([int(dp.parse(UTC_time).timestamp()) for UTC_time in UTC_times], dtype=np.int64)
+
+# This method returns the code of a precipitation type, types that are not in PRECIPITATION_TYPES yet are added to it
+# A missing or null type is stored as "none"
+def precipitation_type_code(precipitation_type):
+    if precipitation_type is None:
+        precipitation_type = "none"
+    try:
+        return PRECIPITATION_TYPES.index(precipitation_type)
+    except ValueError:
+        PRECIPITATION_TYPES.append(precipitation_type)
+        return len(PRECIPITATION_TYPES) - 1
+
+# Columnar version of a nowcast or hourly response. The response is decoded once into an array of epoch times
+# and one numpy array per field, the Resort getters are views over these arrays
+# Missing or null values are stored as NaN
+class ForecastSeries():
+    def __init__(self, weather):
+        self.payload = weather
+        self.times = epoch_times([observation["observation_time"]["value"] for observation in weather])
+
+        self.fields = {}
+        for field in SERIES_FIELDS:
+            values = [(observation.get(field) or {}).get("value") for observation in weather]
+            self.fields[field] = np.array([np.nan if value is None else value for value in values], dtype=np.float64)
+
+        codes = [precipitation_type_code((observation.get("precipitation_type") or {}).get("value")) for observation in weather]
+        self.precipitation_type = np.array(codes, dtype=np.int8)
+
+        self._local_times = None
+        self._rollups = {}
+
+    def __len__(self):
+        return len(self.times)
+
+    # List of the observation times as datetime objects in the system timezone, created on first use and reused after that
+    @property
+    def local_times(self):
+        if self._local_times is None:
+            local_zone = get_localzone()
+            self._local_times = [datetime.fromtimestamp(epoch_time, local_zone) for epoch_time in self.times.tolist()]
+        return self._local_times
+
+    # Returns a dictionary of time:value pairs for one of SERIES_FIELDS
+    def as_dict(self, field):
+        return dict(zip(self.local_times, self.fields[field].tolist()))
+
+    # Returns a dictionary of time:precipitation type pairs
+    def precipitation_type_dict(self):
+        return dict(zip(self.local_times, [PRECIPITATION_TYPES[code] for code in self.precipitation_type.tolist()]))
+
+    # Returns the ForecastRollup of this series, the rollup is computed on first use and reused after that
+    def rollup(self, window=ROLLUP_WINDOW):
+        if window not in self._rollups:
+            self._rollups[window] = ForecastRollup(self, window)
+        return self._rollups[window]
+
+# Statistics of a ForecastSeries over consecutive windows of `window` seconds, the first window starts at the first observation
+# With the default 24 hour window, window 0 is the next 24 hours of the forecast, which is what the "tomorrow" commands report
+# All the windows are computed in one pass: searchsorted finds the window of every observation and bincount does the sums
+class ForecastRollup():
+    def __init__(self, series, window=ROLLUP_WINDOW):
+        self.window = window
+
+        if len(series) == 0:
+            self.starts = np.array([], dtype=np.int64)
+        else:
+            self.starts = np.arange(series.times[0], series.times[-1] + 1, window, dtype=np.int64)
+
+        number_windows = len(self.starts)
+        window_index = np.searchsorted(self.starts, series.times, side='right') - 1
+
+        self.hours = np.bincount(window_index, minlength=number_windows)
+
+        self.minimum = {}
+        self.maximum = {}
+        self.mean = {}
+        for field in ("temp", "feels_like"):
+            values = series.fields[field]
+            valid = ~np.isnan(values)
+            totals = np.bincount(window_index, weights=np.where(valid, values, 0), minlength=number_windows)
+            counts = np.bincount(window_index, weights=valid, minlength=number_windows)
+
+            # fmin and fmax ignore NaN, windows without any values stay NaN
+            self.minimum[field] = np.full(number_windows, np.nan)
+            self.maximum[field] = np.full(number_windows, np.nan)
+            np.fmin.at(self.minimum[field], window_index, values)
+            np.fmax.at(self.maximum[field], window_index, values)
+
+            with np.errstate(invalid='ignore', divide='ignore'):
+                self.mean[field] = totals / counts
+
+        self.precipitation_total = np.bincount(window_index, weights=np.nan_to_num(series.fields["precipitation"]), minlength=number_windows)
+
+        snow = series.precipitation_type == precipitation_type_code('snow')
+        self.snow_hours = np.bincount(window_index, weights=snow, minlength=number_windows).astype(np.int64)
+
+        # Distinct precipitation types of each window in the order they first appear, "none" is left out
+        number_types = len(PRECIPITATION_TYPES)
+        first_seen = np.full(number_windows * number_types, len(series))
+        np.minimum.at(first_seen, window_index * number_types + series.precipitation_type, np.arange(len(series)))
+        first_seen = first_seen.reshape(number_windows, number_types)
+
+        self.precipitation_types = []
+        for window_first_seen in first_seen:
+            codes = [code for code in np.argsort(window_first_seen, kind='stable').tolist() if window_first_seen[code] < len(series) and code != 0]
+            self.precipitation_types.append([PRECIPITATION_TYPES[code] for code in codes])
+
+    def __len__(self):
+        return len(self.starts)
+
+    # Returns a dictionary of the statistics of one window, a window that is not in the forecast returns NaN and empty values
+    def day(self, index):
+        if index >= len(self.starts):
+            return {
+                "start": None,
+                "temp_min": np.nan, "temp_max": np.nan, "temp_mean": np.nan,
+                "feels_like_min": np.nan, "feels_like_max": np.nan, "feels_like_mean": np.nan,
+                "precipitation": 0.0, "snow_hours": 0, "precipitation_types": [],
+            }
+
+        return {
+            "start": datetime.fromtimestamp(int(self.starts[index]), get_localzone()),
+            "temp_min": float(self.minimum["temp"][index]),
+            "temp_max": float(self.maximum["temp"][index]),
+            "temp_mean": float(self.mean["temp"][index]),
+            "feels_like_min": float(self.minimum["feels_like"][index]),
+            "feels_like_max": float(self.maximum["feels_like"][index]),
+            "feels_like_mean": float(self.mean["feels_like"][index]),
+            "precipitation": float(self.precipitation_total[index]),
+            "snow_hours": int(self.snow_hours[index]),
+            "precipitation_types": list(self.precipitation_types[index]),
+        }
+
+# This method decodes a response before it is cached, nowcast and hourly responses are turned into a ForecastSeries
+def decode_response(endpoint, weather):
+    if endpoint == ENDPOINT_REALTIME:
+        return weather
+    return ForecastSeries(weather)
+
+# ------------------------------------------------------------forecast cache------------------------------------------------------------
+
+# Process wide cache of decoded Climacell responses keyed by (resort_key, endpoint), or (tile, endpoint) when tiling is on
+# Each endpoint has its own time to live, the least recently used entries are evicted once the cache goes over max_bytes
+# The cached responses are shared between Resort objects so they must not be modified
+class ForecastCache():
+    def __init__(self, ttl=None, max_bytes=CACHE_MAX_BYTES):
+        self.ttl = dict(CACHE_TTL if ttl is None else ttl)
+        self.max_bytes = max_bytes
+        # key: (expiry time, size in bytes, decoded response)
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.lock = threading.Lock()
+
+    # Returns the cached response or None if there is no entry or it has expired
+    def get(self, resort_key, endpoint):
+        key = (resort_key, endpoint)
+
+        with self.lock:
+            entry = self.entries.get(key)
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expires, size, value = entry
+            if expires <= time.monotonic():
+                del self.entries[key]
+                self.size -= size
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    # Adds a response to the cache, size is the length of the response body and is used for the memory cap
+    def put(self, resort_key, endpoint, value, size):
+        key = (resort_key, endpoint)
+        ttl = self.ttl.get(endpoint, 0)
+
+        if ttl <= 0 or size > self.max_bytes:
+            return
+
+        with self.lock:
+            old_entry = self.entries.pop(key, None)
+            if old_entry is not None:
+                self.size -= old_entry[1]
+
+            self.entries[key] = (time.monotonic() + ttl, size, value)
+            self.size += size
+
+            while self.size > self.max_bytes:
+                _, (_, evicted_size, _) = self.entries.popitem(last=False)
+                self.size -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    # Returns a dictionary of the cache counters
+    def stats(self):
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "bytes": self.size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+forecast_cache = ForecastCache()
+
+# ------------------------------------------------------------request coalescing------------------------------------------------------------
+
+# Single flight layer for the async requests. Concurrent calls with the same key share one in flight task and all receive its result
+# The shared task is shielded so that a caller being cancelled does not cancel the request for the other callers
+class SingleFlight():
+    def __init__(self):
+        self.in_flight = {}
+        self.calls = 0
+        self.shared = 0
+
+    # Runs coroutine_function() for key unless a call for the same key is already in flight, in which case its result is awaited instead
+    async def run(self, key, coroutine_function):
+        self.calls += 1
+        task = self.in_flight.get(key)
+
+        if task is None:
+            task = asyncio.ensure_future(coroutine_function())
+            self.in_flight[key] = task
+            task.add_done_callback(lambda done_task: self.forget(key, done_task))
+        else:
+            self.shared += 1
+            logger.debug(f'SingleFlight.run() joining in flight request for {key}')
+
+        return await asyncio.shield(task)
+
+    def forget(self, key, task):
+        if self.in_flight.get(key) is task:
+            del self.in_flight[key]
+
+    # Returns a dictionary of the single flight counters
+    def stats(self):
+        return {
+            "in_flight": len(self.in_flight),
+            "calls": self.calls,
+            "shared": self.shared,
+        }
+
+forecast_flights = SingleFlight()
 
-    USA_RESORTS = [resort_key for resort_key in resort_json if resort_json[resort_key]['country'] == 'USA']
-    logger.debug(f'Creating list of keys of USA_RESORTS')
-    logger.debug(f'{USA_RESORTS} \n')
+# This method fetches the 96hr forecast of every resort in resort_keys concurrently, at most `concurrency` requests run at once
+# It is an async generator that yields (resort_object, success) tuples as soon as each request completes, so results are in completion order
+async def regional_snow_report(resort_keys, concurrency=REPORT_CONCURRENCY):
+    logger.debug(f'Function call: regional_snow_report() for {len(resort_keys)} resorts, concurrency: {concurrency}')
+    semaphore = asyncio.Semaphore(concurrency)
 
-    logger.debug(f'Creating list of keys of RESORT_NAMES')
-    RESORT_NAMES = [resort_json[resort_key]['name'] for resort_key in resort_json]
-    logger.debug(f'{RESORT_NAMES} \n')
+    async def fetch(resort_key):
+        async with semaphore:
+            resort_object = Resort(resort_key)
+            success = await resort_object.async_request_96hr()
+            return resort_object, success
 
-    logger.debug(f'Creating list of keys of RESORT_KEYS')
-    RESORT_KEYS = [resort_key for resort_key in resort_json]
-    logger.debug(f'{RESORT_KEYS} \n')
+    tasks = [asyncio.ensure_future(fetch(resort_key)) for resort_key in resort_keys]
 
+    try:
+        for next_completed in asyncio.as_completed(tasks):
+            yield await next_completed
+    finally:
+        # Cancels whatever is still running if the caller stops iterating early
+        for task in tasks:
+            task.cancel()
 
 # This method takes the string of a time in ISO 8601 format and converts it to local time using the system timezone
 def local_time(UTC_time):
@@ -110,48 +836,18 @@ def add_new_resort(resort_key, resort_name, country, lat, lon):
     logger.debug(f'Function call: add_new_resort()')
     logger.debug(f'Adding new resort: {resort_name}')
 
-    new_resort_dict = {
-        resort_key: {"name": resort_name, "country": country, "lat": lat, "lon": lon}
-    }
-
-    with open(SKI_RESORT_JSON, "r") as f:
-        resort_json = json.load(f)
-        if resort_key in resort_json:
-            logger.debug(f'{resort_key} already exists in the json file, failure to add new resort')
-            logger.debug(f'Please change the resort key name and try again \n')
-        else:
-            resort_json.update(new_resort_dict)
-
-            with open(SKI_RESORT_JSON, "w") as f:
-                json.dump(resort_json, f, indent=4)
-                logger.debug(f"Added {resort_name} successfully \n")
+    if registry.add(resort_key, resort_name, country, lat, lon):
+        logger.debug(f"Added {resort_name} successfully \n")
+    else:
+        logger.debug(f'{resort_key} already exists in the json file, failure to add new resort')
+        logger.debug(f'Please change the resort key name and try again \n')
 
-    return resort_json
+    return dict(registry.resorts)
 
 # This method lists the set of resort keys and the corresponding resort name that the user can access
 def get_resort_keys():
     logger.debug(f'Function call: get_resort_keys() \n')
-    current_dir = os.getcwd()
-    logger.debug(f'The current directory: {current_dir}')
-
-    if current_dir != D_NAME:
-        os.chdir(D_NAME)
-        logger.debug(f'Current directory was not as expected.')
-        logger.debug(f'The current directory was set to: {D_NAME}')
-    else:
-        pass
-
-    # Opens json file to get location parameters
-    with open(SKI_RESORT_JSON, "r") as f:
-        ski_resort_dict = json.load(f)
-
-    ski_resort_keys = ski_resort_dict.keys()
-    ski_resort_names = [ski_resort_dict[resort_key]['name'] for resort_key in ski_resort_keys]
-    resort_keys = {ski_resort_names[i]: ski_resort_keys[i] for i in range(len(ski_resort_names))}
-
-    return resort_keys
-
-    
+    return registry.name_key_pairs()
 
 # Get request modified to only pull the data requested by the user using args
 # Question: are kwargs or args better to use in this situation?
@@ -166,23 +862,11 @@ class Resort():
     # kwargs is created so the user can pass in "96hr", "realtime", and or "360min"
     def __init__(self, resort_key):
         logger.debug(f'Creating new instance of Resort Class. Resort key: {resort_key}')
-        # Check if you are in the current directory, if not, set it to the current directory
-        
-        current_dir = os.getcwd()
-        logger.debug(f'The current directory: {current_dir}')
-
-        if current_dir != D_NAME:
-            os.chdir(D_NAME)
-            logger.debug(f'Current directory was not as expected.')
-            logger.debug(f'The current directory was set to: {D_NAME}')
-        else:
-            pass
 
-        # Opens json file to get location parameters
-        with open(SKI_RESORT_JSON, "r") as f:
-            resort_dict_list = json.load(f)
-            resort_dict = resort_dict_list[resort_key]
+        # Location parameters come from the in memory resort registry
+        resort_dict = registry.get(resort_key)
 
+        self.key = resort_key
         self.name = resort_dict["name"]
         self.lon = resort_dict["lon"]
         self.lat = resort_dict["lat"]
@@ -191,35 +875,124 @@ class Resort():
         self.weather_now = {}
         self.weather_6hr = {}
         self.weather_96hr = {}
+        self.series_6hr = ForecastSeries([])
+        self.series_96hr = ForecastSeries([])
 
         logger.debug(f'New "Resort" object successfully initialized... \n')
 
-    # Makes a request to the API to retrieve a dictionary containing the current weather
-    def request_now(self):
-        logger.debug(f'Function call: request_now()')
-        querystring = {
-            "lat": str(self.lat),
-            "lon": str(self.lon),
+    # Returns the key used for the forecast cache and request coalescing, and the location sent to Climacell
+    # With tiling on, every resort in the same tile has the same key and is fetched from the center of the tile
+    def fetch_location(self):
+        tile_precision = settings()["tile_precision"]
+        if tile_precision is None:
+            return self.key, self.lat, self.lon
+
+        tile = geohash(self.lat, self.lon, tile_precision)
+        lat, lon = geohash_center(tile)
+        return f'tile:{tile}', lat, lon
+
+    # Query strings for each of the Climacell endpoints
+    def querystring_now(self):
+        _, lat, lon = self.fetch_location()
+        return {
+            "lat": str(lat),
+            "lon": str(lon),
             "unit_system": "si",
             "fields": "precipitation,precipitation_type,temp,feels_like,wind_speed,wind_direction,sunrise,sunset,visibility,cloud_cover,cloud_base,weather_code",
-            "apikey": CLIMACELL_TOKEN,
+            "apikey": settings()["climacell_token"],
         }
 
-        response = requests.request("GET", URL_REALTIME, params=querystring)
+    def querystring_6hr(self):
+        _, lat, lon = self.fetch_location()
+        return {
+            "lat": str(lat),
+            "lon": str(lon),
+            "unit_system": "si",
+            "timestep": "5",
+            "start_time": "now",
+            "fields": "temp,feels_like,humidity,wind_speed,wind_direction,precipitation,precipitation_type,sunrise,sunset,visibility,cloud_cover,cloud_base,weather_code",
+            "apikey": settings()["climacell_token"],
+        }
 
-        if response.ok:
-            logger.debug(f'request_now() to Climacell API successful \n')
-            self.weather_now = json.loads(response.text)
+    def querystring_96hr(self):
+        _, lat, lon = self.fetch_location()
+        return {
+            "lat": str(lat),
+            "lon": str(lon),
+            "unit_system": "si",
+            "start_time": "now",
+            "fields": "precipitation,temp,feels_like,humidity,wind_speed,wind_direction,precipitation_type,precipitation_probability,sunrise,sunset,cloud_cover,cloud_base,weather_code",
+            "apikey": settings()["climacell_token"],
+        }
+
+    # Stores the realtime response and pulls out the values used by the bot
+    def load_now(self, weather_now):
+        self.weather_now = weather_now
+
+        self.now_time = local_time(self.weather_now["observation_time"]["value"])
+        self.now_temperature = self.weather_now["temp"]["value"]
+        self.now_feelslike = self.weather_now["feels_like"]["value"]
+        self.now_precipitation = self.weather_now["precipitation"]["value"]
+        self.now_precipitation_type = self.weather_now["precipitation_type"]["value"]
+        self.now_windspeed = self.weather_now["wind_speed"]["value"]
+        self.now_winddirection = self.weather_now["wind_direction"]["value"]
+        self.now_cloudcover = self.weather_now["cloud_cover"]["value"]
+
+    # Returns the query string for one of the Climacell endpoints
+    def querystring(self, endpoint):
+        if endpoint == ENDPOINT_REALTIME:
+            return self.querystring_now()
+        elif endpoint == ENDPOINT_NOWCAST:
+            return self.querystring_6hr()
+        else:
+            return self.querystring_96hr()
+
+    # Returns the decoded response of one of the Climacell endpoints, or None if the call wasn't successful
+    # Realtime responses are returned as a dictionary, nowcast and hourly responses as a ForecastSeries
+    # The forecast cache is checked first and successful responses are added to it
+    def fetch(self, endpoint):
+        fetch_key, _, _ = self.fetch_location()
+        weather = forecast_cache.get(fetch_key, endpoint)
+        if weather is not None:
+            logger.debug(f'fetch() {endpoint} for {self.key} served from cache ({fetch_key})')
+            return weather
+
+        response = requests.request("GET", ENDPOINT_URLS[endpoint], params=self.querystring(endpoint))
+        if not response.ok:
+            return None
+
+        weather = decode_response(endpoint, json.loads(response.text))
+        forecast_cache.put(fetch_key, endpoint, weather, len(response.text))
+        return weather
+
+    # Async version of fetch() that uses the shared aiohttp session
+    # Concurrent calls for the same resort (or tile) and endpoint share a single request to Climacell
+    async def async_fetch(self, endpoint):
+        fetch_key, _, _ = self.fetch_location()
+        weather = forecast_cache.get(fetch_key, endpoint)
+        if weather is not None:
+            logger.debug(f'async_fetch() {endpoint} for {self.key} served from cache ({fetch_key})')
+            return weather
+
+        return await forecast_flights.run((fetch_key, endpoint), lambda: self.async_fetch_uncached(endpoint, fetch_key))
+
+    async def async_fetch_uncached(self, endpoint, fetch_key):
+        text = await async_get_text(ENDPOINT_URLS[endpoint], self.querystring(endpoint))
+        if text is None:
+            return None
+
+        weather = decode_response(endpoint, json.loads(text))
+        forecast_cache.put(fetch_key, endpoint, weather, len(text))
+        return weather
 
-            self.now_time = local_time(self.weather_now["observation_time"]["value"])
-            self.now_temperature = self.weather_now["temp"]["value"]
-            self.now_feelslike = self.weather_now["feels_like"]["value"]
-            self.now_precipitation = self.weather_now["precipitation"]["value"]
-            self.now_precipitation_type = self.weather_now["precipitation_type"]["value"]
-            self.now_windspeed = self.weather_now["wind_speed"]["value"]
-            self.now_winddirection = self.weather_now["wind_direction"]["value"]
-            self.now_cloudcover = self.weather_now["cloud_cover"]["value"]
+    # Makes a request to the API to retrieve a dictionary containing the current weather
+    def request_now(self):
+        logger.debug(f'Function call: request_now()')
+        weather_now = self.fetch(ENDPOINT_REALTIME)
 
+        if weather_now is not None:
+            logger.debug(f'request_now() to Climacell API successful \n')
+            self.load_now(weather_now)
             return True  
 
         else:
@@ -229,21 +1002,12 @@ class Resort():
     # Makes a request to the API to retrieve a dictionary containing 6hr weather, returns True if successful, returns False if call wasn't successful
     def request_6hr(self):
         logger.debug(f'Function call: request_6hr')
-        querystring = {
-            "lat": str(self.lat),
-            "lon": str(self.lon),
-            "unit_system": "si",
-            "timestep": "5",
-            "start_time": "now",
-            "fields": "temp,feels_like,humidity,wind_speed,wind_direction,precipitation,precipitation_type,sunrise,sunset,visibility,cloud_cover,cloud_base,weather_code",
-            "apikey": CLIMACELL_TOKEN,
-        }
-
-        response = requests.request("GET", URL_NOWCAST, params=querystring)
+        weather_6hr = self.fetch(ENDPOINT_NOWCAST)
 
-        if response.ok:
+        if weather_6hr is not None:
             logger.debug(f'request_6hr()  to Climacell API successful \n')            
-            self.weather_6hr = json.loads(response.text)
+            self.series_6hr = weather_6hr
+            self.weather_6hr = weather_6hr.payload
             return True
 
         else:
@@ -251,25 +1015,60 @@ class Resort():
             return False
 
     # Makes a request to the API to retrieve a dictonary containing 96hr weather, returns True if successful, returns False if call wasn't successful
+    # ClimaCell: The hourly call provides a global hourly forecast, up to 96 hours (4 days) out, for a specific location.
     def request_96hr(self):
         logger.debug(f'Function call: request_96hr()')
-        querystring = {
-            "lat": str(self.lat),
-            "lon": str(self.lon),
-            "unit_system": "si",
-            "start_time": "now",
-            "fields": "precipitation,temp,feels_like,humidity,wind_speed,wind_direction,precipitation_type,precipitation_probability,sunrise,sunset,cloud_cover,cloud_base,weather_code",
-            "apikey": CLIMACELL_TOKEN,
-        }
-        response = requests.request("GET", URL_HOURLY, params=querystring)  # ClimaCell: The hourly call provides a global hourly forecast, up to 96 hours (4 days) out, for a specific location.
-        if response.ok:
+        weather_96hr = self.fetch(ENDPOINT_HOURLY)
+
+        if weather_96hr is not None:
             logger.debug(f'request_96hr() to Climacell API successful \n')  
-            self.weather_96hr = json.loads(response.text)
+            self.series_96hr = weather_96hr
+            self.weather_96hr = weather_96hr.payload
             return True
         else:
             logger.debug(f'request_96hr() to Climacell API failed \n')  
             return False
 
+    # Async versions of the requests above, these use the shared aiohttp session so they do not block the event loop of the discord bot
+    # They return True if successful and False if the call wasn't successful or timed out
+    async def async_request_now(self):
+        logger.debug(f'Function call: async_request_now()')
+        weather_now = await self.async_fetch(ENDPOINT_REALTIME)
+
+        if weather_now is not None:
+            logger.debug(f'async_request_now() to Climacell API successful \n')
+            self.load_now(weather_now)
+            return True
+        else:
+            logger.debug(f'async_request_now() to Climacell API failed \n')
+            return False
+
+    async def async_request_6hr(self):
+        logger.debug(f'Function call: async_request_6hr()')
+        weather_6hr = await self.async_fetch(ENDPOINT_NOWCAST)
+
+        if weather_6hr is not None:
+            logger.debug(f'async_request_6hr() to Climacell API successful \n')
+            self.series_6hr = weather_6hr
+            self.weather_6hr = weather_6hr.payload
+            return True
+        else:
+            logger.debug(f'async_request_6hr() to Climacell API failed \n')
+            return False
+
+    async def async_request_96hr(self):
+        logger.debug(f'Function call: async_request_96hr()')
+        weather_96hr = await self.async_fetch(ENDPOINT_HOURLY)
+
+        if weather_96hr is not None:
+            logger.debug(f'async_request_96hr() to Climacell API successful \n')
+            self.series_96hr = weather_96hr
+            self.weather_96hr = weather_96hr.payload
+            return True
+        else:
+            logger.debug(f'async_request_96hr() to Climacell API failed \n')
+            return False
+
     # Class method to process requests
     def process_requests(self):
         logger.debug(f'Function call: process_requests()')
@@ -281,23 +1080,25 @@ class Resort():
         self.request_96hr() 
         logger.debug(f'Completed function call... process_requests()')
 
+    # Async version of process_requests(), the three requests are made concurrently
+    async def async_process_requests(self):
+        logger.debug(f'Function call: async_process_requests()')
+        await asyncio.gather(self.async_request_now(), self.async_request_6hr(), self.async_request_96hr())
+        logger.debug(f'Completed function call... async_process_requests()')
+
 # Temperature
 
     # Class method get_temperature_96hr() returns a dictionary of the temperature against time
     def get_temperature_96hr(self):
         logger.debug(f'Function call: get_temperature_96hr()')
-        time_96hr = [local_time(self.weather_96hr[i]["observation_time"]["value"]) for i in range(0, len(self.weather_96hr))]
-        temp_96hr = [self.weather_96hr[i]["temp"]["value"] for i in range(0, len(self.weather_96hr))]
-        self.temperature_forecast_96hr = {time_96hr[i]: temp_96hr[i] for i in range(len(time_96hr))}
+        self.temperature_forecast_96hr = self.series_96hr.as_dict("temp")
         logger.debug(f'Returning dictionary containing time:value pair, "self.temperature_forecast_96hr \n')
         return self.temperature_forecast_96hr
 
     # Class method get_temperature_6hr() returns a dictionary of the temperature against time
     def get_temperature_6hr(self):
         logger.debug(f'Function call: get_temperature_6hr()')
-        time_6hr = [local_time(self.weather_6hr[i]["observation_time"]["value"]) for i in range(0, len(self.weather_6hr))]
-        temp_6hr = [self.weather_6hr[i]["temp"]["value"] for i in range(0, len(self.weather_6hr))]
-        self.temperature_forecast_6hr = {time_6hr[i]: temp_6hr[i] for i in range(len(time_6hr))}
+        self.temperature_forecast_6hr = self.series_6hr.as_dict("temp")
         logger.debug(f'Returning dictionary containing time:value pair, "self.temperature_forecast_6hr \n')
         return self.temperature_forecast_6hr
  
@@ -313,18 +1114,14 @@ class Resort():
     # Class method get_precipitation_96hr() returns a dictionary of the precipitation against time
     def get_precipitation_96hr(self):
         logger.debug(f'Function call: get_precipitation_96hr()')
-        time_96hr = [local_time(self.weather_96hr[i]["observation_time"]["value"]) for i in range(0, len(self.weather_96hr))]
-        precipitation_96hr = [self.weather_96hr[i]["precipitation"]["value"] for i in range(0, len(self.weather_96hr))]
-        self.precipitation_forecast_96hr = {time_96hr[i]: precipitation_96hr[i] for i in range(len(time_96hr))}
+        self.precipitation_forecast_96hr = self.series_96hr.as_dict("precipitation")
         logger.debug(f'Returning dictionary containing time:value pair, "self.precipitation_forecast_96hr \n')
         return self.precipitation_forecast_96hr
 
     # Class method get_precipitation_6hr() returns a dictionary of the temperature against time
     def get_precipitation_6hr(self):
         logger.debug(f'Function call: get_precipitation_6hr()')
-        time_6hr = [local_time(self.weather_6hr[i]["observation_time"]["value"]) for i in range(0, len(self.weather_6hr))]
-        precipitation_6hr = [self.weather_6hr[i]["precipitation"]["value"] for i in range(0, len(self.weather_6hr))]
-        self.precipitation_forecast_6hr = {time_6hr[i]: precipitation_6hr[i] for i in range(len(time_6hr))}
+        self.precipitation_forecast_6hr = self.series_6hr.as_dict("precipitation")
         logger.debug(f'Returning dictionary containing time:value pair, "self.precipitation_forecast_6hr \n')
         return self.precipitation_forecast_6hr
 
@@ -340,18 +1137,14 @@ class Resort():
     # Class method get_precipitation_type_96hr() returns a dictionary of the precipitation against time
     def get_precipitation_type_96hr(self):
         logger.debug(f'Function call: get_precipitation_type_96hr()')
-        time_96hr = [local_time(self.weather_96hr[i]["observation_time"]["value"]) for i in range(0, len(self.weather_96hr))]
-        precipitation_type_96hr = [self.weather_96hr[i]["precipitation_type"]["value"] for i in range(0, len(self.weather_96hr))]
-        self.precipitation_type_forecast_96hr = {time_96hr[i]: precipitation_type_96hr[i] for i in range(len(time_96hr))}
+        self.precipitation_type_forecast_96hr = self.series_96hr.precipitation_type_dict()
         logger.debug(f'Returning dictionary containing time:value pair, "self.precipitation_type_forecast_96hr \n')
         return self.precipitation_type_forecast_96hr
 
     # Class method get_precipitation_type_6hr() returns a dictionary of the temperature against time
     def get_precipitation_type_6hr(self):
         logger.debug(f'Function call: get_precipitation_type_6hr()')
-        time_6hr = [local_time(self.weather_6hr[i]["observation_time"]["value"]) for i in range(0, len(self.weather_6hr))]
-        precipitation_type_6hr = [self.weather_6hr[i]["precipitation_type"]["value"] for i in range(0, len(self.weather_6hr))]
-        self.precipitation_type_forecast_6hr = {time_6hr[i]: precipitation_type_6hr[i] for i in range(len(time_6hr))}
+        self.precipitation_type_forecast_6hr = self.series_6hr.precipitation_type_dict()
         logger.debug(f'Returning dictionary containing time:value pair, "self.precipitation_type_forecast_6hr \n')
         return self.precipitation_type_forecast_6hr
 
@@ -367,18 +1160,14 @@ class Resort():
     # Class method get_feels_like_96hr() returns a dictionary of the precipitation against time
     def get_feels_like_96hr(self):
         logger.debug(f'Function call: get_feels_like_96hr()')
-        time_96hr = [local_time(self.weather_96hr[i]["observation_time"]["value"]) for i in range(0, len(self.weather_96hr))]
-        feels_like_96hr = [self.weather_96hr[i]["feels_like"]["value"] for i in range(0, len(self.weather_96hr))]
-        self.feels_like_forecast_96hr = {time_96hr[i]: feels_like_96hr[i] for i in range(len(time_96hr))}
+        self.feels_like_forecast_96hr = self.series_96hr.as_dict("feels_like")
         logger.debug(f'Returning dictionary containing time:value pair, "self.feels_like_forecast_96hr \n')
         return self.feels_like_forecast_96hr
 
     # Class method get_precipitation_6hr() returns a dictionary of the temperature against time
     def get_feels_like_6hr(self):
         logger.debug(f'Function call: get_feels_like_6hr()')
-        time_6hr = [local_time(self.weather_6hr[i]["observation_time"]["value"]) for i in range(0, len(self.weather_6hr))]
-        feels_like_6hr = [self.weather_6hr[i]["feels_like"]["value"] for i in range(0, len(self.weather_6hr))]
-        self.feels_like_forecast_6hr = {time_6hr[i]: feels_like_6hr[i] for i in range(len(time_6hr))}
+        self.feels_like_forecast_6hr = self.series_6hr.as_dict("feels_like")
         logger.debug(f'Returning dictionary containing time:value pair, "self.feels_like_forecast_6hr \n')
         return self.feels_like_forecast_6hr
 
@@ -395,18 +1184,14 @@ class Resort():
     # Class method get_wind_speed_96hr() returns a dictionary of the precipitation against time
     def get_wind_speed_96hr(self):
         logger.debug(f'Function call: get_wind_speed_96hr()')
-        time_96hr = [local_time(self.weather_96hr[i]["observation_time"]["value"]) for i in range(0, len(self.weather_96hr))]
-        wind_speed_96hr = [self.weather_96hr[i]["wind_speed"]["value"] for i in range(0, len(self.weather_96hr))]
-        self.wind_speed_forecast_96hr = {time_96hr[i]: wind_speed_96hr[i] for i in range(len(time_96hr))}
+        self.wind_speed_forecast_96hr = self.series_96hr.as_dict("wind_speed")
         logger.debug(f'Returning dictionary containing time:value pair, "self.wind_speed_forecast_96hr \n')
         return self.wind_speed_forecast_96hr
 
     # Class method get_wind_speed_6hr() returns a dictionary of the temperature against time
     def get_wind_speed_6hr(self):
         logger.debug(f'Function call: get_wind_speed_6hr()')
-        time_6hr = [local_time(self.weather_6hr[i]["observation_time"]["value"]) for i in range(0, len(self.weather_6hr))]
-        wind_speed_6hr = [self.weather_6hr[i]["wind_speed"]["value"] for i in range(0, len(self.weather_6hr))]
-        self.wind_speed_forecast_6hr = {time_6hr[i]: wind_speed_6hr[i] for i in range(len(time_6hr))}
+        self.wind_speed_forecast_6hr = self.series_6hr.as_dict("wind_speed")
         logger.debug(f'Returning dictionary containing time:value pair, "self.wind_speed_forecast_6hr \n')
         return self.wind_speed_forecast_6hr
 
@@ -417,83 +1202,41 @@ class Resort():
         logger.debug(f'Returning dictionary containing time:value pair, "self.wind_speed_forecast_now \n')
         return self.wind_speed_forecast_now
 
-# Tomorrow statistics   
+# Snow summary
 
-    # Class method get_tomorrow_temp() returns the float value of the temperature tomorrow
-    # This method calls the get_temperature_96hr() function in order to get the dictionary containing time vs temperature
-    def get_tomorrow_temp(self):
-        logger.debug(f'Function call: get_tomorrow_temp()')
-
-        delta = timedelta(1)
-        tomorrow = datetime.now(timezone.utc) + delta
+    # Class method get_snow_summary_96hr() returns a tuple of whether snow is expected in the 96hr forecast and the total precipitation in mm
+    def get_snow_summary_96hr(self):
+        logger.debug(f'Function call: get_snow_summary_96hr()')
+        has_snow = bool((self.series_96hr.precipitation_type == precipitation_type_code('snow')).any())
+        # Each hourly value is truncated to a whole mm before it is added to the total
+        total_precipitation = int(np.trunc(np.nan_to_num(self.series_96hr.fields["precipitation"])).sum())
 
-        temp_dict = self.get_temperature_96hr()
-        tomorrow_temp_list = []
+        return has_snow, total_precipitation
 
-        for key, value in temp_dict.items():
-            if key < tomorrow:
-                tomorrow_temp_list.append(value)
+# Tomorrow statistics   
 
-        tomorrow_temp = statistics.mean(tomorrow_temp_list)
+    # Class method get_tomorrow_rollup() returns a dictionary of the statistics for the next 24 hours of the 96hr forecast
+    # The rollup is computed once per forecast and shared through the forecast cache, so the tomorrow methods below are cheap lookups
+    def get_tomorrow_rollup(self):
+        logger.debug(f'Function call: get_tomorrow_rollup()')
+        return self.series_96hr.rollup().day(0)
 
-        return tomorrow_temp
-    
+    # Class method get_tomorrow_temp() returns the float value of the mean temperature tomorrow
+    def get_tomorrow_temp(self):
+        logger.debug(f'Function call: get_tomorrow_temp()')
+        return self.get_tomorrow_rollup()["temp_mean"]
 
-    # Class method get_tomorrow_feelslike() returns the float value of the feels like temperature tomorrow
-    # This method calls the get_feels_like_96hr() function in order to get the dictionary containing the time vs feels like temperature
+    # Class method get_tomorrow_feelslike() returns the float value of the mean feels like temperature tomorrow
     def get_tomorrow_feelslike(self):
         logger.debug(f'Function call: get_tomorrow_feelslike()')
-
-        delta = timedelta(1)
-        tomorrow = datetime.now(timezone.utc) + delta
-
-        feelslike_dict = self.get_feels_like_96hr()
-        tomorrow_feelslike_list = []
-
-        for key, value in feelslike_dict.items():
-            if key < tomorrow:
-                tomorrow_feelslike_list.append(value)
-
-        tomorrow_feelslike = statistics.mean(tomorrow_feelslike_list)
-
-        return tomorrow_feelslike
+        return self.get_tomorrow_rollup()["feels_like_mean"]
 
     # Class method get_tomorrow_precipitation() returns the amount of precipitation tomorrow
-    # This method calls the get_precipitation_96hr() function in order to get the dictionary containing the time vs feels like temperature
     def get_tomorrow_precipitation(self):
         logger.debug(f'Function call: get_tomorrow_precipitation()')
+        return self.get_tomorrow_rollup()["precipitation"]
 
-        delta = timedelta(1)
-        tomorrow = datetime.now(timezone.utc) + delta
-
-        precipitation_dict = self.get_precipitation_96hr()
-        tomorrow_precipitation_list = []
-
-        for key, value in precipitation_dict.items():
-            if key < tomorrow:
-                tomorrow_precipitation_list.append(value)
-        
-        tomorrow_precipitation = sum(tomorrow_precipitation_list)
-
-        return tomorrow_precipitation   
-
-    # Class method get_tomorrow_precipitation_type() returns the type of precipitation expected tomorrow
-    # This method calls the get_precipitation_type_96hr() function in order to get the dictionary containing the time vs feels like temperature
+    # Class method get_tomorrow_precipitation_type() returns the list of precipitation types expected tomorrow, "none" is not included
     def get_tomorrow_precipitation_type(self):
         logger.debug(f'Function call: get_tomorrow_precipitation_type()')
-
-        delta = timedelta(1)
-        tomorrow = datetime.now(timezone.utc) + delta
-
-        precipitation_type_dict = self.get_precipitation_type_96hr()
-        tomorrow_precipitation_type_list = []
-        tomorrow_precipitation_type = []
-
-        for key, value in precipitation_type_dict.items():
-            if key < tomorrow:
-                tomorrow_precipitation_type_list.append(value)
-
-        [tomorrow_precipitation_type.append(value) for value in tomorrow_precipitation_type_list if value not in tomorrow_precipitation_type]
-        tomorrow_precipitation_type.remove('none')
-
-        return tomorrow_precipitation_type          
\ No newline at end of file
+        return self.get_tomorrow_rollup()["precipitation_types"]
@@ -0,0 +1,85 @@
+import io
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'parser'))
+
+import log_parser
+
+
+def message_line(second, author):
+    return f'2021-02-19 17:00:{second:02d},000:DEBUG:__main__: async def on_message: Detected message sent by {author}: Message Content: "!checksnow sunshine"\n'.encode('utf-8')
+
+
+# Local stand-in for the S3 client, only get_object is used by the archive
+class FakeS3Client():
+    def __init__(self, objects):
+        self.objects = objects
+        self.requested = []
+
+    def get_object(self, Bucket, Key):
+        self.requested.append((Bucket, Key))
+        return {'Body': io.BytesIO(self.objects[Key])}
+
+
+class AnalyzeArchiveTest(unittest.TestCase):
+    def setUp(self):
+        first = message_line(0, 'alice#1234') + message_line(1, 'bob99#0001')
+        second = first + message_line(2, 'alice#1234')
+        third = second + message_line(3, 'carol#4242')
+        # The bot restarted, discord.log was truncated
+        restart = message_line(4, 'dave#7777')
+
+        self.client = FakeS3Client({
+            'log_1.log': first,
+            'log_2.log': second,
+            'log_3.log': third,
+            'log_4.log': restart,
+        })
+
+        self.directory = tempfile.TemporaryDirectory()
+        self.manifest = os.path.join(self.directory.name, 's3_logs.csv')
+        with open(self.manifest, 'w', encoding='utf-8') as f:
+            f.write('19/02/2021 17:05:00,log_1.log\n')
+            f.write('19/02/2021 17:10:00,log_2.log\n')
+            f.write('19/02/2021 17:15:00,log_3.log\n')
+            f.write('19/02/2021 18:00:00,log_4.log\n')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def analyze(self, start=None, end=None):
+        return log_parser.analyze_archive(self.manifest, start, end, 'test-bucket', client=self.client, workers=2)
+
+    def test_overlapping_snapshots_are_read_once(self):
+        analysis = self.analyze(end='2021-02-19 17:30')
+
+        self.assertEqual(analysis.lines, 4)
+        self.assertEqual(analysis.messages, 4)
+        self.assertEqual(analysis.author_count('alice#1234'), 2)
+        self.assertEqual(self.client.requested, [('test-bucket', 'log_1.log'), ('test-bucket', 'log_2.log'), ('test-bucket', 'log_3.log')])
+
+    def test_restart_is_read_whole(self):
+        analysis = self.analyze()
+
+        self.assertEqual(analysis.messages, 5)
+        self.assertEqual(analysis.author_count('dave#7777'), 1)
+        self.assertEqual(sorted(analysis.author_index), ['alice#1234', 'bob99#0001', 'carol#4242', 'dave#7777'])
+
+    def test_date_range_selects_snapshots(self):
+        manifest = log_parser.read_manifest(self.manifest, '2021-02-19 17:10', '2021-02-19 18:00')
+        self.assertEqual([object_name for uploaded, object_name, session in manifest], ['log_2.log', 'log_3.log'])
+
+        analysis = self.analyze('2021-02-19 17:10', '2021-02-19 18:00')
+        self.assertEqual(analysis.messages, 4)
+        self.assertEqual(analysis.author_count('dave#7777'), 0)
+
+        analysis = self.analyze('2021-02-19 17:30')
+        self.assertEqual(analysis.messages, 1)
+        self.assertEqual(list(analysis.author_index), ['dave#7777'])
+
+
+if __name__ == '__main__':
+    unittest.main()
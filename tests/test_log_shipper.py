@@ -0,0 +1,118 @@
+import gzip
+import logging
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bot import roasted_bot
+
+
+# Local stand-in for the S3 client, only put_object is used by the shipper
+class FakeS3Client():
+    def __init__(self):
+        self.objects = {}
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self.objects[Key] = gzip.decompress(Body)
+
+
+def log_line(logger_name, message):
+    record = logging.LogRecord(logger_name, logging.DEBUG, __file__, 0, message, None, None, func='test')
+    return (roasted_bot.log_writer.format(record) + '\n').encode('utf-8')
+
+
+def bot_line(message):
+    return log_line(roasted_bot.logger.name, message)
+
+
+def housekeeping_line(message):
+    return log_line(roasted_bot.housekeeping_logger.name, message)
+
+
+class LogShipperTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'discord.log')
+        self.manifest = os.path.join(self.directory.name, 's3_logs.csv')
+        self.client = FakeS3Client()
+        self.shipper = roasted_bot.LogShipper(self.path, 'test-bucket', self.manifest, client=self.client)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def append(self, data, mode='ab'):
+        with open(self.path, mode) as f:
+            f.write(data)
+
+    def test_only_new_lines_are_shipped(self):
+        first_line = bot_line('async def on_message: first')
+        second_line = bot_line('async def on_message: second')
+        self.append(first_line)
+        first = self.shipper.ship()
+        self.append(second_line)
+        second = self.shipper.ship()
+
+        self.assertEqual(self.client.objects[first], first_line)
+        self.assertEqual(self.client.objects[second], second_line)
+        self.assertTrue(second.endswith('/000001.gz'))
+
+    def test_unchanged_log_is_not_shipped(self):
+        self.append(bot_line('async def on_message: first'))
+        self.assertIsNotNone(self.shipper.ship())
+        self.assertIsNone(self.shipper.ship())
+
+        # Lines of the shipper and the scheduler metrics alone do not make a segment
+        self.append(housekeeping_line('LogShipper.ship: sent'))
+        self.append(housekeeping_line('OutboundScheduler: Queued 0 interactive, 0 bulk'))
+        self.assertIsNone(self.shipper.ship())
+        self.assertEqual(len(self.client.objects), 1)
+
+        # They are shipped with the next line of the bot
+        self.append(bot_line('async def on_message: second'))
+        segment_name = self.shipper.ship()
+        self.assertEqual(self.client.objects[segment_name].count(b'\n'), 3)
+
+        with open(self.manifest, encoding='utf-8') as f:
+            self.assertEqual(len(f.readlines()), 2)
+
+    def test_partial_line_waits_for_the_next_segment(self):
+        line = bot_line('async def on_message: complete')
+        self.append(line + line[:10])
+        first = self.shipper.ship()
+        self.append(line[10:])
+        second = self.shipper.ship()
+
+        self.assertEqual(self.client.objects[first], line)
+        self.assertEqual(self.client.objects[second], line)
+
+    def test_truncated_log_starts_a_new_session(self):
+        line = bot_line('async def on_message: after restart')
+        self.append(bot_line('async def on_message: before restart') * 3)
+        first = self.shipper.ship()
+        self.append(line, mode='wb')
+        second = self.shipper.ship()
+
+        # Both sessions start in the same second, the first segment must not be replaced
+        self.assertNotEqual(first.split('/')[0], second.split('/')[0])
+        self.assertTrue(second.endswith('/000000.gz'))
+        self.assertEqual(self.client.objects[second], line)
+        self.assertEqual(len(self.client.objects), 2)
+
+    def test_rotated_log_starts_a_new_session(self):
+        line = bot_line('async def on_message: after rotation')
+        self.append(bot_line('async def on_message: before rotation'))
+        self.shipper.ship()
+        os.replace(self.path, self.path + '.1')
+        self.append(line)
+        segment_name = self.shipper.ship()
+
+        self.assertTrue(segment_name.endswith('/000000.gz'))
+        self.assertEqual(self.client.objects[segment_name], line)
+        self.assertEqual(len(self.client.objects), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
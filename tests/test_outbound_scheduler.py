@@ -0,0 +1,64 @@
+import asyncio
+import os
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bot import roasted_bot
+
+
+class FakeChannel():
+    def __init__(self, channel_id):
+        self.id = channel_id
+        self.sent = []
+
+    async def send(self, content):
+        self.sent.append((time.monotonic(), content))
+        return content
+
+
+class OutboundSchedulerTest(unittest.TestCase):
+    def run_async(self, coroutine):
+        return asyncio.get_event_loop().run_until_complete(coroutine)
+
+    # MessageBatcher waits for every message, so the channel queue is empty between two sends
+    def test_bulk_sends_are_paced_per_channel(self):
+        scheduler = roasted_bot.OutboundScheduler()
+        channel = FakeChannel(1)
+
+        async def send_report():
+            for number in range(7):
+                await scheduler.send(channel, f'{number:04d}' + 'x' * 1500, roasted_bot.PRIORITY_BULK, wait=True)
+
+        self.run_async(send_report())
+
+        times = [sent_time for sent_time, content in channel.sent]
+        self.assertEqual(len(times), 7)
+        # No more than CHANNEL_LIMIT messages in any CHANNEL_PERIOD seconds
+        for first, last in zip(times, times[roasted_bot.CHANNEL_LIMIT:]):
+            self.assertGreaterEqual(last - first, roasted_bot.CHANNEL_PERIOD - 0.05)
+        self.assertLess(times[4] - times[0], 1.0)
+
+    def test_refusal_is_not_coalesced(self):
+        scheduler = roasted_bot.OutboundScheduler()
+        channel = FakeChannel(2)
+
+        async def send_replies():
+            await scheduler.send(channel, 'Checking forecast... please check your DM')
+            await scheduler.send(channel, roasted_bot.NOT_MEMBER_MESSAGE, coalesce=False)
+            await scheduler.send(channel, 'Please check your DM')
+            await scheduler.send(channel, 'Sending list of searchable resorts to your DM...', wait=True)
+
+        self.run_async(send_replies())
+
+        self.assertEqual([content for sent_time, content in channel.sent], [
+            'Checking forecast... please check your DM',
+            roasted_bot.NOT_MEMBER_MESSAGE,
+            'Please check your DM\nSending list of searchable resorts to your DM...',
+        ])
+
+
+if __name__ == '__main__':
+    unittest.main()